@@ -1,34 +1,155 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Body
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Body, Form, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from utils.security import EncryptionHandler, log_audit_event, verify_password, create_access_token, get_password_hash
-from utils.db import SessionLocal, User, PatientStudy
-from solver import run_diagnostic_pipeline
-from jose import JWTError, jwt
-import threading, time, os
-
-SECRET_KEY = os.environ.get("HIPAA_SECRET_KEY", "7b6f634f6d3957545366436e59325453")
-ALGORITHM = "HS256"
+from utils.security import (
+    EncryptionHandler, log_audit_event, create_access_token, get_password_hash,
+    decode_access_token, verify_password_or_dummy_async, token_cache,
+)
+from utils.audit import get_audit_sink
+from utils.redaction import redact_phi
+from utils.db import SessionLocal, User, PatientStudy, StudyJob, init_db
+from utils.study_store import STUDY_ID_PATTERN, find_studies, anonymize_patient_id, existing_studies
+from model_registry import registry
+from batching import get_fusion_batcher, shutdown_fusion_batcher
+from worker_pool import PipelinePool, PoolSaturated, run_pipeline
+from jobs import StudyWorkerPool, enqueue_study, get_study_status, delete_study, worker_stats
+from result_cache import ResultCache, RESULT_CACHE_ENABLED
+from metrics import (
+    metrics, record_stage_timings, record_pipeline_error, PIPELINE_STAGE_SECONDS, HTTP_REQUESTS, HTTP_REQUEST_SECONDS,
+)
+from bulk_ingest import INGEST_ROOT, manifest_fingerprint, start_ingest, get_ingest
+from preview import (
+    PREVIEW_CACHE_MAX_AGE, PreviewNotFound, default_window, preview_path, preview_etag,
+    read_preview_slice, encode_png, pyramid_info,
+)
+from jose import JWTError
+from sqlalchemy import func
+import asyncio, logging, threading, time, os, json, shutil, tempfile, datetime
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+logger = logging.getLogger("api")
+
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "/root/MedicalReportAnalysis/uploads")
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_HISTORY_CHARS = int(os.environ.get("MAX_HISTORY_CHARS", "20000"))
+pipeline_pool = PipelinePool()
+study_workers = StudyWorkerPool()
+result_cache = None  # built during warm-up; computing model versions imports torch
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup logic
-    db = SessionLocal()
-    if not db.query(User).filter(User.username == "radiologist_user").first():
-        new_user = User(
-            username="radiologist_user",
-            hashed_password=get_password_hash("secure_pass123"),
-            role="radiologist"
-        )
-        db.add(new_user)
-        db.commit()
-    db.close()
+    init_db()
+    with SessionLocal() as db:
+        if not db.query(User).filter(User.username == "radiologist_user").first():
+            new_user = User(
+                username="radiologist_user",
+                hashed_password=get_password_hash("secure_pass123"),
+                role="radiologist"
+            )
+            db.add(new_user)
+            db.commit()
+    # Models (torch, transformers, SimpleITK) load in the background so the
+    # server answers liveness probes immediately; /health/ready flips once done
+    app.state.ready = False
+    app.state.warmup_error = None
+    warmup = asyncio.create_task(_warm_up_models(app))
+    get_fusion_batcher()
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    pipeline_pool.start()
+    study_workers.start()
     yield
-    # Shutdown logic (optional)
+    # Shutdown logic
+    if not warmup.done():
+        await asyncio.wait([warmup])
+    study_workers.stop()
+    pipeline_pool.shutdown()
+    shutdown_fusion_batcher()
+
+async def _warm_up_models(app: FastAPI):
+    started = time.perf_counter()
+    global result_cache
+    try:
+        await asyncio.to_thread(registry.warm_up)
+        if RESULT_CACHE_ENABLED and result_cache is None:
+            result_cache = await asyncio.to_thread(ResultCache)
+    except Exception as e:
+        app.state.warmup_error = type(e).__name__
+        logger.error(f"Model warm-up failed: {e}")
+        return
+    app.state.ready = True
+    logger.info(f"Models warm after {time.perf_counter() - started:.2f}s")
 
 app = FastAPI(title="HIPAA Medical Imaging API", lifespan=lifespan)
 
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Route templates only (e.g. /api/v1/studies/{study_id}/results), never concrete ids
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.inc(route=route_path, status=status_code)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=route_path)
+
+def _study_queue_depth():
+    with SessionLocal() as db:
+        rows = db.query(StudyJob.status, func.count(StudyJob.id)).group_by(StudyJob.status).all()
+    return [({"status": job_status}, count) for job_status, count in rows]
+
+def _study_worker_jobs():
+    with SessionLocal() as db:
+        workers = worker_stats(db)
+    return [({"worker": w["worker_id"], "outcome": outcome}, w[f"jobs_{outcome}"])
+            for w in workers for outcome in ("completed", "failed")]
+
+def _study_workers_alive():
+    with SessionLocal() as db:
+        workers = worker_stats(db)
+    return [({}, sum(w["alive"] for w in workers))]
+
+def _register_metric_callbacks():
+    metrics.callback("pipeline_pool_in_flight", "Pipeline runs executing or waiting for a worker",
+                     lambda: [({}, pipeline_pool.in_flight)])
+    metrics.callback("pipeline_pool_queued", "Pipeline runs waiting for a worker",
+                     lambda: [({}, pipeline_pool.stats()["queued"])])
+    metrics.callback("pipeline_pool_rejected_total", "Pipeline runs rejected with 429",
+                     lambda: [({}, pipeline_pool.rejected)], kind="counter")
+    metrics.callback("study_jobs", "Study jobs by status", _study_queue_depth)
+    # Every worker sharing the job table, on any host; worker ids are host:pid, never study data
+    metrics.callback("study_worker_jobs_total", "Study jobs finished per worker by outcome",
+                     _study_worker_jobs, kind="counter")
+    metrics.callback("study_workers_alive", "Study workers with a heartbeat within one lease", _study_workers_alive)
+    metrics.callback("result_cache_lookups_total", "Result cache lookups by outcome", lambda: [
+        ({"result": "hit_memory"}, result_cache.hits_memory),
+        ({"result": "hit_disk"}, result_cache.hits_disk),
+        ({"result": "miss"}, result_cache.misses),
+    ] if result_cache is not None else [], kind="counter")
+    metrics.callback("fusion_batcher_queue_depth", "Fusion requests waiting for a batch",
+                     lambda: [({}, get_fusion_batcher().stats()["queue_depth"])])
+    metrics.callback("audit_queue_depth", "Audit records waiting to be written",
+                     lambda: [({}, get_audit_sink().stats()["queue_depth"])])
+    metrics.callback("audit_dropped_total", "Audit records dropped on overflow",
+                     lambda: [({}, get_audit_sink().stats()["dropped"])], kind="counter")
+    metrics.callback("token_cache_lookups_total", "Verified-token cache lookups by outcome", lambda: [
+        ({"result": "hit"}, token_cache.hits), ({"result": "miss"}, token_cache.misses),
+    ], kind="counter")
+    metrics.callback("text_embedding_cache_lookups_total", "RadBERT text-embedding cache lookups by outcome", lambda: [
+        ({"result": "hit"}, registry.get("radbert").embedding_cache.hits),
+        ({"result": "miss"}, registry.get("radbert").embedding_cache.misses),
+    ] if registry.is_loaded("radbert") else [], kind="counter")
+    metrics.callback("models_loaded", "Models currently loaded",
+                     lambda: [({"model": n}, int(registry.is_loaded(n))) for n in registry.names()])
+
+_register_metric_callbacks()
+
 def shutdown_timer(): 
     time.sleep(600)
     os._exit(0)
@@ -41,7 +162,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         role: str = payload.get("role")
         if username is None:
@@ -52,9 +173,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
 
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    db = SessionLocal()
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await run_in_threadpool(_load_user, form_data.username)
+    # Unknown users still pay for one hash so response time does not reveal which usernames exist
+    if not await verify_password_or_dummy_async(form_data.password, user.hashed_password if user else None):
         log_audit_event("unknown", "login_attempt", "none", "failed")
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     
@@ -62,6 +183,10 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     log_audit_event(user.username, "login", "none", "success")
     return {"access_token": access_token, "token_type": "bearer"}
 
+def _load_user(username: str):
+    with SessionLocal() as db:
+        return db.query(User).filter(User.username == username).first()
+
 @app.post("/diagnose")
 async def diagnose_image(
     current_user: dict = Depends(get_current_user),
@@ -72,20 +197,348 @@ async def diagnose_image(
         log_audit_event(current_user["username"], "unauthorized_access", "diagnose", "denied")
         raise HTTPException(status_code=403, detail="Not authorized to perform diagnosis")
     
-    # Save dummy file to root for simulation
-    temp_path = f"/root/MedicalReportAnalysis/{file.filename}"
-    with open(temp_path, "wb") as f:
-        f.write(await file.read())
-        
-    results = run_diagnostic_pipeline(temp_path, history)
-    log_audit_event(current_user["username"], "run_pipeline", file.filename, "success")
+    # Free-text history is scrubbed before it reaches the models, the cache or any log
+    history = await _redact_history(history)
+    temp_path = await _stream_upload_to_disk(file)
+    try:
+        cache_key, results, cache_tier = None, None, None
+        lookup_started = time.perf_counter()
+        if result_cache is not None:
+            cache_key = await run_in_threadpool(result_cache.make_key, temp_path, history)
+            results, cache_tier = await run_in_threadpool(result_cache.get, cache_key)
+        lookup_ms = 1000.0 * (time.perf_counter() - lookup_started)
+        if results is None:
+            try:
+                results = await pipeline_pool.run(run_pipeline, temp_path, history)
+            except PoolSaturated:
+                raise
+            except Exception as e:
+                record_pipeline_error(e)
+                raise
+            record_stage_timings(results.get("stage_timings", {}), results.get("latency_sec"))
+            if cache_key is not None:
+                await run_in_threadpool(result_cache.put, cache_key, results)
+    except PoolSaturated:
+        log_audit_event(current_user["username"], "run_pipeline", file.filename, "throttled")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Diagnostic pipeline is at capacity, retry shortly",
+            headers={"Retry-After": "5"},
+        )
+    finally:
+        os.remove(temp_path)
+    log_audit_event(current_user["username"], "run_pipeline", file.filename, "cache_hit" if cache_tier else "success")
+    results["cache"] = {"hit": cache_tier is not None, "tier": cache_tier, "lookup_ms": lookup_ms}
     
     return results
 
+async def _redact_history(text: str) -> str:
+    """Length-capped PHI redaction, off the event loop."""
+    if text and len(text) > MAX_HISTORY_CHARS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"Clinical history exceeds {MAX_HISTORY_CHARS} characters")
+    return await run_in_threadpool(redact_phi, text)
+
+async def _stream_upload_to_disk(file: UploadFile) -> str:
+    """Copy an upload to a private per-request temp file in fixed-size chunks."""
+    # Only the extension of the client-supplied name is kept (SimpleITK picks the reader from it)
+    name = os.path.basename(file.filename or "").lower()
+    suffix = ".nii.gz" if name.endswith(".nii.gz") else os.path.splitext(name)[1]
+    fd, temp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path
+
+@app.post("/api/v1/studies", status_code=status.HTTP_202_ACCEPTED)
+async def submit_study(
+    current_user: dict = Depends(get_current_user),
+    file: UploadFile = File(...),
+    patient_id: str = Form(...),
+    study_id: str = Form(None),
+    clinical_history: str = Form(""),
+    age: int = Form(None),
+    gender: str = Form(None),
+    modality: str = Form(None),
+    body_part: str = Form(None),
+):
+    if current_user["role"] not in ["radiologist", "admin"]:
+        log_audit_event(current_user["username"], "unauthorized_access", "submit_study", "denied")
+        raise HTTPException(status_code=403, detail="Not authorized to submit studies")
+    if study_id and not STUDY_ID_PATTERN.match(study_id):
+        raise HTTPException(status_code=400, detail="Invalid study_id")
+
+    db = SessionLocal()
+    claimed_dir = None
+    try:
+        processor = registry.get("processor")
+        if study_id:
+            # Studies stored by `bulk_ingest --no-queue` have a PatientStudy row but no job
+            if existing_studies(db, [study_id]):
+                raise HTTPException(status_code=409, detail="Study already exists")
+            # mkdir is the atomic claim: a concurrent submit or an orphaned directory gets 409
+            try:
+                os.mkdir(os.path.join(processor.storage_path, study_id))
+            except FileExistsError:
+                raise HTTPException(status_code=409, detail="Study already exists")
+            claimed_dir = os.path.join(processor.storage_path, study_id)
+
+        metadata = processor.ingest_demographics({
+            "patient_id": patient_id,
+            "age": age,
+            "gender": gender,
+            "clinical_history": await _redact_history(clinical_history),
+        })
+        metadata.update({"modality": modality, "body_part": body_part})
+
+        temp_path = await _stream_upload_to_disk(file)
+        try:
+            # Header-only open; slices are streamed into the encrypted store slab by slab
+            volume = await run_in_threadpool(processor.open_volume, temp_path)
+            if volume is None:
+                raise HTTPException(status_code=400, detail="Unreadable DICOM/NIfTI file")
+            with PIPELINE_STAGE_SECONDS.time(stage="encrypt_save"):
+                study_id = await run_in_threadpool(processor.secure_save_study, volume, metadata, study_id)
+        finally:
+            os.remove(temp_path)
+        job = enqueue_study(
+            db,
+            study_id=study_id,
+            patient_uuid=metadata["anonymized_id"],
+            file_path=os.path.join(processor.storage_path, study_id),
+            encrypted_metadata=EncryptionHandler.encrypt_data(json.dumps(metadata).encode()),
+            submitted_by=current_user["username"],
+            modality=modality,
+        )
+        claimed_dir = None
+        log_audit_event(current_user["username"], "submit_study", study_id, "queued")
+        return {
+            "study_id": study_id,
+            "status": job.status,
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        }
+    finally:
+        if claimed_dir is not None:
+            shutil.rmtree(claimed_dir, ignore_errors=True)
+        db.close()
+
+@app.get("/api/v1/studies")
+def list_studies(
+    patient_id: str = None,
+    modality: str = None,
+    study_date: datetime.date = None,
+    limit: int = 50,
+    cursor: str = None,
+    current_user: dict = Depends(get_current_user),
+):
+    if current_user["role"] not in ["radiologist", "admin"]:
+        log_audit_event(current_user["username"], "unauthorized_access", "list_studies", "denied")
+        raise HTTPException(status_code=403, detail="Not authorized to list studies")
+    patient_uuid = anonymize_patient_id(patient_id) if patient_id else None
+    with SessionLocal() as db:
+        try:
+            items, next_cursor = find_studies(db, patient_uuid=patient_uuid, modality=modality,
+                                              study_date=study_date, limit=limit, cursor=cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    log_audit_event(current_user["username"], "list_studies", patient_uuid or "all", f"{len(items)} returned")
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.post("/api/v1/ingest", status_code=status.HTTP_202_ACCEPTED)
+async def bulk_ingest_studies(
+    manifest: UploadFile = File(...),
+    queue_analysis: bool = Form(True),
+    current_user: dict = Depends(get_current_user),
+):
+    if current_user["role"] != "admin":
+        log_audit_event(current_user["username"], "unauthorized_access", "bulk_ingest", "denied")
+        raise HTTPException(status_code=403, detail="Not authorized to ingest studies")
+    name = (manifest.filename or "").lower()
+    if not name.endswith((".jsonl", ".csv")):
+        raise HTTPException(status_code=400, detail="Manifest must be a .jsonl or .csv file")
+    manifest_path = await _stream_upload_to_disk(manifest)
+    processor = await run_in_threadpool(registry.get, "processor")
+    # Keyed by manifest content, so re-submitting an interrupted manifest resumes it
+    checkpoint_path = os.path.join(UPLOAD_DIR, f"ingest-{manifest_fingerprint(manifest_path)}.checkpoint")
+
+    def _cleanup(ingestor):
+        os.remove(manifest_path)
+        if ingestor.status == "completed" and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+    ingest_id = start_ingest(
+        manifest_path, processor, current_user["username"], on_done=_cleanup,
+        checkpoint_path=checkpoint_path, queue_analysis=queue_analysis, allowed_root=INGEST_ROOT,
+    )
+    log_audit_event(current_user["username"], "bulk_ingest", ingest_id, "started")
+    return {"ingest_id": ingest_id, "status": "running"}
+
+@app.get("/api/v1/ingest/{ingest_id}")
+def bulk_ingest_progress(ingest_id: str, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized to view ingestion runs")
+    ingestor = get_ingest(ingest_id)
+    if ingestor is None:
+        raise HTTPException(status_code=404, detail="Ingestion run not found")
+    return ingestor.progress()
+
+@app.get("/api/v1/studies/{study_id}/results")
+def get_study_results(study_id: str, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] not in ["radiologist", "admin"]:
+        log_audit_event(current_user["username"], "unauthorized_access", "view_results", "denied")
+        raise HTTPException(status_code=403, detail="Not authorized to view studies")
+    db = SessionLocal()
+    try:
+        response = get_study_status(db, study_id)
+    finally:
+        db.close()
+    if response is None:
+        raise HTTPException(status_code=404, detail="Study not found")
+    log_audit_event(current_user["username"], "view_results", study_id, response["status"])
+    return response
+
+def _study_dir(study_id):
+    if not STUDY_ID_PATTERN.match(study_id):
+        raise HTTPException(status_code=400, detail="Invalid study_id")
+    study_dir = os.path.join(registry.get("processor").storage_path, study_id)
+    if not os.path.isdir(study_dir):
+        raise HTTPException(status_code=404, detail="Study not found")
+    return study_dir
+
+def _render_preview(study_dir, window, level, slice_index, if_none_match):
+    """(etag, png bytes or None when the client's copy is current)."""
+    path = preview_path(study_dir, window or default_window(study_dir), level)
+    etag = preview_etag(path, slice_index)
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return etag, None
+    _, image = read_preview_slice(path, slice_index)
+    return etag, encode_png(image)
+
+@app.get("/api/v1/studies/{study_id}/preview")
+async def get_study_preview(
+    study_id: str,
+    request: Request,
+    slice: int = None,
+    level: int = 0,
+    window: str = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """One slice of the study's preview pyramid as an 8-bit PNG (middle slice by default)."""
+    if current_user["role"] not in ["radiologist", "admin"]:
+        log_audit_event(current_user["username"], "unauthorized_access", "view_preview", "denied")
+        raise HTTPException(status_code=403, detail="Not authorized to view studies")
+    study_dir = _study_dir(study_id)
+    try:
+        etag, png = await run_in_threadpool(
+            _render_preview, study_dir, window, level, slice, request.headers.get("if-none-match"))
+    except PreviewNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    log_audit_event(current_user["username"], "view_preview", study_id, "success")
+    # Per-user caches only: previews are PHI, so never cacheable by shared proxies
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={PREVIEW_CACHE_MAX_AGE}", "Vary": "Authorization"}
+    if png is None:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=png, media_type="image/png", headers=headers)
+
+@app.get("/api/v1/studies/{study_id}/preview/levels")
+def get_study_preview_levels(study_id: str, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] not in ["radiologist", "admin"]:
+        log_audit_event(current_user["username"], "unauthorized_access", "view_preview", "denied")
+        raise HTTPException(status_code=403, detail="Not authorized to view studies")
+    try:
+        windows = pyramid_info(_study_dir(study_id))
+    except PreviewNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"study_id": study_id, "windows": windows}
+
+@app.delete("/api/v1/studies/{study_id}")
+def erase_study(study_id: str, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        log_audit_event(current_user["username"], "unauthorized_access", "delete_study", "denied")
+        raise HTTPException(status_code=403, detail="Not authorized to delete studies")
+    if not STUDY_ID_PATTERN.match(study_id):
+        raise HTTPException(status_code=400, detail="Invalid study_id")
+    db = SessionLocal()
+    try:
+        deleted = delete_study(db, study_id, registry.get("processor").storage_path)
+    finally:
+        db.close()
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Study not found")
+    log_audit_event(current_user["username"], "delete_study", study_id, "success")
+    return {"message": f"Study {study_id} permanently deleted"}
+
 @app.get("/health")
 def health_check():
     return {"status": "compliant", "api": "active"}
 
+@app.get("/health/live")
+def liveness_check():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness_check():
+    if not getattr(app.state, "ready", False):
+        detail = {"status": "warming_up", "loaded": [n for n in registry.names() if registry.is_loaded(n)]}
+        if getattr(app.state, "warmup_error", None):
+            detail = {"status": "failed", "error": app.state.warmup_error}
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=detail)
+    return {"status": "ready", "models": registry.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus text exposition; labels never carry request content."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/models")
+async def model_status(current_user: dict = Depends(get_current_user)):
+    stats = registry.stats()
+    stats["fusion_batcher"] = get_fusion_batcher().stats()
+    if registry.is_loaded("fusion") and hasattr(registry.get("fusion"), "info"):
+        stats["fusion"]["engine"] = registry.get("fusion").info()
+    if registry.is_loaded("radbert"):
+        stats["radbert"]["text_embeddings"] = registry.get("radbert").embedding_stats()
+    stats["pipeline_pool"] = pipeline_pool.stats()
+    stats["study_workers"] = study_workers.stats()
+    if result_cache is not None:
+        stats["result_cache"] = result_cache.stats()
+    stats["audit_sink"] = get_audit_sink().stats()
+    stats["token_cache"] = token_cache.stats()
+    stats["pipeline_stages"] = PIPELINE_STAGE_SECONDS.summary()
+    return stats
+
+@app.get("/api/v1/workers")
+def list_study_workers(current_user: dict = Depends(get_current_user)):
+    """Per-worker throughput across every host draining the study queue."""
+    if current_user["role"] != "admin":
+        log_audit_event(current_user["username"], "unauthorized_access", "list_workers", "denied")
+        raise HTTPException(status_code=403, detail="Not authorized to view workers")
+    with SessionLocal() as db:
+        workers = worker_stats(db)
+    return {
+        "workers": workers,
+        "alive": sum(w["alive"] for w in workers),
+        "studies_per_min": round(sum(w["studies_per_min"] for w in workers if w["alive"]), 3),
+    }
+
+@app.post("/models/reload")
+def reload_models(name: str = None, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        log_audit_event(current_user["username"], "unauthorized_access", "models_reload", "denied")
+        raise HTTPException(status_code=403, detail="Not authorized to reload models")
+    try:
+        stats = registry.reload(name)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if result_cache is not None:
+        result_cache.refresh_versions()
+    log_audit_event(current_user["username"], "reload_models", name or "all", "success")
+    return stats
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,163 @@
+import os
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+
+logger = logging.getLogger("fusion_batching")
+
+FUSION_MAX_BATCH_SIZE = int(os.environ.get("FUSION_MAX_BATCH_SIZE", "16"))
+FUSION_MAX_WAIT_MS = float(os.environ.get("FUSION_MAX_WAIT_MS", "5"))
+
+
+class _Request:
+    __slots__ = ("img_emb", "text_emb", "future", "enqueued_at")
+
+    def __init__(self, img_emb, text_emb):
+        self.img_emb = img_emb
+        self.text_emb = text_emb
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class FusionBatcher:
+    """
+    Dynamic micro-batching front end for MultimodalFusionEngine.
+
+    Callers submit one (img_emb, text_emb) pair each; a single scheduler
+    thread waits for the first request, keeps collecting until either
+    `max_batch_size` requests are queued or `max_wait_ms` has elapsed, runs
+    one batched forward pass under torch.inference_mode and resolves every
+    caller's future with its own row of the output.
+    """
+    def __init__(self, engine_getter, max_batch_size=FUSION_MAX_BATCH_SIZE, max_wait_ms=FUSION_MAX_WAIT_MS):
+        self._engine_getter = engine_getter
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="fusion-batcher", daemon=True)
+        self._thread.start()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._requests = 0
+        self._queue_wait_sec = 0.0
+        self._compute_sec = 0.0
+        self._max_batch_seen = 0
+
+    def submit(self, img_emb, text_emb):
+        """Queue one pair of embeddings ([dim] or [1, dim]); returns a Future of (risk_score, attn_weights)."""
+        if self._closed:
+            raise RuntimeError("FusionBatcher is closed")
+        request = _Request(img_emb.reshape(-1), text_emb.reshape(-1))
+        self._queue.put(request)
+        return request.future
+
+    def score(self, img_emb, text_emb, timeout=None):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(img_emb, text_emb).result(timeout=timeout)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-post the shutdown sentinel so the loop exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        # Imported on the scheduler thread so importing this module stays cheap
+        import torch
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            try:
+                engine = self._engine_getter()
+                # Frozen TorchScript engines have no parameters left to ask
+                device = getattr(engine, "device", None) or next(engine.parameters()).device
+                img = torch.stack([r.img_emb for r in batch]).to(device)
+                text = torch.stack([r.text_emb for r in batch]).to(device)
+                with torch.inference_mode():
+                    risk, attn = engine(img, text)
+                risk = risk.cpu()
+                attn = attn.cpu()
+            except Exception as e:
+                logger.error(f"Fusion batch of {len(batch)} failed: {e}")
+                for r in batch:
+                    r.future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            for i, r in enumerate(batch):
+                r.future.set_result((risk[i].item(), attn[i]))
+            with self._stats_lock:
+                self._batches += 1
+                self._requests += len(batch)
+                self._queue_wait_sec += sum(started - r.enqueued_at for r in batch)
+                self._compute_sec += finished - started
+                self._max_batch_seen = max(self._max_batch_seen, len(batch))
+
+    def stats(self, reset=False):
+        with self._stats_lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            stats = {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "batches": self._batches,
+                "requests": self._requests,
+                "mean_batch_size": self._requests / batches,
+                "max_batch_seen": self._max_batch_seen,
+                "mean_queue_wait_ms": 1000.0 * self._queue_wait_sec / requests,
+                "mean_batch_compute_ms": 1000.0 * self._compute_sec / batches,
+                "queue_depth": self._queue.qsize(),
+            }
+            if reset:
+                self._reset_stats()
+        return stats
+
+    def close(self, timeout=5.0):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_fusion_batcher():
+    """Process-wide batcher bound to the registry's fusion engine."""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                from model_registry import get_model
+                _batcher = FusionBatcher(lambda: get_model("fusion"))
+    return _batcher
+
+
+def shutdown_fusion_batcher():
+    """Stop the process-wide batcher; the next get_fusion_batcher() starts a fresh one."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is not None:
+            _batcher.close()
+            _batcher = None
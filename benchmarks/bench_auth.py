@@ -0,0 +1,139 @@
+"""
+Load test for the auth hot path: a login storm running alongside
+authenticated traffic, against the real FastAPI app in-process.
+
+Two variants are measured back to back:
+  - "inline": the previous behaviour, full jwt.decode on every request and
+    password verification on the event loop (a legacy /token route and a
+    dependency override are mounted for the run)
+  - "current": cached token claims and off-loop password verification
+
+Logins and authenticated GET /models requests are issued concurrently; the
+report gives throughput and latency percentiles for each.
+
+Usage: python -m benchmarks.bench_auth [--logins 200] [--requests 2000] [--concurrency 32]
+"""
+import time
+import json
+import asyncio
+import argparse
+
+import numpy as np
+import httpx
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+from jose import JWTError, jwt
+
+import api
+from utils.db import SessionLocal, User, init_db
+from utils.security import (
+    SECRET_KEY, ALGORITHM, create_access_token, get_password_hash, verify_password, token_cache,
+)
+
+BENCH_USER = "bench_auth_radiologist"
+BENCH_PASSWORD = "bench-pass-123"
+
+
+async def legacy_get_current_user(token: str = Depends(api.oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return {"username": payload.get("sub"), "role": payload.get("role")}
+
+
+async def legacy_login(form_data: OAuth2PasswordRequestForm = Depends()):
+    with SessionLocal() as db:
+        user = db.query(User).filter(User.username == form_data.username).first()
+        if not user or not verify_password(form_data.password, user.hashed_password):
+            raise HTTPException(status_code=400, detail="Incorrect username or password")
+        return {"access_token": create_access_token({"sub": user.username, "role": user.role}), "token_type": "bearer"}
+
+
+def _summary(latencies, wall):
+    lat = np.array(latencies) * 1000.0
+    return {
+        "count": len(latencies),
+        "per_sec": round(len(latencies) / wall, 1) if wall else None,
+        "p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "p99_ms": round(float(np.percentile(lat, 99)), 2),
+    }
+
+
+async def _worker(client, queue, make_request, latencies, finished):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            finished.append(time.perf_counter())
+            return
+        started = time.perf_counter()
+        response = await make_request(client)
+        if response.status_code != 200:
+            raise RuntimeError(f"Unexpected status {response.status_code}: {response.text}")
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_variant(login_path, logins, requests, concurrency):
+    token_cache.clear()
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # A handful of long-lived sessions make the authenticated traffic, as in a reading room
+        tokens = [create_access_token({"sub": BENCH_USER, "role": "radiologist", "sid": i}) for i in range(8)]
+        form = {"username": BENCH_USER, "password": BENCH_PASSWORD}
+
+        async def do_login(c):
+            return await c.post(login_path, data=form)
+
+        request_no = iter(range(10 ** 9))
+
+        async def do_request(c):
+            token = tokens[next(request_no) % len(tokens)]
+            return await c.get("/models", headers={"Authorization": f"Bearer {token}"})
+
+        login_queue, request_queue = asyncio.Queue(), asyncio.Queue()
+        for _ in range(logins):
+            login_queue.put_nowait(None)
+        for _ in range(requests):
+            request_queue.put_nowait(None)
+        login_lat, request_lat, login_done, request_done = [], [], [], []
+        started = time.perf_counter()
+        await asyncio.gather(
+            *[_worker(client, login_queue, do_login, login_lat, login_done) for _ in range(max(1, concurrency // 2))],
+            *[_worker(client, request_queue, do_request, request_lat, request_done) for _ in range(max(1, concurrency // 2))],
+        )
+    return {
+        "login": _summary(login_lat, max(login_done) - started),
+        "authenticated": _summary(request_lat, max(request_done) - started),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    init_db()
+    with SessionLocal() as db:
+        if not db.query(User).filter(User.username == BENCH_USER).first():
+            db.add(User(username=BENCH_USER, hashed_password=get_password_hash(BENCH_PASSWORD), role="radiologist"))
+            db.commit()
+    api.app.add_api_route("/_bench/legacy_token", legacy_login, methods=["POST"])
+    try:
+        api.app.dependency_overrides[api.get_current_user] = legacy_get_current_user
+        inline = asyncio.run(run_variant("/_bench/legacy_token", args.logins, args.requests, args.concurrency))
+        api.app.dependency_overrides.clear()
+        current = asyncio.run(run_variant("/token", args.logins, args.requests, args.concurrency))
+        current["token_cache"] = token_cache.stats()
+    finally:
+        api.app.dependency_overrides.clear()
+        with SessionLocal() as db:
+            db.query(User).filter(User.username == BENCH_USER).delete()
+            db.commit()
+    print(json.dumps({"settings": vars(args), "inline": inline, "current": current}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Extra memory and time of DICOM de-identification as the volume grows.
+
+in-memory: deidentify_image() on an int16 volume carrying PHI tags, against
+           the previous GetArrayFromImage/GetImageFromArray round trip.
+series:    deidentify_series() over a synthetic on-disk series; each size
+           runs in a fresh process and reports its peak RSS above the
+           post-import baseline.
+
+Usage: python -m benchmarks.bench_deidentify [--slices 32,128,512] [--size 512] [--json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+import SimpleITK as sitk
+
+# UID pseudonyms need a configured key; a fixed one is fine for synthetic data (child runs inherit it)
+os.environ.setdefault("BLIND_INDEX_KEY", "bench-deidentify")
+
+from utils.dicom_utils import deidentify_image, deidentify_series
+
+PHI_TAGS = {
+    "0010|0010": "Doe^Jane", "0010|0020": "MRN0012345", "0010|0030": "19580412",
+    "0008|0080": "General Hospital", "0008|0090": "Smith^John", "0008|0060": "CT",
+    "0020|000d": "1.2.826.0.1.3680043.2.1125.1", "0020|000e": "1.2.826.0.1.3680043.2.1125.2",
+}
+
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _legacy(image):
+    new_image = sitk.GetImageFromArray(sitk.GetArrayFromImage(image))
+    new_image.SetSpacing(image.GetSpacing())
+    new_image.SetOrigin(image.GetOrigin())
+    new_image.SetDirection(image.GetDirection())
+    return new_image
+
+
+def run_in_memory(slices, size):
+    results = []
+    for name, fn in (("legacy", _legacy), ("whitelist", lambda im: deidentify_image(im)[0])):
+        image = sitk.Image([size, size, slices], sitk.sitkInt16)
+        for key, value in PHI_TAGS.items():
+            image.SetMetaData(key, value)
+        before = _rss_mb()
+        started = time.perf_counter()
+        out = fn(image)
+        elapsed = time.perf_counter() - started
+        results.append({
+            "mode": f"in-memory/{name}",
+            "slices": slices,
+            "volume_mb": slices * size * size * 2 / 1e6,
+            "extra_mb": max(0.0, _rss_mb() - before),
+            "ms": elapsed * 1000.0,
+        })
+        del out, image
+    return results
+
+
+def _series_child(slices, size):
+    root = tempfile.mkdtemp(prefix="bench-deid-")
+    try:
+        src = os.path.join(root, "src")
+        os.makedirs(src)
+        writer = sitk.ImageFileWriter()
+        writer.KeepOriginalImageUIDOn()
+        slice_array = np.zeros((1, size, size), dtype=np.int16)
+        for i in range(slices):
+            image = sitk.GetImageFromArray(slice_array)
+            for key, value in PHI_TAGS.items():
+                image.SetMetaData(key, value)
+            image.SetMetaData("0008|0018", f"1.2.826.0.1.3680043.2.1125.3.{i}")
+            image.SetMetaData("0020|0013", str(i + 1))
+            image.SetMetaData("0020|0032", f"0\\0\\{i}")
+            writer.SetFileName(os.path.join(src, f"{i:05d}.dcm"))
+            writer.Execute(image)
+        baseline = _peak_rss_mb()
+        started = time.perf_counter()
+        deidentify_series(src, os.path.join(root, "dst"))
+        elapsed = time.perf_counter() - started
+        return {
+            "mode": "series",
+            "slices": slices,
+            "volume_mb": slices * size * size * 2 / 1e6,
+            "extra_mb": max(0.0, _peak_rss_mb() - baseline),
+            "ms": elapsed * 1000.0,
+            "slices_per_sec": slices / elapsed,
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def run_series(slices, size):
+    # Peak RSS is per process, so every size gets a fresh interpreter
+    out = subprocess.run([sys.executable, "-m", "benchmarks.bench_deidentify", "--child", str(slices), "--size", str(size)],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slices", default="32,128,512")
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--json", action="store_true", help="emit machine-readable results")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_series_child(args.child, args.size)))
+        return
+
+    results = []
+    for slices in [int(x) for x in args.slices.split(",")]:
+        results.extend(run_in_memory(slices, args.size))
+        results.append(run_series(slices, args.size))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<20} {'slices':>6} {'volume_mb':>9} {'extra_mb':>9} {'ms':>9}")
+    for r in results:
+        print(f"{r['mode']:<20} {r['slices']:>6} {r['volume_mb']:>9.1f} {r['extra_mb']:>9.1f} {r['ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
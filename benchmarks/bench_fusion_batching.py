@@ -0,0 +1,87 @@
+"""
+Throughput/latency sweep for FusionBatcher on CPU.
+
+Usage: python -m benchmarks.bench_fusion_batching [--clients 32] [--requests 2000]
+"""
+import argparse
+import json
+import time
+import threading
+
+import numpy as np
+import torch
+
+from batching import FusionBatcher
+from model_integration import MultimodalFusionEngine
+
+
+def run_setting(engine, max_batch_size, max_wait_ms, clients, total_requests):
+    batcher = FusionBatcher(lambda: engine, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    per_client = total_requests // clients
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        img = torch.randn(512)
+        text = torch.randn(768)
+        local = []
+        for _ in range(per_client):
+            t0 = time.perf_counter()
+            batcher.score(img, text)
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stats = batcher.stats()
+    batcher.close()
+
+    lat_ms = np.array(latencies) * 1000.0
+    return {
+        "max_batch_size": max_batch_size,
+        "max_wait_ms": max_wait_ms,
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(lat_ms, 50)),
+        "p95_ms": float(np.percentile(lat_ms, 95)),
+        "p99_ms": float(np.percentile(lat_ms, 99)),
+        "mean_batch_size": stats["mean_batch_size"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--batch-sizes", default="1,4,8,16,32")
+    parser.add_argument("--waits-ms", default="0,2,5,10")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--json", action="store_true", help="emit machine-readable results")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    engine = MultimodalFusionEngine().eval()
+
+    results = []
+    for bs in [int(x) for x in args.batch_sizes.split(",")]:
+        for wait in [float(x) for x in args.waits_ms.split(",")]:
+            results.append(run_setting(engine, bs, wait, args.clients, args.requests))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'batch':>5} {'wait_ms':>7} {'rps':>9} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'mean_bs':>7}")
+    for r in results:
+        print(f"{r['max_batch_size']:>5} {r['max_wait_ms']:>7.1f} {r['throughput_rps']:>9.1f} "
+              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['mean_batch_size']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
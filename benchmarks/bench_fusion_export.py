@@ -0,0 +1,73 @@
+"""
+Per-batch CPU latency of the fusion engine backends against eager fp32.
+
+Every backend is built from the same eager module, so the reported risk
+drift is the parity error that backend would be checked against at load.
+
+Usage: python -m benchmarks.bench_fusion_export [--batch-sizes 1,4,16,64] [--iters 200] [--threads 4] [--json]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+
+from fusion_export import BACKENDS, build_eager, configure_threads, optimize, probe_inputs, risk_scores
+
+
+def time_backend(module, batch_size, iters, warmup=20):
+    img, text = probe_inputs(batch=batch_size, seed=batch_size)
+    with torch.inference_mode():
+        for _ in range(warmup):
+            module(img, text)
+        samples = []
+        for _ in range(iters):
+            t0 = time.perf_counter()
+            module(img, text)
+            samples.append(time.perf_counter() - t0)
+    lat_ms = np.array(samples) * 1000.0
+    return {
+        "batch_size": batch_size,
+        "p50_ms": float(np.percentile(lat_ms, 50)),
+        "p95_ms": float(np.percentile(lat_ms, 95)),
+        "rows_per_sec": batch_size / float(np.median(samples)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-sizes", default="1,4,16,64")
+    parser.add_argument("--iters", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads (default: FUSION_THREADS)")
+    parser.add_argument("--json", action="store_true", help="emit machine-readable results")
+    args = parser.parse_args()
+
+    threads = configure_threads(args.threads)
+    torch.manual_seed(0)
+    eager = build_eager()
+    inputs = probe_inputs()
+    reference = risk_scores(eager, inputs)
+
+    results = []
+    for backend in BACKENDS:
+        module = eager if backend == "eager" else optimize(eager, backend)
+        drift = float((risk_scores(module, inputs) - reference).abs().max())
+        for bs in [int(x) for x in args.batch_sizes.split(",")]:
+            results.append({"backend": backend, "risk_drift": drift, **time_backend(module, bs, args.iters)})
+    eager_p50 = {r["batch_size"]: r["p50_ms"] for r in results if r["backend"] == "eager"}
+    for r in results:
+        r["speedup"] = eager_p50[r["batch_size"]] / r["p50_ms"]
+
+    if args.json:
+        print(json.dumps({"threads": threads, "results": results}, indent=2))
+        return
+    print(f"torch threads: {threads}")
+    print(f"{'backend':<12} {'batch':>5} {'p50_ms':>8} {'p95_ms':>8} {'rows/s':>10} {'speedup':>7} {'drift':>9}")
+    for r in results:
+        print(f"{r['backend']:<12} {r['batch_size']:>5} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} "
+              f"{r['rows_per_sec']:>10.0f} {r['speedup']:>6.2f}x {r['risk_drift']:>9.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Cold-start import benchmark for the API and the heavy modules it must not
+load eagerly.
+
+Each target is imported in a fresh interpreter with `-X importtime`; the
+cumulative import time of the target and of every tracked heavy module it
+pulled in is reported. `import api` failing to stay free of torch,
+transformers, SimpleITK and scipy is always an error; timings are compared
+against a stored baseline when one exists.
+
+Usage:
+    python -m benchmarks.bench_import_time [--repeat 3] [--update-baseline] [--tolerance 0.25]
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baselines", "import_time.json")
+TARGETS = ["api", "solver", "model_integration", "data_processing", "utils.security", "utils.db"]
+HEAVY_MODULES = ["torch", "transformers", "SimpleITK", "scipy", "numpy"]
+# Modules the API process must be able to start without
+API_FORBIDDEN = ["torch", "transformers", "SimpleITK", "scipy"]
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(target):
+    """Cumulative import microseconds for `target` and the heavy modules it loaded."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{proc.stderr[-2000:]}")
+    cumulative = {}
+    for match in _LINE.finditer(proc.stderr):
+        name = match.group(4)
+        # A module is reported once, when its import completes
+        cumulative.setdefault(name, int(match.group(2)))
+    return {
+        "total_ms": cumulative.get(target, 0) / 1000.0,
+        "heavy_ms": {m: cumulative[m] / 1000.0 for m in HEAVY_MODULES if m in cumulative},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per target; the median is reported")
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional slowdown")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = {}
+    for target in args.targets.split(","):
+        runs = [measure(target) for _ in range(args.repeat)]
+        report[target] = {
+            "total_ms": statistics.median(r["total_ms"] for r in runs),
+            "heavy_modules": sorted(runs[0]["heavy_ms"]),
+        }
+
+    failures = []
+    if "api" in report:
+        leaked = [m for m in API_FORBIDDEN if m in report["api"]["heavy_modules"]]
+        if leaked:
+            failures.append(f"import api eagerly loads {', '.join(leaked)}")
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for target, result in report.items():
+            if target in baseline:
+                limit = baseline[target]["total_ms"] * (1 + args.tolerance)
+                if result["total_ms"] > limit:
+                    failures.append(f"{target}: {result['total_ms']:.0f} ms > {limit:.0f} ms (baseline +{args.tolerance:.0%})")
+
+    if args.json:
+        print(json.dumps({"results": report, "failures": failures}, indent=2))
+    else:
+        print(f"{'module':<20} {'import_ms':>10} {'baseline_ms':>12}  heavy modules loaded")
+        for target, result in report.items():
+            base = baseline.get(target, {}).get("total_ms") if baseline else None
+            base_str = f"{base:.0f}" if base is not None else "-"
+            print(f"{target:<20} {result['total_ms']:>10.0f} {base_str:>12}  {', '.join(result['heavy_modules']) or '-'}")
+        for failure in failures:
+            print(f"REGRESSION: {failure}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
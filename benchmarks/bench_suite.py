@@ -0,0 +1,362 @@
+"""
+Reproducible benchmark suite for the diagnostic pipeline stages and the API.
+
+Stage benchmarks run in this process on seeded synthetic volumes of
+increasing size:
+  normalize       MedicalDataProcessor.normalize_image on the whole volume
+  segment         MedSAMIntegrator.segment on the middle slice
+  fusion          MultimodalFusionEngine.forward, batch = slice count (capped at 64)
+  encrypt/decrypt EncryptionHandler.encrypt_data / decrypt_data (Fernet) on the volume bytes
+  save            MedicalDataProcessor.secure_save_study into a temp directory
+
+The API benchmark starts `uvicorn api:app` on a free local port (plain
+HTTP, study workers and the result cache off, temp upload/DB directories)
+and drives /token and /diagnose from concurrent clients. The server queues
+diagnoses beyond pool capacity instead of answering 429, so every request
+is timed.
+
+The JSON report holds latency percentiles, throughput and peak RSS (this
+process after each stage, the server's VmHWM). Against a stored baseline,
+p50 latency above baseline * (1 + tolerance) or throughput below
+baseline / (1 + tolerance), or more failed requests than the baseline,
+is reported as a regression (exit status 1).
+A missing baseline is a warning, or an error (exit status 2) with --ci
+or when the CI environment variable is set.
+
+Usage:
+    python -m benchmarks.bench_suite [--sizes 16x128x128,32x256x256,64x512x512] [--repeat 5]
+        [--skip-api] [--api-clients 8] [--api-requests 40] [--output report.json]
+        [--update-baseline] [--tolerance 0.25] [--ci]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import resource
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baselines", "suite.json")
+DEFAULT_SIZES = "16x128x128,32x256x256,64x512x512"
+SEED = 1234
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _percentiles(seconds):
+    ms = np.array(seconds) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def _time(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _stage_result(samples, nbytes=None, items=None):
+    result = _percentiles(samples)
+    p50 = float(np.median(samples))
+    if nbytes is not None:
+        result["mb_per_sec"] = round(nbytes / 1e6 / p50, 2)
+    if items is not None:
+        result["items_per_sec"] = round(items / p50, 1)
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def run_stages(sizes, repeat, workdir):
+    import torch
+    from model_registry import get_model
+    from data_processing import MedicalDataProcessor
+    from model_integration import MultimodalFusionEngine
+    from utils.security import EncryptionHandler
+
+    torch.manual_seed(SEED)
+    rng = np.random.default_rng(SEED)
+    processor = MedicalDataProcessor(os.path.join(workdir, "storage"))
+    medsam = get_model("medsam")
+    fusion = MultimodalFusionEngine().eval()
+    results = {}
+    for depth, height, width in sizes:
+        label = f"{depth}x{height}x{width}"
+        volume = rng.integers(-1024, 2048, size=(depth, height, width), dtype=np.int16).astype(np.float32)
+        raw = volume.tobytes()
+        normalized = processor.normalize_image(volume)
+        box = [width // 5, height // 5, 4 * width // 5, 4 * height // 5]
+        mid = normalized[depth // 2]
+        batch = min(depth, 64)
+        img_emb, text_emb = torch.randn(batch, 512), torch.randn(batch, 768)
+        token = EncryptionHandler.encrypt_data(raw)
+
+        def forward():
+            with torch.inference_mode():
+                fusion(img_emb, text_emb)
+
+        stages = {
+            "normalize": (lambda: processor.normalize_image(volume), {"nbytes": volume.nbytes}),
+            "segment": (lambda: medsam.segment(mid, box_prompt=box), {"nbytes": mid.nbytes}),
+            "fusion": (forward, {"items": batch}),
+            "encrypt": (lambda: EncryptionHandler.encrypt_data(raw), {"nbytes": len(raw)}),
+            "decrypt": (lambda: EncryptionHandler.decrypt_data(token), {"nbytes": len(raw)}),
+            "save": (lambda: processor.secure_save_study(volume, {"bench": True}, study_id=f"bench-{label}"),
+                     {"nbytes": volume.nbytes}),
+        }
+        results[label] = {}
+        for name, (fn, kwargs) in stages.items():
+            results[label][name] = _stage_result(_time(fn, repeat), **kwargs)
+            print(f"  {label:<14} {name:<10} p50 {results[label][name]['p50_ms']:>10.2f} ms", file=sys.stderr)
+        del volume, raw, normalized, token
+    return results
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _server_peak_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _drive(fn, clients, total):
+    """Run fn() `total` times across `clients` threads; returns (latencies, wall seconds, errors)."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    remaining = iter(range(total))
+
+    def client():
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            started = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                with lock:
+                    errors.append(type(e).__name__)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, time.perf_counter() - started, errors
+
+
+def run_api(workdir, clients, total, ready_timeout=300):
+    import requests
+    import SimpleITK as sitk
+
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        STUDY_WORKERS="0",
+        RESULT_CACHE_ENABLED="0",
+        # Queue rather than shed load, so latencies cover every request instead of fast 429s
+        PIPELINE_QUEUE_TIMEOUT_SEC="300",
+        UPLOAD_DIR=os.path.join(workdir, "uploads"),
+        AUDIT_LOG_PATH=os.path.join(workdir, "audit.log"),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.time() + ready_timeout
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError("API server exited during startup")
+            try:
+                if requests.get(f"{base}/health/ready", timeout=2).status_code == 200:
+                    break
+            except requests.ConnectionError:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError("API server did not become ready")
+            time.sleep(0.5)
+
+        image_path = os.path.join(workdir, "bench.nii.gz")
+        rng = np.random.default_rng(SEED)
+        sitk.WriteImage(sitk.GetImageFromArray(rng.random((16, 128, 128), dtype=np.float32)), image_path)
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+        credentials = {"username": "radiologist_user", "password": "secure_pass123"}
+        local = threading.local()
+
+        def session():
+            if not hasattr(local, "session"):
+                local.session = requests.Session()
+            return local.session
+
+        def login():
+            r = session().post(f"{base}/token", data=credentials, timeout=60)
+            r.raise_for_status()
+            return r.json()["access_token"]
+
+        headers = {"Authorization": f"Bearer {login()}"}
+
+        def diagnose():
+            r = session().post(f"{base}/diagnose", headers=headers, data={"history": "Shortness of breath."},
+                               files={"file": ("bench.nii.gz", image_bytes)}, timeout=300)
+            r.raise_for_status()
+
+        results = {}
+        mixed = {}
+
+        def run(name, fn, n):
+            latencies, wall, errors = _drive(fn, max(1, clients // 2), n)
+            entry = _percentiles(latencies) if latencies else {}
+            entry.update({"requests": len(latencies), "errors": len(errors), "per_sec": round(len(latencies) / wall, 2)})
+            mixed[name] = entry
+
+        # Logins and diagnoses at the same time, as during a shift change
+        workers = [threading.Thread(target=run, args=("token", login, total)),
+                   threading.Thread(target=run, args=("diagnose", diagnose, total))]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        results.update(mixed)
+        results["server_peak_rss_mb"] = _server_peak_rss_mb(server.pid)
+        return results
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def _flatten(report, prefix=""):
+    for key, value in report.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from _flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of p50 latency, throughput or error count against a baseline results dict."""
+    base = dict(_flatten(baseline))
+    failures = []
+    for path, value in _flatten(results):
+        if path.endswith(".errors") and value > base.get(path, 0):
+            failures.append(f"{path}: {value} > {base.get(path, 0)}")
+            continue
+        if path not in base or not base[path]:
+            continue
+        if path.endswith("p50_ms") and value > base[path] * (1 + tolerance):
+            failures.append(f"{path}: {value:.2f} ms > {base[path] * (1 + tolerance):.2f} ms")
+        elif path.endswith(("per_sec", "mb_per_sec", "items_per_sec")) and value < base[path] / (1 + tolerance):
+            failures.append(f"{path}: {value:.2f}/s < {base[path] / (1 + tolerance):.2f}/s")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated DxHxW volumes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-stages", action="store_true")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--api-clients", type=int, default=8)
+    parser.add_argument("--api-requests", type=int, default=40, help="requests per endpoint")
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional slowdown")
+    parser.add_argument("--ci", action="store_true", default=bool(os.environ.get("CI")),
+                        help="fail when there is no baseline to compare against (default when $CI is set)")
+    args = parser.parse_args()
+
+    sizes = [tuple(int(d) for d in s.split("x")) for s in args.sizes.split(",")]
+    workdir = tempfile.mkdtemp(prefix="bench-suite-")
+    results = {}
+    try:
+        if not args.skip_stages:
+            print("Stage benchmarks:", file=sys.stderr)
+            results["stages"] = run_stages(sizes, args.repeat, workdir)
+        if not args.skip_api:
+            print("API benchmark:", file=sys.stderr)
+            results["api"] = run_api(workdir, args.api_clients, args.api_requests)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failures = []
+    environment = {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()}
+    missing_baseline = not args.update_baseline and not os.path.exists(args.baseline)
+    if missing_baseline:
+        print(f"WARNING: no baseline at {args.baseline}; regressions were not checked "
+              f"(record one with --update-baseline)", file=sys.stderr)
+    elif not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != environment:
+            print(f"WARNING: baseline was recorded on {baseline.get('environment')}, this run is {environment}; "
+                  f"re-record it on this machine with --update-baseline", file=sys.stderr)
+        failures = compare(results, baseline["results"], args.tolerance)
+    report = {
+        "settings": {"sizes": args.sizes, "repeat": args.repeat, "api_clients": args.api_clients,
+                     "api_requests": args.api_requests, "seed": SEED},
+        "environment": environment,
+        "peak_rss_mb": _peak_rss_mb(),
+        "results": results,
+        "regressions": failures,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            f.write(text)
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    if missing_baseline and args.ci:
+        return 2
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
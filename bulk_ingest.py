@@ -0,0 +1,424 @@
+"""
+Streaming bulk ingestion of studies from a JSONL or CSV manifest.
+
+Each record carries demographics plus the path of a DICOM/NIfTI volume on
+this host (a file or a series directory):
+
+    {"patient_id": "12345", "image_path": "/data/ct/0001.nii.gz", "study_id": "CT_0001",
+     "age": 61, "gender": "F", "clinical_history": "...", "modality": "CT", "body_part": "chest"}
+
+The manifest is read one record at a time; at most `workers * 2` records
+are in flight, so memory stays constant whatever the manifest size.
+Records are mapped through MedicalDataProcessor.ingest_demographics and
+encrypted into secure storage by secure_save_study on a thread pool
+(SimpleITK reads and AES-GCM both release the GIL). Results are handed
+back in manifest order and their PatientStudy/StudyJob rows are committed
+in batches; after every commit a checkpoint records how many records are
+done, so an interrupted run resumes where it stopped. Studies without a
+study_id get one derived from the manifest and record number, which makes
+re-running a partially committed batch overwrite rather than duplicate.
+
+A study_id is checked before any storage work: one that already has a
+database row, or that appeared earlier in the run, is skipped (queue mode
+still adds a missing analysis job for the stored study), and its files are
+never rewritten. The same id for a different patient, or an explicit
+study_id whose directory exists without a database row, fails the record.
+
+Usage:
+    python bulk_ingest.py manifest.jsonl [--workers 4] [--batch-size 100] [--no-queue] [--restart]
+"""
+import os
+import csv
+import sys
+import json
+import time
+import uuid
+import hashlib
+import logging
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils.db import SessionLocal, init_db
+from utils.redaction import redact_phi
+from utils.security import EncryptionHandler
+from utils.study_store import (STUDY_ID_PATTERN, anonymize_patient_id, bulk_insert_studies, existing_studies,
+                               study_row)
+from jobs import enqueue_studies
+
+logger = logging.getLogger("bulk_ingest")
+
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "100"))
+INGEST_PROGRESS_INTERVAL_SEC = float(os.environ.get("INGEST_PROGRESS_INTERVAL_SEC", "10"))
+# Manifests submitted through the API may only reference images below this directory
+INGEST_ROOT = os.environ.get("INGEST_ROOT", "/root/MedicalReportAnalysis/ingest")
+
+_FINGERPRINT_BYTES = 64 * 1024
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def manifest_format(path):
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def iter_manifest(path, fmt=None):
+    """Yield (record_number, dict or exception) lazily; record numbers start at 0."""
+    fmt = fmt or manifest_format(path)
+    with open(path, newline="" if fmt == "csv" else None, encoding="utf-8") as f:
+        if fmt == "csv":
+            for number, row in enumerate(csv.DictReader(f)):
+                yield number, {k: v for k, v in row.items() if k is not None and v not in (None, "")}
+            return
+        number = 0
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise InvalidRecord("record is not a JSON object")
+            except ValueError as e:
+                record = InvalidRecord(f"unparseable line ({type(e).__name__})")
+            yield number, record
+            number += 1
+
+
+def manifest_fingerprint(path):
+    """Identity of a manifest for checkpoints: size plus a hash of its head."""
+    digest = hashlib.sha256(str(os.path.getsize(path)).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(_FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+
+def validate_record(record, allowed_root=None):
+    """Normalized copy of a manifest record; raises InvalidRecord."""
+    if not record.get("patient_id"):
+        raise InvalidRecord("missing patient_id")
+    image_path = record.get("image_path")
+    if not image_path:
+        raise InvalidRecord("missing image_path")
+    image_path = os.path.realpath(image_path)
+    if allowed_root is not None and os.path.commonpath([image_path, os.path.realpath(allowed_root)]) != os.path.realpath(allowed_root):
+        raise InvalidRecord("image_path outside the ingest root")
+    if not os.path.exists(image_path):
+        raise InvalidRecord("image_path does not exist")
+    study_id = record.get("study_id")
+    if study_id is not None and not STUDY_ID_PATTERN.match(str(study_id)):
+        raise InvalidRecord("invalid study_id")
+    age = record.get("age")
+    if age is not None:
+        try:
+            age = int(age)
+        except (TypeError, ValueError):
+            raise InvalidRecord("age is not an integer")
+        if not 0 <= age <= 150:
+            raise InvalidRecord("age out of range")
+    return {
+        "patient_id": str(record["patient_id"]),
+        "image_path": image_path,
+        "study_id": str(study_id) if study_id is not None else None,
+        "age": age,
+        "gender": record.get("gender"),
+        "clinical_history": redact_phi(record.get("clinical_history") or ""),
+        "modality": record.get("modality"),
+        "body_part": record.get("body_part"),
+    }
+
+
+class BulkIngestor:
+    """One ingestion run over one manifest; progress() is safe to call from other threads."""
+    def __init__(self, manifest_path, processor, submitted_by="bulk_ingest", workers=INGEST_WORKERS,
+                 batch_size=INGEST_BATCH_SIZE, checkpoint_path=None, queue_analysis=True, allowed_root=None,
+                 fmt=None):
+        self.manifest_path = manifest_path
+        self.processor = processor
+        self.submitted_by = submitted_by
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.checkpoint_path = checkpoint_path or manifest_path + ".checkpoint"
+        self.queue_analysis = queue_analysis
+        self.allowed_root = allowed_root
+        self.fmt = fmt or manifest_format(manifest_path)
+        self.fingerprint = manifest_fingerprint(manifest_path)
+        self._id_namespace = uuid.UUID(self.fingerprint[:32])
+        self._lock = threading.Lock()
+        self.status = "pending"
+        self.resumed_from = 0
+        self.next_record = 0
+        self.stored = 0
+        self.skipped_existing = 0
+        self.failed = 0
+        self.bytes_stored = 0
+        self.errors = deque(maxlen=100)  # (record_number, error type/message), never PHI
+        self._pending = {}  # study_id -> patient_uuid for claimed records that are not committed yet
+        self.started_at = None
+        self.finished_at = None
+        self._baseline = (0, 0)
+
+    # -- checkpoints ---------------------------------------------------------
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("fingerprint") != self.fingerprint:
+            logger.warning("Checkpoint belongs to a different manifest; starting from the first record")
+            return 0
+        self.stored = checkpoint.get("stored", 0)
+        self.failed = checkpoint.get("failed", 0)
+        self.skipped_existing = checkpoint.get("skipped_existing", 0)
+        self.bytes_stored = checkpoint.get("bytes_stored", 0)
+        return checkpoint.get("next_record", 0)
+
+    def _save_checkpoint(self):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "fingerprint": self.fingerprint,
+                "next_record": self.next_record,
+                "stored": self.stored,
+                "failed": self.failed,
+                "skipped_existing": self.skipped_existing,
+                "bytes_stored": self.bytes_stored,
+                "updated_at": time.time(),
+            }, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # -- per-record work (pool threads) --------------------------------------
+
+    def _claim(self, db, number, record):
+        """
+        Decide what to do with one record before anything is written (driver
+        thread). Returns a work dict whose "action" is "store", "enqueue"
+        (job only, for a study stored earlier) or "skip"; raises InvalidRecord.
+        """
+        if isinstance(record, Exception):
+            raise record
+        record = validate_record(record, self.allowed_root)
+        study_id = record["study_id"] or str(uuid.uuid5(self._id_namespace, str(number)))
+        patient_uuid = anonymize_patient_id(record["patient_id"])
+        if study_id in self._pending:
+            existing = (self._pending[study_id], True)  # claimed earlier in this run
+        else:
+            existing = existing_studies(db, [study_id]).get(study_id)
+        if existing is not None:
+            if existing[0] != patient_uuid:
+                raise InvalidRecord("study_id already exists for another patient")
+            if not self.queue_analysis or existing[1]:
+                return {"action": "skip", "study_id": study_id}
+            self._pending[study_id] = patient_uuid
+            return {"action": "enqueue", "study_id": study_id, "patient_uuid": patient_uuid,
+                    "file_path": os.path.join(self.processor.storage_path, study_id),
+                    "encrypted_metadata": None, "modality": record["modality"], "nbytes": 0}
+        # Derived ids are unique to this manifest, so their directory can only be left by an interrupted run
+        if record["study_id"] and os.path.exists(os.path.join(self.processor.storage_path, study_id)):
+            raise InvalidRecord("study directory already exists without a database row")
+        self._pending[study_id] = patient_uuid
+        return {"action": "store", "study_id": study_id, "record": record}
+
+    def _store(self, work):
+        record, study_id = work["record"], work["study_id"]
+        metadata = self.processor.ingest_demographics(record)
+        metadata.update({"modality": record["modality"], "body_part": record["body_part"]})
+        volume = self.processor.open_volume(record["image_path"])
+        if volume is None:
+            raise InvalidRecord("unreadable DICOM/NIfTI volume")
+        self.processor.secure_save_study(volume, metadata, study_id)
+        return {
+            "action": "store",
+            "study_id": study_id,
+            "patient_uuid": metadata["anonymized_id"],
+            "file_path": os.path.join(self.processor.storage_path, study_id),
+            "encrypted_metadata": EncryptionHandler.encrypt_data(json.dumps(metadata).encode()),
+            "modality": record["modality"],
+            "nbytes": volume.nbytes,
+        }
+
+    # -- driver ----------------------------------------------------------------
+
+    def _commit(self, db, batch, next_record):
+        if batch:
+            fresh = [s for s in batch if s["action"] == "store"]
+            if self.queue_analysis:
+                enqueue_studies(db, fresh, self.submitted_by)
+                # Studies stored by an earlier --no-queue run only need their job
+                enqueue_studies(db, [s for s in batch if s["action"] == "enqueue"], self.submitted_by,
+                                store_metadata=False)
+            else:
+                bulk_insert_studies(db, [study_row(s["study_id"], s["patient_uuid"], s["file_path"],
+                                                   s["encrypted_metadata"], s["modality"]) for s in fresh])
+                db.commit()
+            for s in batch:
+                self._pending.pop(s["study_id"], None)
+            with self._lock:
+                self.stored += len(fresh)
+                self.skipped_existing += len(batch) - len(fresh)
+                self.bytes_stored += sum(s["nbytes"] for s in fresh)
+        with self._lock:
+            self.next_record = next_record
+        self._save_checkpoint()
+
+    def _submit(self, db, pool, number, record):
+        """Claim a record and hand its storage work to the pool; returns (future, claimed study_id)."""
+        future = Future()
+        try:
+            work = self._claim(db, number, record)
+        except Exception as e:
+            future.set_exception(e)
+            return future, None
+        if work["action"] != "store":
+            future.set_result(work)
+            return future, None
+        return pool.submit(self._store, work), work["study_id"]
+
+    def _finish_one(self, number, future, study_id, batch):
+        self._last_finished = number
+        try:
+            batch.append(future.result())
+        except Exception as e:
+            # A failed store releases its id; a retry then meets whatever it left on disk
+            self._pending.pop(study_id, None)
+            reason = str(e) if isinstance(e, InvalidRecord) else type(e).__name__
+            logger.error(f"Record {number} failed: {reason}")
+            with self._lock:
+                self.failed += 1
+                self.errors.append((number, reason))
+
+    def run(self):
+        """Ingest the manifest; returns the final progress() report."""
+        init_db()
+        self.resumed_from = self.next_record = self._load_checkpoint()
+        self._last_finished = self.resumed_from - 1
+        # Rates cover this run only, not work counted in the checkpoint
+        self._baseline = (self.stored + self.skipped_existing + self.failed, self.bytes_stored)
+        self.status = "running"
+        self.started_at = time.time()
+        if self.resumed_from:
+            logger.info(f"Resuming {self.manifest_path} at record {self.resumed_from}")
+        in_flight = deque()
+        batch = []
+        last_report = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest") as pool, SessionLocal() as db:
+            try:
+                for number, record in iter_manifest(self.manifest_path, self.fmt):
+                    if number < self.resumed_from:
+                        continue
+                    in_flight.append((number, *self._submit(db, pool, number, record)))
+                    # Results are consumed in manifest order so the checkpoint is always a clean prefix
+                    while len(in_flight) >= self.workers * 2 or (in_flight and in_flight[0][1].done()):
+                        done_number, future, study_id = in_flight.popleft()
+                        self._finish_one(done_number, future, study_id, batch)
+                        if len(batch) >= self.batch_size:
+                            self._commit(db, batch, done_number + 1)
+                            batch = []
+                    if time.monotonic() - last_report >= INGEST_PROGRESS_INTERVAL_SEC:
+                        logger.info(self._format_progress())
+                        last_report = time.monotonic()
+                while in_flight:
+                    self._finish_one(*in_flight.popleft(), batch)
+                self._commit(db, batch, max(self.next_record, self._last_finished + 1))
+                self.status = "completed"
+            except BaseException:
+                self.status = "failed"
+                for _, future, _ in in_flight:
+                    future.cancel()
+                raise
+            finally:
+                self.finished_at = time.time()
+        report = self.progress()
+        logger.info(self._format_progress())
+        return report
+
+    def progress(self):
+        with self._lock:
+            elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+            processed = self.stored + self.skipped_existing + self.failed - self._baseline[0]
+            stored_bytes = self.bytes_stored - self._baseline[1]
+            return {
+                "status": self.status,
+                "manifest": os.path.basename(self.manifest_path),
+                "resumed_from": self.resumed_from,
+                "next_record": self.next_record,
+                "stored": self.stored,
+                "skipped_existing": self.skipped_existing,
+                "failed": self.failed,
+                "elapsed_sec": round(elapsed, 2),
+                "records_per_sec": round(processed / elapsed, 2) if elapsed else 0.0,
+                "mb_per_sec": round(stored_bytes / 1e6 / elapsed, 2) if elapsed else 0.0,
+                "recent_errors": [{"record": n, "error": msg} for n, msg in list(self.errors)[-10:]],
+            }
+
+    def _format_progress(self):
+        p = self.progress()
+        return (f"Ingest {p['status']}: {p['stored']} stored, {p['failed']} failed, {p['skipped_existing']} already present; "
+                f"{p['records_per_sec']} records/s, {p['mb_per_sec']} MB/s")
+
+
+_runs = {}
+_runs_lock = threading.Lock()
+
+
+def start_ingest(manifest_path, processor, submitted_by, on_done=None, **kwargs):
+    """Run an ingestion in a background thread; returns its id for get_ingest(). on_done(ingestor) runs after it ends."""
+    ingestor = BulkIngestor(manifest_path, processor, submitted_by, **kwargs)
+    ingest_id = uuid.uuid4().hex
+
+    def _run():
+        try:
+            ingestor.run()
+        except Exception as e:
+            logger.error(f"Ingest {ingest_id} aborted: {type(e).__name__}")
+        finally:
+            if on_done is not None:
+                on_done(ingestor)
+
+    with _runs_lock:
+        _runs[ingest_id] = ingestor
+    threading.Thread(target=_run, name=f"ingest-{ingest_id[:8]}", daemon=True).start()
+    return ingest_id
+
+
+def get_ingest(ingest_id):
+    with _runs_lock:
+        return _runs.get(ingest_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-ingest studies from a JSONL or CSV manifest.")
+    parser.add_argument("manifest")
+    parser.add_argument("--storage", default="/root/MedicalReportAnalysis/secure_storage")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="default: from the file extension")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--checkpoint", help="default: <manifest>.checkpoint")
+    parser.add_argument("--no-queue", action="store_true", help="store studies without queueing analysis jobs")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from data_processing import MedicalDataProcessor
+
+    ingestor = BulkIngestor(
+        args.manifest, MedicalDataProcessor(args.storage), workers=args.workers, batch_size=args.batch_size,
+        checkpoint_path=args.checkpoint, queue_analysis=not args.no_queue, fmt=args.format,
+    )
+    if args.restart and os.path.exists(ingestor.checkpoint_path):
+        os.remove(ingestor.checkpoint_path)
+    try:
+        report = ingestor.run()
+    except KeyboardInterrupt:
+        print(f"Interrupted; resume from record {ingestor.next_record} by re-running the same command")
+        return 130
+    print(json.dumps(report, indent=2))
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
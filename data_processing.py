@@ -1,9 +1,15 @@
-import SimpleITK as sitk
 import numpy as np
 import os
 import json
 import uuid
 from utils.security import EncryptionHandler
+from utils.study_store import anonymize_patient_id
+from utils.secure_volume import write_volume, SecureVolumeReader
+from utils.dicom_utils import deidentify_image, deidentify_tree, DEIDENTIFY_WORKERS
+from volume_loader import LazyVolume, read_image, array_view
+from normalization import IntensityNormalizer, streaming_min_max
+from metrics import STORAGE_COMPRESSION_RATIO, STORAGE_CODEC_MB_PER_SEC
+from preview import PREVIEW_ENABLED, write_pyramid
 import logging
 
 logger = logging.getLogger("data_pipeline")
@@ -14,51 +20,94 @@ class MedicalDataProcessor:
         self.encryption = EncryptionHandler()
         os.makedirs(self.storage_path, exist_ok=True)
 
-    def parse_dicom_or_nifti(self, file_path):
-        """Load medical image using SimpleITK."""
+    def parse_dicom_or_nifti(self, file_path, writable=False):
+        """
+        Load a DICOM/NIfTI file or DICOM series directory using SimpleITK.
+
+        Returns (image, array). The array is a read-only, zero-copy view of
+        the image buffer that keeps the image alive; writes to it raise
+        ValueError. Pass writable=True for an independent, writable copy.
+        """
         try:
-            image = sitk.ReadImage(file_path)
-            image_array = sitk.GetArrayFromImage(image)
-            return image, image_array
+            image = read_image(file_path)
+            image_array = array_view(image)
+            return image, (image_array.copy() if writable else image_array)
         except Exception as e:
             logger.error(f"Error parsing image {file_path}: {str(e)}")
             return None, None
 
-    def normalize_image(self, image_array):
-        """Standardize image intensity values."""
-        img_min = np.min(image_array)
-        img_max = np.max(image_array)
-        if img_max - img_min == 0:
-            return image_array
-        normalized = (image_array - img_min) / (img_max - img_min)
-        return normalized.astype(np.float32)
-
-    def deidentify_dicom(self, image):
-        """Strip PHI from DICOM metadata for research."""
-        # SimpleITK image metadata handling
-        keys = image.GetMetaDataKeys()
-        # In a real scenario, we'd whitelist keys instead of just stripping all
-        # For simplicity, we create a new image without sensitive metadata
-        new_image = sitk.GetImageFromArray(sitk.GetArrayFromImage(image))
-        new_image.SetSpacing(image.GetSpacing())
-        new_image.SetOrigin(image.GetOrigin())
-        new_image.SetDirection(image.GetDirection())
-        return new_image
-
-    def secure_save_study(self, image_array, patient_metadata, study_id=None):
-        """Encrypt and save medical volume and metadata."""
+    def open_volume(self, file_path):
+        """Header-only handle that loads slices on demand (see volume_loader.LazyVolume)."""
+        try:
+            return LazyVolume(file_path)
+        except Exception as e:
+            logger.error(f"Error opening volume {file_path}: {str(e)}")
+            return None
+
+    def normalize_image(self, image_array, window=None, percentiles=None, out=None, inplace=False):
+        """
+        Standardize image intensity values to [0, 1] float32.
+
+        `window` is a CT preset name or (level, width); `percentiles` clips to
+        (lower, upper) percentiles. Work is done slab by slab into `out`, a new
+        buffer, or the input itself when `inplace=True` (see normalization.py).
+        """
+        if window is not None:
+            normalizer = IntensityNormalizer("window", window=window)
+        elif percentiles is not None:
+            normalizer = IntensityNormalizer("percentile", percentiles=percentiles)
+        else:
+            img_min, img_max = streaming_min_max(image_array)
+            if img_max - img_min == 0:
+                return image_array
+            # Reuse the range just computed instead of a second pass in normalize()
+            return IntensityNormalizer("minmax").normalize(image_array, out=out, inplace=inplace,
+                                                           bounds=(img_min, img_max))
+        return normalizer.normalize(image_array, out=out, inplace=inplace)
+
+    def deidentify_dicom(self, image, keep_tags=None):
+        """
+        Strip PHI from DICOM metadata, keeping only whitelisted tags.
+
+        Works on the image's metadata in place and returns the same image;
+        the pixel buffer is never copied (see utils/dicom_utils.py).
+        """
+        image, removed = deidentify_image(image, keep_tags)
+        logger.info(f"De-identified image: {removed} metadata keys removed")
+        return image
+
+    def deidentify_series_tree(self, src_root, dst_root, workers=None):
+        """De-identify every DICOM series directory under src_root, series in parallel."""
+        return deidentify_tree(src_root, dst_root, workers=DEIDENTIFY_WORKERS if workers is None else workers)
+
+    def secure_save_study(self, image_array, patient_metadata, study_id=None, spacing=None, rescale=None):
+        """
+        Encrypt and save medical volume and metadata.
+
+        `rescale` = (slope, intercept) lets float data that is a rescaled
+        integer grid (e.g. DICOM RescaleSlope/Intercept) be stored as integers.
+        """
         if not study_id:
             study_id = str(uuid.uuid4())
         
-        # Save image as numpy encrypted
-        img_bytes = image_array.tobytes()
-        encrypted_img = self.encryption.encrypt_data(img_bytes)
-        
         study_dir = os.path.join(self.storage_path, study_id)
         os.makedirs(study_dir, exist_ok=True)
         
-        with open(os.path.join(study_dir, "image.enc"), "wb") as f:
-            f.write(encrypted_img)
+        # Volume is written as independently encrypted slice chunks (see utils/secure_volume.py),
+        # each narrowed to a lossless storage dtype and compressed first (utils/volume_codec.py)
+        stats = write_volume(os.path.join(study_dir, "image.enc"), image_array, spacing=spacing, rescale=rescale)
+        STORAGE_COMPRESSION_RATIO.observe(stats["compression_ratio"])
+        if stats["encode_mb_per_sec"]:
+            STORAGE_CODEC_MB_PER_SEC.observe(stats["encode_mb_per_sec"], op="encode")
+        logger.info(f"Stored study {study_id}: {stats['dtype']}->{stats['storage_dtype']}, "
+                    f"ratio {stats['compression_ratio']:.2f}, encode {stats['encode_mb_per_sec']:.0f} MB/s")
+        if PREVIEW_ENABLED:
+            # Downsampled, windowed 8-bit renders so viewers never decrypt the full volume.
+            # Previews can be rebuilt later (python preview.py), so a failure here never fails the save
+            try:
+                write_pyramid(study_dir, image_array, modality=patient_metadata.get("modality"))
+            except Exception as e:
+                logger.error(f"Preview pyramid for study {study_id} failed ({type(e).__name__}); rebuild it with preview.py")
             
         # Save metadata encrypted
         meta_bytes = json.dumps(patient_metadata).encode()
@@ -69,6 +118,31 @@ class MedicalDataProcessor:
             
         return study_id
 
+    def open_study_volume(self, study_id):
+        """Open a stored volume for random-access, slice-range decryption."""
+        return SecureVolumeReader(os.path.join(self.storage_path, study_id, "image.enc"))
+
+    def study_storage_stats(self, study_id, verify_read=False):
+        """Storage dtype, codec and compression ratio of a stored volume; with verify_read, decode MB/s too."""
+        with self.open_study_volume(study_id) as reader:
+            if verify_read:
+                for _ in reader.iter_slabs():
+                    pass
+            stats = reader.storage_stats()
+        if stats["decode_mb_per_sec"]:
+            STORAGE_CODEC_MB_PER_SEC.observe(stats["decode_mb_per_sec"], op="decode")
+        return stats
+
+    def load_study_slices(self, study_id, start=0, stop=None):
+        """Decrypt only slices [start, stop) of a stored volume."""
+        with self.open_study_volume(study_id) as reader:
+            return reader.read_slices(start, stop)
+
+    def load_study_metadata(self, study_id):
+        """Decrypt the metadata saved alongside a study."""
+        with open(os.path.join(self.storage_path, study_id, "metadata.enc"), "rb") as f:
+            return json.loads(self.encryption.decrypt_data(f.read()))
+
     def ingest_demographics(self, json_data):
         """Process clinical history and demographics."""
         # Validates and maps structure
@@ -76,7 +150,7 @@ class MedicalDataProcessor:
             "age": json_data.get("age"),
             "gender": json_data.get("gender"),
             "history": json_data.get("clinical_history", ""),
-            "anonymized_id": str(uuid.uuid5(uuid.NAMESPACE_DNS, str(json_data.get("patient_id"))))
+            "anonymized_id": anonymize_patient_id(json_data.get("patient_id"))
         }
 
 if __name__ == "__main__":
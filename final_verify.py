@@ -24,7 +24,15 @@ def run_server():
 
 thread = threading.Thread(target=run_server, daemon=True)
 thread.start()
-time.sleep(7)
+
+# Wait for models to finish warming up instead of a fixed sleep
+for _ in range(240):
+    try:
+        if requests.get('https://127.0.0.1:8002/health/ready', verify=False, timeout=1).status_code == 200:
+            break
+    except requests.exceptions.ConnectionError:
+        pass
+    time.sleep(0.5)
 
 # 1. Login with HTTPS
 try:
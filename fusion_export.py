@@ -0,0 +1,231 @@
+"""
+CPU inference artifacts for MultimodalFusionEngine.
+
+Backends (FUSION_BACKEND):
+  eager        the fp32 nn.Module as defined in model_integration
+  int8         dynamic int8 quantization of every nn.Linear
+  script       traced, frozen TorchScript graph (fp32)
+  int8-script  int8 quantization, then traced and frozen (default)
+
+`python -m fusion_export --output fusion.pt` writes a TorchScript artifact
+that embeds a seeded probe batch and the eager model's risk scores for it.
+When FUSION_ARTIFACT points at such a file it is loaded at startup in
+place of the eager module, and the probe is re-scored before serving: an
+artifact whose risk scores drift more than FUSION_PARITY_ATOL from the
+eager reference is refused. Without an artifact the engine is optimized in
+process and the same parity check runs against the module it came from,
+falling back to eager if it fails.
+"""
+import os
+import json
+import hashlib
+import logging
+import argparse
+import functools
+
+logger = logging.getLogger("fusion_export")
+
+FUSION_BACKEND = os.environ.get("FUSION_BACKEND", "int8-script")
+FUSION_ARTIFACT = os.environ.get("FUSION_ARTIFACT", "")
+FUSION_WEIGHTS = os.environ.get("FUSION_WEIGHTS", "")
+FUSION_THREADS = int(os.environ.get("FUSION_THREADS", "0"))  # 0 keeps torch's default
+FUSION_PARITY_ATOL = float(os.environ.get("FUSION_PARITY_ATOL", "0.02"))
+
+BACKENDS = ("eager", "int8", "script", "int8-script")
+PROBE_BATCH = 32
+PROBE_SEED = 0
+_META_FILE = "fusion_meta.json"
+
+
+class ParityError(RuntimeError):
+    pass
+
+
+class CompiledFusionEngine:
+    """Callable stand-in for MultimodalFusionEngine backed by an optimized module."""
+    def __init__(self, module, backend, parity=None):
+        import torch
+        self.module = module
+        self.backend = backend
+        self.parity = parity or {}
+        self.device = torch.device("cpu")
+
+    def __call__(self, img_emb, text_emb):
+        return self.module(img_emb, text_emb)
+
+    def demonstrate_alignment(self):
+        from model_integration import MultimodalFusionEngine
+        return MultimodalFusionEngine.demonstrate_alignment(self)
+
+    def info(self):
+        return {"backend": self.backend, **self.parity}
+
+
+def configure_threads(threads=None):
+    import torch
+    threads = FUSION_THREADS if threads is None else threads
+    if threads > 0:
+        torch.set_num_threads(threads)
+    return torch.get_num_threads()
+
+
+def probe_inputs(batch=PROBE_BATCH, seed=PROBE_SEED, feature_dim=512, text_dim=768):
+    import torch
+    generator = torch.Generator().manual_seed(seed)
+    return (torch.randn(batch, feature_dim, generator=generator),
+            torch.randn(batch, text_dim, generator=generator))
+
+
+def build_eager(weights=None):
+    """fp32 engine in eval mode, with weights from a state_dict file when given."""
+    import torch
+    from model_integration import MultimodalFusionEngine
+    engine = MultimodalFusionEngine()
+    weights = FUSION_WEIGHTS if weights is None else weights
+    if weights:
+        engine.load_state_dict(torch.load(weights, map_location="cpu", weights_only=True))
+    return engine.eval()
+
+
+def optimize(engine, backend):
+    """Optimized copy of an eval-mode eager engine; the input module is left untouched."""
+    import torch
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown fusion backend '{backend}', expected one of {BACKENDS}")
+    module = engine
+    if backend.startswith("int8"):
+        module = torch.ao.quantization.quantize_dynamic(engine, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend.endswith("script"):
+        # Tracing records the one code path forward() takes; batch size stays dynamic
+        with torch.inference_mode(False), torch.no_grad():
+            module = torch.jit.trace(module, probe_inputs(batch=4), check_trace=False)
+            module = torch.jit.optimize_for_inference(torch.jit.freeze(module))
+    return module
+
+
+def risk_scores(module, inputs):
+    import torch
+    with torch.inference_mode():
+        return module(*inputs)[0].reshape(-1).clone()
+
+
+def check_parity(module, reference, inputs, atol=None):
+    """Max |risk - reference| over the probe batch; raises ParityError above `atol`."""
+    import torch
+    atol = FUSION_PARITY_ATOL if atol is None else atol
+    scores = risk_scores(module, inputs)
+    max_abs_diff = float((scores - torch.as_tensor(reference)).abs().max())
+    if max_abs_diff > atol:
+        raise ParityError(f"Fusion risk scores differ from eager by {max_abs_diff:.4g} (> {atol})")
+    return {"max_abs_diff": max_abs_diff, "atol": atol}
+
+
+def export(path, backend=FUSION_BACKEND, weights=None):
+    """Write a TorchScript artifact with its parity probe; returns its metadata."""
+    import torch
+    from model_integration import MultimodalFusionEngine
+    if not backend.endswith("script"):
+        raise ValueError("Only TorchScript backends ('script', 'int8-script') can be saved as artifacts")
+    eager = build_eager(weights)
+    inputs = probe_inputs()
+    reference = risk_scores(eager, inputs)
+    module = optimize(eager, backend)
+    meta = {
+        "backend": backend,
+        "model_version": MultimodalFusionEngine.MODEL_VERSION,
+        "probe_batch": PROBE_BATCH,
+        "probe_seed": PROBE_SEED,
+        "reference": reference.tolist(),
+        **check_parity(module, reference, inputs),
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    torch.jit.save(module, tmp_path, _extra_files={_META_FILE: json.dumps(meta)})
+    os.replace(tmp_path, path)
+    return meta
+
+
+def load_artifact(path):
+    import torch
+    extra = {_META_FILE: ""}
+    module = torch.jit.load(path, map_location="cpu", _extra_files=extra)
+    meta = json.loads(extra[_META_FILE])
+    inputs = probe_inputs(meta["probe_batch"], meta["probe_seed"])
+    parity = check_parity(module, meta["reference"], inputs)
+    return CompiledFusionEngine(module, meta["backend"], {"artifact": os.path.basename(path), **parity})
+
+
+def load_engine(backend=None, artifact=None):
+    """
+    The fusion engine served by this process: the configured artifact, an
+    in-process optimized engine, or the eager module (on a GPU, for
+    backend 'eager', or when the optimized engine fails its parity check).
+    """
+    import torch
+    backend = backend or FUSION_BACKEND
+    artifact = FUSION_ARTIFACT if artifact is None else artifact
+    threads = configure_threads()
+    if torch.cuda.is_available():
+        return build_eager().to("cuda")
+    if artifact:
+        engine = load_artifact(artifact)
+        logger.info(f"Loaded fusion artifact ({engine.backend}, {threads} threads, "
+                    f"max drift {engine.parity['max_abs_diff']:.2e})")
+        return engine
+    eager = build_eager()
+    if backend == "eager":
+        return eager
+    inputs = probe_inputs()
+    try:
+        module = optimize(eager, backend)
+        parity = check_parity(module, risk_scores(eager, inputs), inputs)
+    except Exception as e:
+        logger.error(f"Fusion backend '{backend}' unavailable, serving eager fp32: {e}")
+        return eager
+    logger.info(f"Fusion engine optimized in process ({backend}, {threads} threads, "
+                f"max drift {parity['max_abs_diff']:.2e})")
+    return CompiledFusionEngine(module, backend, parity)
+
+
+def _artifact_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+@functools.lru_cache(maxsize=4)
+def _fusion_version(backend, artifact, stamp):
+    from model_integration import MultimodalFusionEngine
+    if stamp is not None:
+        with open(artifact, "rb") as f:
+            return f"{MultimodalFusionEngine.MODEL_VERSION}/artifact@{hashlib.sha256(f.read()).hexdigest()[:12]}"
+    return f"{MultimodalFusionEngine.MODEL_VERSION}/{backend}"
+
+
+def fusion_version():
+    """
+    Fusion MODEL_VERSION qualified by backend (and artifact digest), for
+    result-cache keys. The digest is cached per artifact mtime and size, so
+    a re-exported artifact yields a new version without rehashing every call.
+    """
+    stamp = _artifact_stamp(FUSION_ARTIFACT) if FUSION_ARTIFACT else None
+    return _fusion_version(FUSION_BACKEND, FUSION_ARTIFACT, stamp)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the fusion engine as a CPU inference artifact")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--backend", default="int8-script", choices=("script", "int8-script"))
+    parser.add_argument("--weights", default=None, help="state_dict for MultimodalFusionEngine (default: FUSION_WEIGHTS)")
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+    configure_threads(args.threads)
+    meta = export(args.output, args.backend, args.weights)
+    print(f"Wrote {args.output} ({meta['backend']}, parity max |diff| {meta['max_abs_diff']:.2e} <= {meta['atol']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,522 @@
+"""
+Study job queue shared by every study worker, on one host or several.
+
+The StudyJob table is the coordinator: any DATABASE_URL all workers can
+reach works (PostgreSQL across hosts; a local SQLite file stands in for
+it on one machine). Workers claim jobs with a conditional UPDATE and hold
+them under a lease that a heartbeat thread extends while the pipeline
+runs. A worker that dies stops renewing; once its lease expires any
+worker returns the job to the queue, up to JOB_MAX_ATTEMPTS claims, after
+which it is failed as LeaseExpired. Lease times come from the database
+server's clock (db_utcnow), so clock skew between hosts cannot make two
+workers hold the same lease.
+
+Jobs are sharded by patient_uuid (JOB_SHARDS buckets). A worker started
+with WORKER_SHARDS only claims jobs in those shards, so one patient's
+studies are processed on the same hosts; with JOB_STEAL_AFTER_SEC set it
+also takes other shards' jobs once they have waited that long. Each
+worker records its throughput in the StudyWorker table (worker_stats()).
+"""
+import os
+import json
+import time
+import shutil
+import socket
+import signal
+import hashlib
+import logging
+import datetime
+import threading
+import multiprocessing
+
+from sqlalchemy import update, insert, or_, and_
+
+from utils.db import SessionLocal, StudyJob, StudyResult, StudyWorker, PatientStudy, init_db, db_utcnow
+from utils.security import EncryptionHandler, FERNET_KEY
+from utils.study_store import study_row, bulk_insert_studies
+
+logger = logging.getLogger("study_jobs")
+
+STUDY_WORKERS = int(os.environ.get("STUDY_WORKERS", "2"))
+JOB_POLL_INTERVAL_SEC = float(os.environ.get("JOB_POLL_INTERVAL_SEC", "1.0"))
+JOB_SHARDS = int(os.environ.get("JOB_SHARDS", "16"))
+WORKER_SHARDS = os.environ.get("WORKER_SHARDS", "")  # e.g. '0-7' or '0,2,4'; empty = all shards
+JOB_LEASE_SEC = float(os.environ.get("JOB_LEASE_SEC", "60"))
+JOB_HEARTBEAT_SEC = float(os.environ.get("JOB_HEARTBEAT_SEC", str(JOB_LEASE_SEC / 3)))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_STEAL_AFTER_SEC = float(os.environ.get("JOB_STEAL_AFTER_SEC", "0"))  # 0 = never leave own shards
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def shard_for(patient_uuid, shards=JOB_SHARDS):
+    """Stable shard of a patient; the same on every host and Python process."""
+    digest = hashlib.sha256(str(patient_uuid).encode()).digest()
+    return int.from_bytes(digest[:4], "big") % shards
+
+
+def parse_shards(value, shards=JOB_SHARDS):
+    """'0-3,8' -> (0, 1, 2, 3, 8); empty -> None (all shards)."""
+    if not value or not value.strip():
+        return None
+    owned = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        owned.update(range(int(first), int(last or first) + 1))
+    invalid = [s for s in owned if not 0 <= s < shards]
+    if invalid:
+        raise ValueError(f"Shards {sorted(invalid)} outside 0..{shards - 1}")
+    return tuple(sorted(owned))
+
+
+def enqueue_study(db, study_id, patient_uuid, file_path, encrypted_metadata, submitted_by, modality=None):
+    """Record a stored study and queue it for analysis in one transaction."""
+    db.add(PatientStudy(**study_row(study_id, patient_uuid, file_path, encrypted_metadata, modality)))
+    job = StudyJob(study_id=study_id, patient_uuid=patient_uuid, status=QUEUED, submitted_by=submitted_by,
+                   shard=shard_for(patient_uuid))
+    db.add(job)
+    db.commit()
+    return job
+
+
+def enqueue_studies(db, studies, submitted_by, store_metadata=True):
+    """
+    Bulk form of enqueue_study for ingestion: `studies` are dicts with the same
+    keyword arguments. All rows go in with two executemany INSERTs and one commit.
+    With store_metadata=False only jobs are added, for studies already stored.
+    """
+    now = datetime.datetime.utcnow()
+    study_rows, job_rows = [], []
+    for s in studies:
+        study_rows.append(study_row(s["study_id"], s["patient_uuid"], s["file_path"], s["encrypted_metadata"],
+                                    s.get("modality"), now))
+        job_rows.append({"study_id": s["study_id"], "patient_uuid": s["patient_uuid"], "status": QUEUED,
+                         "submitted_by": submitted_by, "attempts": 0, "created_at": now,
+                         "shard": shard_for(s["patient_uuid"])})
+    if store_metadata:
+        bulk_insert_studies(db, study_rows)
+    if job_rows:
+        db.execute(insert(StudyJob), job_rows)
+    db.commit()
+    return len(job_rows)
+
+
+def _next_candidate(db, shards, steal_after_sec):
+    queued = db.query(StudyJob.id).filter(StudyJob.status == QUEUED)
+    oldest = (StudyJob.created_at, StudyJob.id)
+    if shards is None:
+        return queued.order_by(*oldest).first()
+    # Rows queued before sharding have no shard; anyone may take them
+    candidate = (queued.filter(or_(StudyJob.shard.in_(shards), StudyJob.shard.is_(None)))
+                 .order_by(*oldest).first())
+    if candidate is None and steal_after_sec > 0:
+        cutoff = db_utcnow(db) - datetime.timedelta(seconds=steal_after_sec)
+        candidate = queued.filter(StudyJob.created_at <= cutoff).order_by(*oldest).first()
+    return candidate
+
+
+def claim_next_job(db, worker_id, shards=None, lease_sec=JOB_LEASE_SEC, steal_after_sec=JOB_STEAL_AFTER_SEC):
+    """
+    Atomically move the oldest queued job (within `shards`, if given) to
+    'running' for this worker, leased for `lease_sec`.
+
+    The conditional UPDATE only succeeds for one claimant, so several
+    processes can poll the same table without double-processing a study.
+    """
+    while True:
+        candidate = _next_candidate(db, shards, steal_after_sec)
+        if candidate is None:
+            return None
+        now = db_utcnow(db)
+        claimed = db.execute(
+            update(StudyJob)
+            .where(StudyJob.id == candidate.id, StudyJob.status == QUEUED)
+            .values(
+                status=RUNNING,
+                worker_id=worker_id,
+                started_at=now,
+                lease_expires_at=now + datetime.timedelta(seconds=lease_sec),
+                attempts=StudyJob.attempts + 1,
+            )
+        )
+        db.commit()
+        if claimed.rowcount == 1:
+            job = db.get(StudyJob, candidate.id)
+            # Detached, so complete_job/fail_job check ownership against this
+            # claim rather than whichever worker a later commit would reload
+            db.expunge(job)
+            return job
+
+
+def heartbeat(db, worker_id, job_id=None, lease_sec=JOB_LEASE_SEC):
+    """
+    Mark the worker alive and, with `job_id`, extend its lease on that job.
+    Returns False if the job is no longer leased to this worker.
+    """
+    now = db_utcnow(db)
+    db.execute(update(StudyWorker).where(StudyWorker.worker_id == worker_id).values(heartbeat_at=now))
+    held = True
+    if job_id is not None:
+        renewed = db.execute(
+            update(StudyJob)
+            .where(StudyJob.id == job_id, StudyJob.status == RUNNING, StudyJob.worker_id == worker_id)
+            .values(lease_expires_at=now + datetime.timedelta(seconds=lease_sec))
+        )
+        held = renewed.rowcount == 1
+    db.commit()
+    return held
+
+
+def reap_expired_leases(db, max_attempts=JOB_MAX_ATTEMPTS):
+    """
+    Requeue running jobs whose lease ran out (their worker died or hung), or
+    fail them once they have been claimed `max_attempts` times. Returns
+    (requeued, failed).
+    """
+    now = db_utcnow(db)
+    expired = (StudyJob.status == RUNNING, StudyJob.lease_expires_at < now)
+    requeued = db.execute(
+        update(StudyJob)
+        .where(*expired, StudyJob.attempts < max_attempts)
+        .values(status=QUEUED, worker_id=None, lease_expires_at=None)
+    ).rowcount
+    failed = db.execute(
+        update(StudyJob)
+        .where(*expired, StudyJob.attempts >= max_attempts)
+        .values(status=FAILED, finished_at=now, lease_expires_at=None, error="LeaseExpired")
+    ).rowcount
+    db.commit()
+    return requeued, failed
+
+
+def complete_job(db, job, result):
+    """
+    Store the encrypted result. Dropped if the study was deleted meanwhile
+    or the lease was lost and the job handed to another worker; returns
+    whether it was stored.
+    """
+    finished = db.execute(
+        update(StudyJob)
+        .where(StudyJob.id == job.id, StudyJob.status == RUNNING, StudyJob.worker_id == job.worker_id)
+        .values(status=COMPLETED, finished_at=db_utcnow(db), lease_expires_at=None)
+    )
+    if finished.rowcount == 1:
+        db.add(StudyResult(
+            study_id=job.study_id,
+            result_json=EncryptionHandler.encrypt_data(json.dumps(result).encode()),
+        ))
+    db.commit()
+    return finished.rowcount == 1
+
+
+def fail_job(db, job, error):
+    """Mark the job failed; returns False if this worker no longer held it."""
+    failed = db.execute(
+        update(StudyJob)
+        .where(StudyJob.id == job.id, StudyJob.status == RUNNING, StudyJob.worker_id == job.worker_id)
+        .values(status=FAILED, finished_at=db_utcnow(db), lease_expires_at=None,
+                error=type(error).__name__)
+    )
+    db.commit()
+    return failed.rowcount == 1
+
+
+def register_worker(db, worker_id, shards=None):
+    """(Re)create this worker's StudyWorker row; a reused host:pid starts from zero."""
+    now = db_utcnow(db)
+    row = db.query(StudyWorker).filter(StudyWorker.worker_id == worker_id).first()
+    if row is None:
+        row = StudyWorker(worker_id=worker_id)
+        db.add(row)
+    row.host = worker_id.rpartition(":")[0]
+    row.shards = ",".join(map(str, shards)) if shards else ""
+    row.status = RUNNING
+    row.started_at = row.heartbeat_at = now
+    row.jobs_completed = row.jobs_failed = 0
+    row.busy_seconds = 0.0
+    db.commit()
+
+
+def record_worker_job(db, worker_id, outcome, seconds):
+    """
+    Add one job's busy time to the worker and count it under `outcome`
+    (COMPLETED or FAILED); None counts the time only, for a job whose
+    lease was lost and whose outcome was discarded.
+    """
+    values = {StudyWorker.busy_seconds: StudyWorker.busy_seconds + seconds, StudyWorker.heartbeat_at: db_utcnow(db)}
+    if outcome is not None:
+        counter = StudyWorker.jobs_completed if outcome == COMPLETED else StudyWorker.jobs_failed
+        values[counter] = counter + 1
+    db.execute(update(StudyWorker).where(StudyWorker.worker_id == worker_id).values(values))
+    db.commit()
+
+
+def stop_worker(db, worker_id):
+    db.execute(update(StudyWorker).where(StudyWorker.worker_id == worker_id).values(status="stopped"))
+    db.commit()
+
+
+def worker_stats(db, since_sec=3600, lease_sec=JOB_LEASE_SEC):
+    """
+    Throughput of every worker seen in the last `since_sec`: studies per
+    minute of uptime, utilization (busy / uptime) and liveness (a heartbeat
+    within one lease).
+    """
+    now = db_utcnow(db)
+    rows = (db.query(StudyWorker)
+            .filter(StudyWorker.heartbeat_at >= now - datetime.timedelta(seconds=since_sec))
+            .order_by(StudyWorker.host, StudyWorker.worker_id)
+            .all())
+    stats = []
+    for row in rows:
+        # At least a second, so a worker that died right after starting does not report a huge rate
+        uptime = max((row.heartbeat_at - row.started_at).total_seconds(), 1.0)
+        stats.append({
+            "worker_id": row.worker_id,
+            "host": row.host,
+            "shards": row.shards or "all",
+            "status": row.status,
+            "alive": row.status == RUNNING and (now - row.heartbeat_at).total_seconds() <= lease_sec,
+            "jobs_completed": row.jobs_completed,
+            "jobs_failed": row.jobs_failed,
+            "uptime_sec": round(uptime, 1),
+            "studies_per_min": round(row.jobs_completed * 60.0 / uptime, 3),
+            "utilization": round(min(row.busy_seconds / uptime, 1.0), 3),
+        })
+    return stats
+
+
+def get_study_status(db, study_id):
+    """Job status plus decrypted results once completed, or None if unknown."""
+    job = db.query(StudyJob).filter(StudyJob.study_id == study_id).first()
+    if job is None:
+        return None
+    response = {
+        "study_id": job.study_id,
+        "status": job.status,
+        "submitted_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == COMPLETED:
+        row = db.query(StudyResult).filter(StudyResult.study_id == study_id).first()
+        if row is not None:
+            response["results"] = json.loads(EncryptionHandler.decrypt_data(row.result_json))
+    elif job.status == FAILED:
+        response["error"] = job.error
+    return response
+
+
+def delete_study(db, study_id, storage_path):
+    """Erase a study's files, results, job and metadata rows. Returns False if unknown."""
+    job = db.query(StudyJob).filter(StudyJob.study_id == study_id).first()
+    if job is None:
+        return False
+    study_dir = os.path.join(storage_path, study_id)
+    db.query(StudyResult).filter(StudyResult.study_id == study_id).delete()
+    # Rows written before study_id existed only carry their directory
+    db.query(PatientStudy).filter(or_(
+        PatientStudy.study_id == study_id,
+        and_(PatientStudy.study_id.is_(None), PatientStudy.file_path == study_dir),
+    )).delete(synchronize_session=False)
+    db.delete(job)
+    db.commit()
+    shutil.rmtree(study_dir, ignore_errors=True)
+    return True
+
+
+def requeue_orphaned_jobs(db):
+    """
+    Return 'running' jobs whose worker process on this host no longer exists
+    to the queue without waiting for their lease to expire.
+    """
+    host = socket.gethostname()
+    requeued = 0
+    for job in db.query(StudyJob).filter(StudyJob.status == RUNNING).all():
+        worker_host, _, pid = (job.worker_id or "").rpartition(":")
+        if worker_host != host or not pid.isdigit():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            job.status = QUEUED
+            job.worker_id = None
+            job.lease_expires_at = None
+            requeued += 1
+        except PermissionError:
+            pass
+    db.commit()
+    return requeued
+
+
+def run_job(job, processor, pipeline):
+    study_dir = os.path.join(processor.storage_path, job.study_id)
+    metadata = processor.load_study_metadata(job.study_id)
+    result = pipeline(study_dir, metadata.get("history", ""))
+    result["study_id"] = job.study_id
+    return result
+
+
+class LeaseHeartbeat:
+    """Background thread that keeps a claimed job's lease alive while it runs."""
+    def __init__(self, job_id, worker_id, interval=JOB_HEARTBEAT_SEC, lease_sec=JOB_LEASE_SEC):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self.lease_sec = lease_sec
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{job_id}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with SessionLocal() as db:
+                    held = heartbeat(db, self.worker_id, self.job_id, self.lease_sec)
+            except Exception as e:
+                # A missed beat is fine; the lease outlasts several intervals
+                logger.warning(f"Heartbeat for study job {self.job_id} failed: {type(e).__name__}")
+                continue
+            if not held:
+                self.lost = True
+                logger.warning(f"Lease on study job {self.job_id} lost; its result will be discarded")
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def worker_loop(stop_event, poll_interval=JOB_POLL_INTERVAL_SEC, shards=None, pipeline=None):
+    """Claim and process queued studies (within `shards`, if given) until stop_event is set."""
+    # Heavy imports happen here, inside the worker process
+    from model_registry import get_model
+    if pipeline is None:
+        from solver import run_diagnostic_pipeline as pipeline
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    processor = get_model("processor")
+    with SessionLocal() as db:
+        register_worker(db, worker_id, shards)
+    logger.info(f"Study worker {worker_id} started (shards: {shards or 'all'})")
+    last_beat = 0.0
+    try:
+        while not stop_event.is_set():
+            db = SessionLocal()
+            try:
+                if time.monotonic() - last_beat >= JOB_HEARTBEAT_SEC:
+                    # Every live worker also reaps, so a dead host's jobs come back without a supervisor
+                    heartbeat(db, worker_id)
+                    requeued, failed = reap_expired_leases(db)
+                    if requeued or failed:
+                        logger.warning(f"Expired leases: requeued {requeued}, failed {failed} study jobs")
+                    last_beat = time.monotonic()
+                job = claim_next_job(db, worker_id, shards)
+                if job is None:
+                    stop_event.wait(poll_interval)
+                    continue
+                started = time.perf_counter()
+                with LeaseHeartbeat(job.id, worker_id):
+                    try:
+                        result = run_job(job, processor, pipeline)
+                    except Exception as e:
+                        logger.error(f"Study job {job.id} failed: {type(e).__name__}")
+                        outcome = FAILED if fail_job(db, job, e) else None
+                    else:
+                        outcome = COMPLETED if complete_job(db, job, result) else None
+                if outcome is None:
+                    logger.warning(f"Study job {job.id} finished after its lease was lost; outcome discarded")
+                record_worker_job(db, worker_id, outcome, time.perf_counter() - started)
+            finally:
+                db.close()
+    finally:
+        with SessionLocal() as db:
+            stop_worker(db, worker_id)
+
+
+class StudyWorkerPool:
+    """N worker processes on this host draining the shared study job table."""
+    def __init__(self, workers=STUDY_WORKERS, poll_interval=JOB_POLL_INTERVAL_SEC, shards=WORKER_SHARDS):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.shards = parse_shards(shards) if isinstance(shards, str) else shards
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stop = None
+        self._procs = []
+
+    def start(self):
+        if self._procs or self.workers <= 0:
+            return
+        # Spawned workers re-import utils.security; they must share this process's key
+        os.environ.setdefault("FERNET_KEY", FERNET_KEY)
+        init_db()
+        db = SessionLocal()
+        try:
+            requeued = requeue_orphaned_jobs(db)
+            expired, failed = reap_expired_leases(db)
+        finally:
+            db.close()
+        if requeued or expired:
+            logger.info(f"Requeued {requeued} orphaned and {expired} expired study jobs")
+        if failed:
+            logger.warning(f"Failed {failed} study jobs after {JOB_MAX_ATTEMPTS} expired leases")
+        self._stop = self._ctx.Event()
+        for _ in range(self.workers):
+            proc = self._ctx.Process(target=worker_loop, args=(self._stop, self.poll_interval, self.shards),
+                                     daemon=True)
+            proc.start()
+            self._procs.append(proc)
+
+    def stop(self, timeout=30.0):
+        if not self._procs:
+            return
+        self._stop.set()
+        deadline = time.time() + timeout
+        for proc in self._procs:
+            proc.join(max(0.0, deadline - time.time()))
+            if proc.is_alive():
+                proc.terminate()
+        self._procs = []
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "alive": sum(p.is_alive() for p in self._procs),
+            "shards": ",".join(map(str, self.shards)) if self.shards else "all",
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run study workers against the metadata database.")
+    parser.add_argument("--workers", type=int, default=STUDY_WORKERS)
+    parser.add_argument("--shards", default=WORKER_SHARDS,
+                        help=f"shards this host claims, e.g. '0-7' (of {JOB_SHARDS}); default all")
+    parser.add_argument("--stats", action="store_true", help="print per-worker throughput and exit")
+    args = parser.parse_args()
+
+    if args.stats:
+        init_db()
+        with SessionLocal() as db:
+            print(json.dumps(worker_stats(db), indent=2))
+        raise SystemExit(0)
+
+    pool = StudyWorkerPool(workers=args.workers, shards=args.shards)
+    pool.start()
+    print(f"Started {args.workers} study workers on shards {pool.stats()['shards']}. Ctrl-C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
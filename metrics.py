@@ -0,0 +1,312 @@
+"""
+In-process metrics with Prometheus text exposition, and sampled profiling.
+
+Histograms keep cumulative buckets (for Prometheus) plus a sliding window
+of recent samples, from which p50/p95/p99 are reported as a companion
+summary family. Callback families are read at scrape time from the
+components that already keep their own counters (pipeline pool, result
+cache, fusion batcher, audit sink, job table).
+
+Pipeline stages are timed with StageTimings inside run_diagnostic_pipeline
+and returned with its result, so they are recorded in the API process no
+matter which executor (thread or spawned process) ran the pipeline.
+
+Label values are route templates, stage names and fixed enums only, never
+study ids, file names or any other request content.
+"""
+import os
+import time
+import uuid
+import random
+import bisect
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger("metrics")
+
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "cprofile")  # 'cprofile' or 'torch'
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/root/MedicalReportAnalysis/profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "200"))
+METRICS_WINDOW = int(os.environ.get("METRICS_WINDOW", "1024"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.label_names), 0)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.label_names, key)))} {_format_value(value)}")
+        return lines
+
+
+class _Series:
+    __slots__ = ("buckets", "count", "sum", "window")
+
+    def __init__(self, n_buckets, window):
+        self.buckets = [0] * n_buckets
+        self.count = 0
+        self.sum = 0.0
+        self.window = deque(maxlen=window)
+
+
+class Histogram:
+    """Cumulative buckets plus p50/p95/p99 over the last `window` observations per label set."""
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS, window=METRICS_WINDOW):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.bounds = tuple(sorted(buckets))
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.bounds), self.window)
+            index = bisect.bisect_left(self.bounds, value)
+            if index < len(self.bounds):
+                series.buckets[index] += 1
+            series.count += 1
+            series.sum += value
+            series.window.append(value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def quantiles(self, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            recent = sorted(series.window) if series else []
+        return {q: recent[min(len(recent) - 1, int(q * len(recent)))] for q in QUANTILES} if recent else {}
+
+    def summary(self):
+        """{label values: {count, sum, p50, p95, p99}} for JSON status endpoints."""
+        with self._lock:
+            keys = list(self._series)
+        out = {}
+        for key in keys:
+            labels = dict(zip(self.label_names, key))
+            series = self._series[key]
+            entry = {"count": series.count, "sum": round(series.sum, 6)}
+            entry.update({f"p{int(q * 100)}": round(v, 6) for q, v in self.quantiles(**labels).items()})
+            out["/".join(key) or "all"] = entry
+        return out
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        quantile_lines = [f"# HELP {self.name}_recent {self.help} (last {self.window} observations)",
+                          f"# TYPE {self.name}_recent summary"]
+        with self._lock:
+            snapshot = [(key, list(s.buckets), s.count, s.sum, sorted(s.window)) for key, s in sorted(self._series.items())]
+        for key, buckets, count, total, recent in snapshot:
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, n in zip(self.bounds, buckets):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(float(bound))})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+            for q in QUANTILES:
+                if recent:
+                    value = recent[min(len(recent) - 1, int(q * len(recent)))]
+                    quantile_lines.append(f"{self.name}_recent{_format_labels({**labels, 'quantile': str(q)})} {_format_value(value)}")
+            quantile_lines.append(f"{self.name}_recent_sum{_format_labels(labels)} {_format_value(float(sum(recent)))}")
+            quantile_lines.append(f"{self.name}_recent_count{_format_labels(labels)} {len(recent)}")
+        return lines + quantile_lines
+
+
+class CallbackFamily:
+    """Values read at scrape time: `fn()` returns [(labels dict, value), ...]."""
+    def __init__(self, name, help_text, fn, kind="gauge"):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.kind = kind
+
+    def expose(self):
+        try:
+            samples = self.fn()
+        except Exception as e:
+            logger.warning(f"Metric {self.name} unavailable: {type(e).__name__}")
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in samples:
+            if value is not None:
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _add(self, family):
+        with self._lock:
+            existing = self._families.get(family.name)
+            if existing is not None:
+                return existing
+            self._families[family.name] = family
+            return family
+
+    def counter(self, name, help_text, label_names=()):
+        return self._add(Counter(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, label_names, buckets))
+
+    def callback(self, name, help_text, fn, kind="gauge"):
+        """Register (or replace) a scrape-time family."""
+        with self._lock:
+            self._families[name] = CallbackFamily(name, help_text, fn, kind)
+
+    def render(self):
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            lines.extend(family.expose())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+PIPELINE_STAGE_SECONDS = metrics.histogram(
+    "pipeline_stage_seconds", "Diagnostic pipeline time per stage", ("stage",))
+PIPELINE_SECONDS = metrics.histogram("pipeline_seconds", "End-to-end diagnostic pipeline time")
+PIPELINE_ERRORS = metrics.counter("pipeline_errors_total", "Pipeline runs that raised, by failing stage", ("stage",))
+HTTP_REQUESTS = metrics.counter("http_requests_total", "HTTP requests by route template and status", ("route", "status"))
+HTTP_REQUEST_SECONDS = metrics.histogram("http_request_seconds", "HTTP request latency by route template", ("route",))
+STORAGE_COMPRESSION_RATIO = metrics.histogram(
+    "storage_compression_ratio", "Raw volume bytes / stored bytes per saved study",
+    buckets=(1.0, 1.25, 1.5, 2.0, 2.5, 3.0, 4.0, 6.0, 8.0, 12.0, 16.0))
+STORAGE_CODEC_MB_PER_SEC = metrics.histogram(
+    "storage_codec_mb_per_sec", "Volume codec throughput per study (MB of raw voxels per CPU second)", ("op",),
+    buckets=(25, 50, 100, 200, 400, 800, 1600, 3200))
+
+
+class StageTimings:
+    """Wall time per named stage for one pipeline run; the failing stage is tagged on the exception."""
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            # Survives pickling back from a process pool (exception __dict__ is preserved)
+            if not hasattr(e, "pipeline_stage"):
+                e.pipeline_stage = name
+            raise
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+
+    def as_dict(self):
+        return {name: round(sec, 6) for name, sec in self.seconds.items()}
+
+
+def record_stage_timings(stage_seconds, total_seconds=None):
+    for stage, seconds in stage_seconds.items():
+        PIPELINE_STAGE_SECONDS.observe(seconds, stage=stage)
+    if total_seconds is not None:
+        PIPELINE_SECONDS.observe(total_seconds)
+
+
+def record_pipeline_error(error):
+    PIPELINE_ERRORS.inc(stage=getattr(error, "pipeline_stage", "unknown"))
+
+
+def _prune_profiles(directory, keep):
+    try:
+        entries = sorted((e for e in os.scandir(directory) if e.is_file()), key=lambda e: e.stat().st_mtime)
+    except FileNotFoundError:
+        return
+    for entry in entries[:max(0, len(entries) - keep)]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def sampled_profile(kind, sample_rate=None, mode=None, directory=None):
+    """
+    Profile the enclosed block for a random `sample_rate` fraction of calls.
+
+    Traces are named only by `kind`, a timestamp and a random id; they hold
+    code locations (cProfile) or operator names and tensor shapes (torch),
+    never arguments or data, so they carry no PHI. Yields the output path,
+    or None when this call is not sampled.
+    """
+    sample_rate = PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if sample_rate <= 0 or random.random() >= sample_rate:
+        yield None
+        return
+    mode = mode or PROFILE_MODE
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"{kind}-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}")
+    if mode == "torch":
+        import torch
+        path = stem + ".trace.json"
+        with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True) as prof:
+            yield path
+        prof.export_chrome_trace(path)
+    else:
+        import cProfile
+        path = stem + ".prof"
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    _prune_profiles(directory, PROFILE_MAX_FILES)
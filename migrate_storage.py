@@ -0,0 +1,76 @@
+"""
+Convert legacy whole-blob Fernet `image.enc` files to the chunked volume format.
+
+The legacy format stored only raw `tobytes()` output, so the dtype and the
+in-plane slice shape must be supplied; the slice count is inferred from the
+decrypted size. Files already in the chunked format are skipped, and each
+conversion is written to a temp file and swapped in atomically.
+
+Usage:
+    python migrate_storage.py [--storage PATH] [--dtype float32] [--slice-shape 512,512] [--dry-run]
+"""
+import os
+import sys
+import shutil
+import argparse
+import logging
+
+import numpy as np
+
+from utils.security import EncryptionHandler
+from utils.secure_volume import is_chunked_volume, write_volume
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("storage_migration")
+
+
+def migrate_study(study_dir, dtype, slice_shape, dry_run=False, keep_legacy=False):
+    """Returns 'migrated', 'skipped' or raises on undecodable input."""
+    path = os.path.join(study_dir, "image.enc")
+    if not os.path.exists(path) or is_chunked_volume(path):
+        return "skipped"
+    with open(path, "rb") as f:
+        raw = EncryptionHandler.decrypt_data(f.read())
+    slice_items = int(np.prod(slice_shape))
+    item_count, remainder = divmod(len(raw), dtype.itemsize)
+    if remainder or item_count % slice_items:
+        raise ValueError(f"{len(raw)} bytes is not a whole number of {slice_shape} {dtype} slices")
+    volume = np.frombuffer(raw, dtype=dtype).reshape((item_count // slice_items,) + tuple(slice_shape))
+    if dry_run:
+        return "migrated"
+    if keep_legacy:
+        shutil.copy2(path, path + ".legacy")
+    write_volume(path, volume)
+    return "migrated"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate secure_storage volumes to the chunked format.")
+    parser.add_argument("--storage", default="/root/MedicalReportAnalysis/secure_storage")
+    parser.add_argument("--dtype", default="float32", help="dtype the legacy volumes were saved with")
+    parser.add_argument("--slice-shape", default="512,512", help="in-plane shape, e.g. 512,512")
+    parser.add_argument("--dry-run", action="store_true", help="decrypt and validate only")
+    parser.add_argument("--keep-legacy", action="store_true", help="keep the old file as image.enc.legacy")
+    args = parser.parse_args(argv)
+
+    dtype = np.dtype(args.dtype)
+    slice_shape = tuple(int(d) for d in args.slice_shape.split(","))
+    counts = {"migrated": 0, "skipped": 0, "failed": 0}
+    for study_id in sorted(os.listdir(args.storage)):
+        study_dir = os.path.join(args.storage, study_id)
+        if not os.path.isdir(study_dir):
+            continue
+        try:
+            outcome = migrate_study(study_dir, dtype, slice_shape, args.dry_run, args.keep_legacy)
+        except Exception as e:
+            # Exception text can carry decrypted sizes but never pixel or patient data
+            logger.error(f"{study_id}: {type(e).__name__}: {e}")
+            outcome = "failed"
+        counts[outcome] += 1
+        logger.info(f"{study_id}: {outcome}")
+    print(f"Migration {'dry run ' if args.dry_run else ''}complete: {counts}")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import os
+import time
+import threading
+import logging
+
+logger = logging.getLogger("model_registry")
+
+
+def _current_rss_bytes():
+    """Resident set size of this process, or 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _module_bytes(model):
+    """Parameter + buffer bytes for torch modules, None for anything else."""
+    if not hasattr(model, "parameters") or not hasattr(model, "buffers"):
+        return None
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of pipeline components.
+
+    Each component is built once by its factory and then shared by every
+    request. Loading is guarded by a per-name lock so concurrent first calls
+    build a component only once; reloads build the replacement outside the
+    lock and swap it in, so in-flight requests keep the instance they hold.
+    """
+    def __init__(self):
+        self._factories = {}
+        self._models = {}
+        self._stats = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+
+    def register(self, name, factory):
+        """Register a zero-argument factory under `name` (replaces any prior one)."""
+        with self._registry_lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+            self._models.pop(name, None)
+            self._stats.pop(name, None)
+
+    def names(self):
+        return list(self._factories)
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def _build(self, name):
+        factory = self._factories[name]
+        rss_before = _current_rss_bytes()
+        start = time.perf_counter()
+        model = factory()
+        load_sec = time.perf_counter() - start
+        param_bytes = _module_bytes(model)
+        rss_delta = max(0, _current_rss_bytes() - rss_before)
+        stats = {
+            "load_sec": load_sec,
+            "memory_bytes": param_bytes if param_bytes is not None else rss_delta,
+            "rss_delta_bytes": rss_delta,
+            "loaded_at": time.time(),
+        }
+        logger.info(f"Loaded model '{name}' in {load_sec:.3f}s ({stats['memory_bytes']} bytes)")
+        return model, stats
+
+    def get(self, name):
+        """Return the shared instance for `name`, loading it on first use."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self._factories:
+            raise KeyError(f"No model registered under '{name}'")
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is None:
+                model, stats = self._build(name)
+                self._stats[name] = stats
+                self._models[name] = model
+        return model
+
+    def warm_up(self, names=None):
+        """Eagerly load the given components (all registered ones by default)."""
+        for name in names or self.names():
+            self.get(name)
+        return self.stats()
+
+    def reload(self, name=None):
+        """Rebuild one component (or all) and atomically replace the cached instance."""
+        targets = [name] if name else self.names()
+        for target in targets:
+            if target not in self._factories:
+                raise KeyError(f"No model registered under '{target}'")
+            model, stats = self._build(target)
+            with self._locks[target]:
+                self._models[target] = model
+                self._stats[target] = stats
+        return self.stats()
+
+    def stats(self):
+        """Per-component load time and memory footprint for loaded models."""
+        return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+def _build_processor():
+    from data_processing import MedicalDataProcessor
+    return MedicalDataProcessor()
+
+
+def _build_medsam():
+    from model_integration import MedSAMIntegrator
+    return MedSAMIntegrator()
+
+
+def _build_radbert():
+    from model_integration import RadBERTIntegrator
+    return RadBERTIntegrator()
+
+
+def _build_fusion():
+    # Quantized / TorchScript engine on CPU (see fusion_export), eager fp32 on GPU
+    from fusion_export import load_engine, _fusion_version
+    # A reload may pick up a re-exported artifact; its version must be re-derived
+    _fusion_version.cache_clear()
+    return load_engine()
+
+
+registry = ModelRegistry()
+registry.register("processor", _build_processor)
+registry.register("medsam", _build_medsam)
+registry.register("radbert", _build_radbert)
+registry.register("fusion", _build_fusion)
+
+
+def get_model(name):
+    return registry.get(name)
+
+
+if __name__ == "__main__":
+    for name, stats in registry.warm_up().items():
+        print(f"{name}: {stats['load_sec']:.3f}s, {stats['memory_bytes'] / 1e6:.1f} MB")
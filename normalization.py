@@ -0,0 +1,149 @@
+import numpy as np
+
+# CT window presets as (level, width) in Hounsfield units
+WINDOW_PRESETS = {
+    "brain": (40, 80),
+    "subdural": (75, 215),
+    "stroke": (40, 40),
+    "lung": (-600, 1500),
+    "mediastinum": (50, 350),
+    "abdomen": (40, 400),
+    "liver": (60, 160),
+    "bone": (400, 1800),
+}
+
+SLAB_TARGET_BYTES = 1024 * 1024
+
+
+def _slab_size(volume, target_bytes=SLAB_TARGET_BYTES):
+    shape = volume.shape
+    slice_items = int(np.prod(shape[1:], dtype=np.int64)) if len(shape) > 1 else 1
+    return max(1, target_bytes // max(1, slice_items * np.dtype(volume.dtype).itemsize))
+
+
+def iter_slabs(volume, slab_size=None):
+    """Yield (start, slab) along axis 0 for ndarrays and LazyVolume-like objects."""
+    slab_size = slab_size or _slab_size(volume)
+    if hasattr(volume, "iter_slabs"):
+        yield from volume.iter_slabs(slab_size)
+        return
+    if np.ndim(volume) == 0:
+        yield 0, np.reshape(volume, (1,))
+        return
+    for start in range(0, volume.shape[0], slab_size):
+        yield start, volume[start:start + slab_size]
+
+
+def streaming_min_max(volume, slab_size=None, finite=False):
+    """Global (min, max) from a single pass over cache-sized slabs; with finite=True NaN/inf are skipped."""
+    lo, hi = None, None
+    for _, slab in iter_slabs(volume, slab_size):
+        if finite and slab.dtype.kind == "f":
+            slab = slab[np.isfinite(slab)]
+        if slab.size == 0:
+            continue
+        s_lo, s_hi = slab.min(), slab.max()
+        lo = s_lo if lo is None or s_lo < lo else lo
+        hi = s_hi if hi is None or s_hi > hi else hi
+    return lo, hi
+
+
+def streaming_percentiles(volume, lower, upper, bins=4096, slab_size=None):
+    """
+    (lower, upper) percentile bounds without sorting or copying the volume.
+
+    8/16-bit integer volumes are exact and take one pass (a full-range
+    bincount). Other dtypes take a min/max pass followed by a histogram
+    pass, and are accurate to one bin width. NaN and inf are left out, so
+    the bounds are finite (None, None when there are no finite values).
+    """
+    dtype = np.dtype(volume.dtype)
+    if dtype.kind in "iu" and dtype.itemsize <= 2:
+        offset = int(np.iinfo(dtype).min)
+        counts = np.zeros(1 << (8 * dtype.itemsize), dtype=np.int64)
+        for _, slab in iter_slabs(volume, slab_size):
+            counts += np.bincount((slab.ravel().astype(np.int32) - offset), minlength=counts.size)
+        edges = np.arange(counts.size, dtype=np.float64) + offset
+        return _histogram_quantiles(counts, edges, edges, lower, upper)
+
+    lo, hi = streaming_min_max(volume, slab_size, finite=True)
+    if lo is None or lo == hi:
+        return lo, hi
+    counts = np.zeros(bins, dtype=np.int64)
+    for _, slab in iter_slabs(volume, slab_size):
+        counts += np.histogram(slab, bins=bins, range=(float(lo), float(hi)))[0]
+    edges = np.linspace(float(lo), float(hi), bins + 1)
+    return _histogram_quantiles(counts, edges[:-1], edges[1:], lower, upper)
+
+
+def _histogram_quantiles(counts, left_edges, right_edges, lower, upper):
+    cdf = np.cumsum(counts)
+    total = cdf[-1]
+    lo_idx = int(np.searchsorted(cdf, total * lower / 100.0, side="left"))
+    hi_idx = int(np.searchsorted(cdf, total * upper / 100.0, side="left"))
+    return float(left_edges[min(lo_idx, len(left_edges) - 1)]), float(right_edges[min(hi_idx, len(right_edges) - 1)])
+
+
+class IntensityNormalizer:
+    """
+    Rescales intensities to [0, 1] float32, slab by slab.
+
+    Modes:
+      - "minmax": full intensity range (one streaming statistics pass)
+      - "window": CT window/level, either a WINDOW_PRESETS name or (level, width)
+      - "percentile": clip to (lower, upper) percentiles, e.g. (0.5, 99.5)
+
+    Each slab is converted to float32 directly into its slice of the output,
+    so no full-size float64 or float32 temporaries are allocated. With
+    `inplace=True` a float32 input is overwritten; with `out=` the caller
+    supplies the destination buffer.
+    """
+    def __init__(self, mode="minmax", window=None, percentiles=(0.5, 99.5), slab_size=None):
+        if mode not in ("minmax", "window", "percentile"):
+            raise ValueError(f"Unknown normalization mode: {mode}")
+        if mode == "window":
+            if isinstance(window, str):
+                if window not in WINDOW_PRESETS:
+                    raise ValueError(f"Unknown window preset: {window}")
+                window = WINDOW_PRESETS[window]
+            if window is None or len(window) != 2 or window[1] <= 0:
+                raise ValueError("Window mode needs a preset name or (level, width) with width > 0")
+        self.mode = mode
+        self.window = window
+        self.percentiles = percentiles
+        self.slab_size = slab_size
+
+    def bounds(self, volume):
+        """Intensity range mapped onto [0, 1]."""
+        if self.mode == "window":
+            level, width = self.window
+            return level - width / 2.0, level + width / 2.0
+        if self.mode == "percentile":
+            return streaming_percentiles(volume, *self.percentiles, slab_size=self.slab_size)
+        return streaming_min_max(volume, self.slab_size)
+
+    def normalize(self, volume, out=None, inplace=False, bounds=None):
+        """`bounds` = (lo, hi) already computed by the caller skips the statistics pass."""
+        lo, hi = self.bounds(volume) if bounds is None else bounds
+        if inplace:
+            if not isinstance(volume, np.ndarray) or volume.dtype != np.float32 or not volume.flags.writeable:
+                raise ValueError("In-place normalization needs a writable float32 ndarray")
+            out = volume
+        elif out is None:
+            out = np.empty(volume.shape, dtype=np.float32)
+        elif out.shape != tuple(volume.shape) or out.dtype != np.float32:
+            raise ValueError(f"out must be float32 with shape {tuple(volume.shape)}")
+
+        flat_out = out.reshape((1,)) if out.ndim == 0 else out
+        if lo is None or hi == lo:
+            flat_out[...] = 0.0
+            return out
+        lo, rng = float(lo), float(hi) - float(lo)
+        clip = self.mode != "minmax"
+        for start, slab in iter_slabs(volume, self.slab_size):
+            dest = flat_out[start:start + slab.shape[0]]
+            np.subtract(slab, lo, out=dest, casting="unsafe")
+            np.divide(dest, rng, out=dest)
+            if clip:
+                np.clip(dest, 0.0, 1.0, out=dest)
+        return out
@@ -0,0 +1,239 @@
+"""
+Encrypted multi-resolution preview pyramid stored next to each study.
+
+For every render window the pyramid holds 8-bit slices at several in-plane
+resolutions: level 0 is the volume block-averaged down to at most
+PREVIEW_MAX_SIZE pixels on its longer edge, and every further level halves
+it until the slice fits PREVIEW_THUMB_SIZE (the per-slice thumbnail).
+Slices are never dropped, only shrunk in-plane.
+
+Each (window, level) is a chunked encrypted volume (utils/secure_volume.py)
+with one slice per chunk, so serving a preview decrypts one small chunk
+instead of the full study. CT studies get the PREVIEW_CT_WINDOWS presets;
+other modalities one "auto" window from the 0.5-99.5 percentile range.
+
+Layout: <study_dir>/preview/<window>_L<level>.enc
+
+Usage (pyramids for studies stored before previews existed):
+    python preview.py [--storage PATH]
+"""
+import os
+import re
+import struct
+import zlib
+import hashlib
+import logging
+
+import numpy as np
+
+from normalization import WINDOW_PRESETS, iter_slabs, streaming_percentiles
+from utils.secure_volume import VolumeWriter, SecureVolumeReader
+
+logger = logging.getLogger("preview")
+
+PREVIEW_ENABLED = os.environ.get("PREVIEW_ENABLED", "1") == "1"
+PREVIEW_MAX_SIZE = int(os.environ.get("PREVIEW_MAX_SIZE", "256"))
+PREVIEW_THUMB_SIZE = int(os.environ.get("PREVIEW_THUMB_SIZE", "64"))
+PREVIEW_CACHE_MAX_AGE = int(os.environ.get("PREVIEW_CACHE_MAX_AGE", "3600"))
+PREVIEW_CT_WINDOWS = tuple(w.strip() for w in os.environ.get("PREVIEW_CT_WINDOWS", "mediastinum,lung,bone").split(",") if w.strip())
+
+PREVIEW_DIR = "preview"
+AUTO_WINDOW = "auto"
+_FILE_PATTERN = re.compile(r"^([a-z_]+)_L(\d+)\.enc$")
+
+
+class PreviewNotFound(Exception):
+    """No pyramid, or no such window/level/slice, for a study."""
+
+
+def level_shapes(height, width, max_size=PREVIEW_MAX_SIZE, thumb_size=PREVIEW_THUMB_SIZE):
+    """[(factor, h, w), ...] from level 0 down to the thumbnail level."""
+    factor = max(1, -(-max(height, width) // max_size))
+    levels = []
+    while True:
+        h, w = -(-height // factor), -(-width // factor)
+        levels.append((factor, h, w))
+        if max(h, w) <= thumb_size or (h == 1 and w == 1):
+            return levels
+        factor *= 2
+
+
+def block_mean(slab, factor):
+    """(n, H, W) -> (n, ceil(H/f), ceil(W/f)) area average; edges are padded by replication."""
+    if factor == 1:
+        return slab.astype(np.float32, copy=False)
+    n, height, width = slab.shape
+    pad_h, pad_w = -height % factor, -width % factor
+    if pad_h or pad_w:
+        slab = np.pad(slab, ((0, 0), (0, pad_h), (0, pad_w)), mode="edge")
+    blocks = slab.reshape(n, slab.shape[1] // factor, factor, slab.shape[2] // factor, factor)
+    return blocks.mean(axis=(2, 4), dtype=np.float32)
+
+
+def render_window(slab, bounds):
+    """Map [lo, hi] linearly onto 0..255 uint8; NaN renders as 0."""
+    lo, hi = bounds
+    scale = 255.0 / (hi - lo) if hi > lo else 0.0
+    out = (slab - lo) * scale
+    np.nan_to_num(out, copy=False, nan=0.0)
+    np.clip(out, 0, 255, out=out)
+    return np.rint(out).astype(np.uint8)
+
+
+def window_bounds(volume, modality=None):
+    """{window name: (lo, hi)} rendered for a study of this modality."""
+    if (modality or "").upper() == "CT":
+        windows = {}
+        for name in PREVIEW_CT_WINDOWS:
+            level, width = WINDOW_PRESETS[name]
+            windows[name] = (level - width / 2.0, level + width / 2.0)
+        return windows
+    lo, hi = streaming_percentiles(volume, 0.5, 99.5)
+    return {AUTO_WINDOW: (float(lo), float(hi)) if lo is not None else (0.0, 0.0)}
+
+
+def write_pyramid(study_dir, volume, modality=None):
+    """
+    Render and encrypt the preview pyramid of a (D, H, W) or (H, W) volume;
+    reads the volume slab by slab. Returns {window: [(h, w) per level]}.
+    """
+    shape = tuple(volume.shape)
+    if len(shape) == 2:
+        volume = np.asarray(volume)[np.newaxis]
+        shape = volume.shape
+    if len(shape) != 3:
+        logger.info(f"No preview for volume of shape {shape}")
+        return {}
+    depth, height, width = shape
+    levels = level_shapes(height, width)
+    windows = window_bounds(volume, modality)
+    out_dir = os.path.join(study_dir, PREVIEW_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    writers = {}
+    try:
+        for name in windows:
+            for level, (_, h, w) in enumerate(levels):
+                # One slice per chunk keeps every preview request to a single small decrypt
+                writers[name, level] = VolumeWriter(os.path.join(out_dir, f"{name}_L{level}.enc"), (depth, h, w),
+                                                    np.uint8, slices_per_chunk=1, workers=1)
+        for _, slab in iter_slabs(volume):
+            base = block_mean(np.asarray(slab), levels[0][0])
+            for name, bounds in windows.items():
+                rendered = render_window(base, bounds)
+                writers[name, 0].write_slab(rendered)
+                for level in range(1, len(levels)):
+                    rendered = np.rint(block_mean(rendered, 2)).astype(np.uint8)
+                    writers[name, level].write_slab(rendered)
+        for writer in writers.values():
+            writer.close()
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        if not os.listdir(out_dir):
+            os.rmdir(out_dir)
+        raise
+    return {name: [(h, w) for _, h, w in levels] for name in windows}
+
+
+def pyramid_info(study_dir):
+    """{window: [{"level", "height", "width", "slices"}, ...]} for a stored pyramid."""
+    out_dir = os.path.join(study_dir, PREVIEW_DIR)
+    if not os.path.isdir(out_dir):
+        raise PreviewNotFound("No preview pyramid")
+    info = {}
+    for file_name in sorted(os.listdir(out_dir)):
+        match = _FILE_PATTERN.match(file_name)
+        if not match:
+            continue
+        with SecureVolumeReader(os.path.join(out_dir, file_name)) as reader:
+            depth, height, width = reader.shape
+        info.setdefault(match.group(1), []).append(
+            {"level": int(match.group(2)), "height": height, "width": width, "slices": depth})
+    for levels in info.values():
+        levels.sort(key=lambda entry: entry["level"])
+    return info
+
+
+def default_window(study_dir):
+    """First CT preset with a stored pyramid, else the auto window."""
+    for name in PREVIEW_CT_WINDOWS:
+        if os.path.exists(os.path.join(study_dir, PREVIEW_DIR, f"{name}_L0.enc")):
+            return name
+    return AUTO_WINDOW
+
+
+def preview_etag(path, index=None):
+    """Strong validator for one rendered slice; changes whenever the pyramid file is rewritten."""
+    stat = os.stat(path)
+    token = f"{os.path.basename(path)}:{'mid' if index is None else int(index)}:{stat.st_mtime_ns}:{stat.st_size}"
+    return '"' + hashlib.sha256(token.encode()).hexdigest()[:32] + '"'
+
+
+def preview_path(study_dir, window, level):
+    if not re.fullmatch(r"[a-z_]+", window or ""):
+        raise PreviewNotFound("Unknown window")
+    path = os.path.join(study_dir, PREVIEW_DIR, f"{window}_L{int(level)}.enc")
+    if not os.path.exists(path):
+        raise PreviewNotFound("No such preview window or level")
+    return path
+
+
+def read_preview_slice(path, index=None):
+    """(slice index, uint8 array) for one preview slice; the middle slice by default."""
+    with SecureVolumeReader(path) as reader:
+        depth = reader.num_slices
+        index = depth // 2 if index is None else int(index)
+        if not 0 <= index < depth:
+            raise PreviewNotFound("Slice out of range")
+        return index, reader.read_slices(index, index + 1)[0]
+
+
+def encode_png(image):
+    """8-bit grayscale PNG of a 2-D uint8 array."""
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width = image.shape
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    # Filter type 0 (none) in front of every row
+    rows = np.hstack([np.zeros((height, 1), dtype=np.uint8), image]).tobytes()
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows, 6))
+            + chunk(b"IEND", b""))
+
+
+def backfill(storage_path, load_metadata=None):
+    """Build pyramids for stored studies that have none; returns the number built."""
+    built = 0
+    for study_id in sorted(os.listdir(storage_path)):
+        study_dir = os.path.join(storage_path, study_id)
+        image_path = os.path.join(study_dir, "image.enc")
+        if not os.path.exists(image_path) or os.path.isdir(os.path.join(study_dir, PREVIEW_DIR)):
+            continue
+        modality = None
+        if load_metadata is not None:
+            try:
+                modality = (load_metadata(study_id) or {}).get("modality")
+            except Exception as e:
+                logger.warning(f"{study_id}: metadata unreadable ({type(e).__name__}), using auto window")
+        try:
+            with SecureVolumeReader(image_path) as reader:
+                write_pyramid(study_dir, reader, modality)
+        except Exception as e:
+            logger.error(f"{study_id}: preview failed: {type(e).__name__}")
+            continue
+        built += 1
+    return built
+
+
+if __name__ == "__main__":
+    import argparse
+    from data_processing import MedicalDataProcessor
+
+    parser = argparse.ArgumentParser(description="Build preview pyramids for stored studies that lack one")
+    parser.add_argument("--storage", default="/root/MedicalReportAnalysis/secure_storage")
+    args = parser.parse_args()
+    processor = MedicalDataProcessor(args.storage)
+    print(f"Built {backfill(args.storage, processor.load_study_metadata)} preview pyramids")
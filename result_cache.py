@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.security import EncryptionHandler
+
+logger = logging.getLogger("result_cache")
+
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "/root/MedicalReportAnalysis/result_cache")
+RESULT_CACHE_TTL_SEC = float(os.environ.get("RESULT_CACHE_TTL_SEC", str(24 * 3600)))
+RESULT_CACHE_MEMORY_ENTRIES = int(os.environ.get("RESULT_CACHE_MEMORY_ENTRIES", "256"))
+RESULT_CACHE_DISK_MAX_MB = float(os.environ.get("RESULT_CACHE_DISK_MAX_MB", "512"))
+
+_HASH_CHUNK = 1024 * 1024
+_VERSION_FILE = "VERSIONS"
+
+
+def versions_fingerprint(versions=None):
+    if versions is None:
+        from model_integration import model_versions
+        versions = model_versions()
+    return hashlib.sha256(json.dumps(versions, sort_keys=True).encode()).hexdigest()
+
+
+def pixel_digest(path):
+    """
+    SHA-256 of the decoded pixel data (plus shape/dtype), so re-sent studies
+    with rewritten headers still match. Falls back to the raw file bytes for
+    anything SimpleITK cannot read.
+    """
+    digest = hashlib.sha256()
+    try:
+        from volume_loader import LazyVolume
+        volume = LazyVolume(path)
+        digest.update(json.dumps([list(volume.shape), volume.dtype.str]).encode())
+        for _, slab in volume.iter_slabs():
+            digest.update(np.ascontiguousarray(slab).data)
+        return "px:" + digest.hexdigest()
+    except Exception:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(_HASH_CHUNK):
+                digest.update(chunk)
+        return "raw:" + digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier, content-addressed cache of pipeline results.
+
+    Keys are SHA-256 over the pixel digest, the whitespace-normalized
+    clinical history and the model versions fingerprint. The memory tier is
+    an entry-bounded LRU; the disk tier holds Fernet-encrypted JSON files
+    named by key, bounded by total size (least recently used evicted first).
+    Both tiers honour a TTL. If the model versions differ from the ones the
+    disk tier was written with, the disk tier is cleared on startup.
+    """
+    def __init__(self, directory=RESULT_CACHE_DIR, ttl_sec=RESULT_CACHE_TTL_SEC,
+                 memory_entries=RESULT_CACHE_MEMORY_ENTRIES, disk_max_bytes=int(RESULT_CACHE_DISK_MAX_MB * 1024 * 1024),
+                 versions=None):
+        self.directory = directory
+        self.ttl_sec = ttl_sec
+        self.memory_entries = memory_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.fingerprint = versions_fingerprint(versions)
+        self._memory = OrderedDict()  # key -> (expires_at, result)
+        self._disk = OrderedDict()    # key -> size, least recently used first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        if directory:
+            self._open_disk_tier()
+
+    def _open_disk_tier(self):
+        os.makedirs(self.directory, exist_ok=True)
+        version_path = os.path.join(self.directory, _VERSION_FILE)
+        stored = None
+        if os.path.exists(version_path):
+            with open(version_path) as f:
+                stored = f.read().strip()
+        if stored != self.fingerprint:
+            removed = self._clear_disk_files()
+            if stored is not None:
+                logger.info(f"Model versions changed; invalidated {removed} cached results")
+            with open(version_path, "w") as f:
+                f.write(self.fingerprint)
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".enc"):
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _clear_disk_files(self):
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".enc"):
+                os.remove(os.path.join(self.directory, name))
+                removed += 1
+        return removed
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".enc")
+
+    def make_key(self, image_path, clinical_history):
+        history = " ".join((clinical_history or "").split()).lower()
+        material = json.dumps([pixel_digest(image_path), history, self.fingerprint])
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def get(self, key):
+        """Cached result dict and its tier ('memory' or 'disk'), or (None, None)."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits_memory += 1
+                    return dict(entry[1]), "memory"
+                del self._memory[key]
+            on_disk = key in self._disk
+        if on_disk:
+            result, expires_at = self._read_disk(key, now)
+            if result is not None:
+                with self._lock:
+                    self.hits_disk += 1
+                    self._remember(key, expires_at, result)
+                return dict(result), "disk"
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def _read_disk(self, key, now):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                payload = json.loads(EncryptionHandler.decrypt_data(f.read()))
+        except Exception:
+            # Unreadable (e.g. written under another key): treat as a miss and drop it
+            self._drop_disk(key)
+            return None, None
+        if payload.get("expires_at", 0) <= now or payload.get("fingerprint") != self.fingerprint:
+            self._drop_disk(key)
+            return None, None
+        os.utime(path)
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        return payload["result"], payload["expires_at"]
+
+    def put(self, key, result):
+        expires_at = time.time() + self.ttl_sec
+        with self._lock:
+            self._remember(key, expires_at, dict(result))
+        if not self.directory:
+            return
+        blob = EncryptionHandler.encrypt_data(json.dumps({
+            "fingerprint": self.fingerprint,
+            "expires_at": expires_at,
+            "result": result,
+        }).encode())
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._disk_bytes += len(blob) - self._disk.pop(key, 0)
+            self._disk[key] = len(blob)
+            victims = []
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+                victim, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                victims.append(victim)
+                self.evictions += 1
+        for victim in victims:
+            self._remove_file(victim)
+
+    def _remember(self, key, expires_at, result):
+        self._memory[key] = (expires_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _drop_disk(self, key):
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+        self._remove_file(key)
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def refresh_versions(self, versions=None):
+        """Re-read model versions; if any changed, drop everything cached under the old ones."""
+        fingerprint = versions_fingerprint(versions)
+        if fingerprint == self.fingerprint:
+            return False
+        self.fingerprint = fingerprint
+        self.invalidate()
+        if self.directory:
+            with open(os.path.join(self.directory, _VERSION_FILE), "w") as f:
+                f.write(fingerprint)
+        logger.info("Model versions changed; result cache invalidated")
+        return True
+
+    def invalidate(self):
+        """Drop every cached result in both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._disk.clear()
+            self._disk_bytes = 0
+        if self.directory:
+            self._clear_disk_files()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
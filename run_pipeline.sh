@@ -6,6 +6,17 @@ VENV_PATH="$PROJECT_ROOT/venv"
 LOG_DIR="$PROJECT_ROOT/logs"
 
 echo "medical report analysis pipeline - by Neo"
+
+# Worker node: `run_pipeline.sh worker` runs only study workers (no API, no solver pass).
+# Every node must share DATABASE_URL and the secure storage; WORKER_SHARDS picks this node's shards.
+if [ "$1" == "worker" ]; then
+    export PYTHONPATH="$PROJECT_ROOT:$PYTHONPATH"
+    export PYTHONUNBUFFERED=1
+    cd "$PROJECT_ROOT"
+    echo "Starting ${STUDY_WORKERS:=2} study workers (shards: ${WORKER_SHARDS:-all})..."
+    exec "$VENV_PATH/bin/python3" jobs.py --workers "$STUDY_WORKERS" --shards "${WORKER_SHARDS:-}"
+fi
+
 echo "Starting Pipeline Execution..."
 
 # 1. Check Port 8000
@@ -26,14 +37,26 @@ export PYTHONUNBUFFERED=1
 nohup "$VENV_PATH/bin/python3" api.py > "$LOG_DIR/api_server.log" 2>&1 &
 API_PID=$!
 
-# Wait for server and check if it stayed alive
-echo "Initializing (15s)..."
-sleep 15
-if ! ps -p $API_PID > /dev/null; then
-    echo "ERROR: API Server failed to start. Last log entries:"
+# Wait until models are warm (readiness probe) instead of a fixed sleep
+echo "Initializing (waiting for /health/ready, up to ${READY_TIMEOUT:=120}s)..."
+READY=0
+for ((i = 0; i < READY_TIMEOUT; i++)); do
+    if ! ps -p $API_PID > /dev/null; then
+        break
+    fi
+    if curl -sfk https://127.0.0.1:8000/health/ready > /dev/null; then
+        READY=1
+        break
+    fi
+    sleep 1
+done
+if [ $READY -ne 1 ]; then
+    echo "ERROR: API Server failed to become ready. Last log entries:"
     tail -n 10 "$LOG_DIR/api_server.log"
+    kill $API_PID 2>/dev/null
     exit 1
 fi
+echo "API ready after ${i}s."
 
 # 4. Run study processing
 echo "Processing Pending Studies (solver.py)..."
@@ -1,7 +1,8 @@
 import time
 import numpy as np
-from data_processing import MedicalDataProcessor
-from model_integration import MedSAMIntegrator, RadBERTIntegrator, MultimodalFusionEngine
+from model_registry import get_model
+from batching import get_fusion_batcher
+from metrics import StageTimings, sampled_profile
 import torch
 import logging
 
@@ -10,38 +11,46 @@ logger = logging.getLogger("diagnostic_pipeline")
 
 def run_diagnostic_pipeline(image_path, patient_history):
     start_time = time.time()
-    
-    # 1. Processing
-    processor = MedicalDataProcessor()
-    # Simulate loading/parsing
-    img_array = np.random.rand(256, 256).astype(np.float32)
-    norm_img = processor.normalize_image(img_array)
-    
-    # 2. Segmentation (MedSAM)
-    medsam = MedSAMIntegrator()
-    mask, dice = medsam.segment(norm_img, box_prompt=[50, 50, 200, 200])
-    logger.info(f"Segmentation complete. Dice: {dice}")
-    
-    # 3. Report Generation (RadBERT)
-    radbert = RadBERTIntegrator()
-    report = radbert.generate_report(None, clinical_history=patient_history)
-    logger.info(f"Report Generated: {report}")
-    
-    # 4. Fusion and Risk Scoring
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    fusion = MultimodalFusionEngine().to(device)
-    
-    # Simulate high-quality embeddings from MedSAM and RadBERT
-    img_emb = torch.randn(1, 512).to(device)
-    text_emb = torch.randn(1, 768).to(device)
-    
-    risk_score_tensor, attn_weights = fusion(img_emb, text_emb)
-    risk_score = risk_score_tensor.item()
-    
-    # Accuracy Verification: Fusion vs Image-only Baseline
-    # Baseline accuracy (simulated from benchmark) = 0.82
-    # Multimodal accuracy (simulated) = 0.89
-    acc_improvement = 0.07 
+    timings = StageTimings()
+    with sampled_profile("diagnose"):
+        # 1. Processing
+        processor = get_model("processor")
+        with timings.stage("load"):
+            # Simulate loading/parsing
+            img_array = np.random.rand(256, 256).astype(np.float32)
+        with timings.stage("normalize"):
+            norm_img = processor.normalize_image(img_array)
+        
+        # 2. Segmentation (MedSAM)
+        medsam = get_model("medsam")
+        with timings.stage("segment"):
+            mask, dice = medsam.segment(norm_img, box_prompt=[50, 50, 200, 200])
+        logger.info(f"Segmentation complete. Dice: {dice}")
+        
+        # 3. Report Generation (RadBERT)
+        radbert = get_model("radbert")
+        with timings.stage("report"):
+            report = radbert.generate_report(None, clinical_history=patient_history)
+        logger.info(f"Report Generated: {report}")
+        
+        # 4. Fusion and Risk Scoring
+        fusion = get_model("fusion")
+        
+        with timings.stage("embed_text"):
+            # Templated intake notes repeat, so most histories come from the embedding cache
+            text_emb = radbert.embed_text(patient_history)
+
+        with timings.stage("fusion"):
+            # Simulate high-quality image embeddings from MedSAM
+            img_emb = torch.randn(1, 512)
+            
+            # Concurrent requests are scored together in micro-batches
+            risk_score, attn_weights = get_fusion_batcher().score(img_emb, text_emb)
+        
+        # Accuracy Verification: Fusion vs Image-only Baseline
+        # Baseline accuracy (simulated from benchmark) = 0.82
+        # Multimodal accuracy (simulated) = 0.89
+        acc_improvement = 0.07 
     
     latency = time.time() - start_time
     return {
@@ -50,7 +59,8 @@ def run_diagnostic_pipeline(image_path, patient_history):
         "risk_score": risk_score,
         "accuracy_improvement": acc_improvement,
         "alignment_score": fusion.demonstrate_alignment(),
-        "latency_sec": latency
+        "latency_sec": latency,
+        "stage_timings": timings.as_dict(),
     }
 
 if __name__ == "__main__":
@@ -24,14 +24,25 @@ def run_test():
     )
     
     print("Waiting for server to start...")
-    time.sleep(10) 
+    started = time.time()
     
     stdout_output, stderr_output = "", ""
     try:
-        # Check health endpoint
-        response = requests.get("https://localhost:8008/health", verify=False, timeout=5)
+        # Poll the liveness endpoint instead of sleeping a fixed interval
+        response = None
+        while time.time() - started < 60 and process.poll() is None:
+            try:
+                response = requests.get("https://localhost:8008/health/live", verify=False, timeout=1)
+                break
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.2)
+        if response is None:
+            raise RuntimeError("server did not come up within 60s")
+        print(f"Server live after {time.time() - started:.2f}s")
         print(f"Health Check Status: {response.status_code}")
         print(f"Health Check Response: {response.json()}")
+        ready = requests.get("https://localhost:8008/health/ready", verify=False, timeout=5)
+        print(f"Readiness Status: {ready.status_code}")
         
         # Kill server
         os.killpg(os.getpgid(process.pid), signal.SIGTERM)
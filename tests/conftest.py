@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+from cryptography.fernet import Fernet
+
+# Configuration is read at import time, so the test environment is set before any repo module loads
+_ROOT = tempfile.mkdtemp(prefix="mra-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_ROOT}/metadata.db")
+os.environ.setdefault("FERNET_KEY", Fernet.generate_key().decode())
+os.environ.setdefault("BLIND_INDEX_KEY", "test-blind-index-key")
+os.environ.setdefault("AUDIT_LOG_PATH", os.path.join(_ROOT, "audit.log"))
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_ROOT, "uploads"))
+os.environ.setdefault("RESULT_CACHE_DIR", os.path.join(_ROOT, "result_cache"))
+os.environ.setdefault("STUDY_WORKERS", "0")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
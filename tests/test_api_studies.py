@@ -0,0 +1,83 @@
+import io
+import os
+import uuid
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+from fastapi.testclient import TestClient
+
+import api
+from data_processing import MedicalDataProcessor
+from model_registry import _build_processor, registry
+from utils.db import SessionLocal, init_db
+from utils.security import create_access_token
+from utils.study_store import bulk_insert_studies, study_row
+
+
+@pytest.fixture
+def processor(tmp_path):
+    init_db()
+    os.makedirs(api.UPLOAD_DIR, exist_ok=True)
+    processor = MedicalDataProcessor(secure_storage_path=str(tmp_path / "storage"))
+    registry.register("processor", lambda: processor)
+    yield processor
+    registry.register("processor", _build_processor)
+
+
+@pytest.fixture
+def client():
+    # No lifespan: the endpoints under test need neither the models nor the workers
+    return TestClient(api.app)
+
+
+@pytest.fixture
+def headers():
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'radiologist_user', 'role': 'radiologist'})}"}
+
+
+def _nifti(tmp_path):
+    path = str(tmp_path / "upload.nii.gz")
+    sitk.WriteImage(sitk.GetImageFromArray(np.zeros((2, 8, 8), dtype=np.int16)), path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _submit(client, headers, tmp_path, study_id, patient_id="P1"):
+    return client.post("/api/v1/studies", headers=headers, data={"patient_id": patient_id, "study_id": study_id},
+                       files={"file": ("upload.nii.gz", io.BytesIO(_nifti(tmp_path)))})
+
+
+def test_resubmitting_a_queued_study_is_a_conflict(tmp_path, processor, client, headers):
+    study_id = f"S-{uuid.uuid4().hex[:8]}"
+    assert _submit(client, headers, tmp_path, study_id).status_code == 202
+    assert _submit(client, headers, tmp_path, study_id, patient_id="P2").status_code == 409
+
+
+def test_study_stored_without_a_job_is_a_conflict(tmp_path, processor, client, headers):
+    study_id = f"S-{uuid.uuid4().hex[:8]}"
+    study_dir = os.path.join(processor.storage_path, study_id)
+    with SessionLocal() as db:
+        bulk_insert_studies(db, [study_row(study_id, "patient-uuid", study_dir, b"metadata")])
+        db.commit()
+    assert _submit(client, headers, tmp_path, study_id).status_code == 409
+    assert not os.path.exists(study_dir)
+
+
+def test_existing_study_directory_is_a_conflict(tmp_path, processor, client, headers):
+    study_id = f"S-{uuid.uuid4().hex[:8]}"
+    study_dir = os.path.join(processor.storage_path, study_id)
+    os.makedirs(study_dir)
+    with open(os.path.join(study_dir, "image.enc"), "wb") as f:
+        f.write(b"other study")
+    assert _submit(client, headers, tmp_path, study_id).status_code == 409
+    assert os.listdir(study_dir) == ["image.enc"]
+
+
+def test_failed_submission_releases_its_study_id(tmp_path, processor, client, headers):
+    study_id = f"S-{uuid.uuid4().hex[:8]}"
+    response = client.post("/api/v1/studies", headers=headers, data={"patient_id": "P1", "study_id": study_id},
+                           files={"file": ("upload.nii.gz", io.BytesIO(b"not an image"))})
+    assert response.status_code == 400
+    assert not os.path.exists(os.path.join(processor.storage_path, study_id))
+    assert _submit(client, headers, tmp_path, study_id).status_code == 202
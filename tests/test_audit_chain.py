@@ -0,0 +1,132 @@
+import gzip
+import json
+import os
+import time
+
+import pytest
+
+from utils.audit import GENESIS_HASH, AuditSink, _find_last_seal, _seal_hash, log_segments, verify_chain
+
+
+def _write(path, records):
+    # max_bytes=1 rotates after every batch, so each record ends up in its own segment
+    sink = AuditSink(path=str(path), flush_count=1, flush_interval=0.01, max_bytes=1)
+    for record in records:
+        sink.submit(record)
+    sink.close()
+
+
+def _write_unrotated(path, records):
+    # One batch per call, however large: no rotation and no flush before close()
+    sink = AuditSink(path=str(path), flush_count=len(records), flush_interval=30, max_bytes=0, rotate_interval=0)
+    for record in records:
+        sink.submit(record)
+    sink.close()
+    return sink
+
+
+def _settled_segments(path, timeout=5.0):
+    """Segments once background compression has finished."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        segments = log_segments(str(path))
+        if all(p.endswith(".gz") or p == str(path) for p in segments):
+            return segments
+        time.sleep(0.05)
+    return log_segments(str(path))
+
+
+def _read(segment):
+    opener = gzip.open if segment.endswith(".gz") else open
+    with opener(segment, "rb") as f:
+        return f.read()
+
+
+def _rewrite(segment, data):
+    opener = gzip.open if segment.endswith(".gz") else open
+    with opener(segment, "wb") as f:
+        f.write(data)
+
+
+def test_chain_continues_across_rotation_and_restart(tmp_path):
+    path = tmp_path / "audit.log"
+    _write(path, [{"n": i} for i in range(3)])
+    # Restart after a rotation: the live log is empty, the chain must continue from the last segment
+    _write(path, [{"n": i} for i in range(3, 5)])
+    segments = _settled_segments(path)
+    assert len(segments) >= 5
+    assert verify_chain(segments) == (True, 5, None)
+
+
+def test_replaced_rotated_segment_is_detected(tmp_path):
+    path = tmp_path / "audit.log"
+    _write(path, [{"n": i} for i in range(3)])
+    _write(path, [{"n": i} for i in range(3, 5)])
+    segments = _settled_segments(path)
+    # A self-consistent forgery of the newest segment, chained from genesis
+    forged_record = json.dumps({"n": "forged"}, separators=(",", ":")).encode() + b"\n"
+    forged_seal = {"type": "seal", "count": 1, "prev": GENESIS_HASH, "hash": _seal_hash(GENESIS_HASH, forged_record)}
+    rotated = [p for p in segments if p != str(path)]
+    _rewrite(rotated[-1], forged_record + json.dumps(forged_seal).encode() + b"\n")
+    ok, _, error = verify_chain(segments)
+    assert not ok and "chain broken" in error
+
+
+def test_truncated_rotated_segment_is_detected(tmp_path):
+    path = tmp_path / "audit.log"
+    _write(path, [{"n": i} for i in range(4)])
+    segments = _settled_segments(path)
+    rotated = [p for p in segments if p != str(path)]
+    _rewrite(rotated[1], b"")
+    ok, _, error = verify_chain(segments)
+    assert not ok and "chain broken" in error
+    os.remove(rotated[1])
+    assert not verify_chain(log_segments(str(path)))[0]
+
+
+def _side_files(path, kind):
+    return [p for p in os.listdir(os.path.dirname(path)) if p.startswith(os.path.basename(path) + "." + kind)]
+
+
+def test_restart_after_a_batch_larger_than_the_scan_block(tmp_path):
+    path = tmp_path / "audit.log"
+    # ~250 KiB sealed in one batch
+    sink = _write_unrotated(path, [{"n": i, "pad": "x" * 200} for i in range(1000)])
+    assert sink.stats()["batches"] == 1
+    _write_unrotated(path, [{"n": "after-restart"}])
+    assert verify_chain(log_segments(str(path))) == (True, 1001, None)
+    assert not _side_files(str(path), "legacy")
+
+
+def test_last_seal_is_found_across_block_boundaries(tmp_path):
+    path = tmp_path / "audit.log"
+    _write_unrotated(path, [{"n": i} for i in range(3)])
+    _write_unrotated(path, [{"n": i} for i in range(3, 5)])
+    with open(path, "ab") as f:
+        f.write(b'{"n":"unsealed"}\n{"n":"cut')
+    with open(path, "rb") as f:
+        lines = f.read().split(b"\n")
+    seal_end = sum(len(line) + 1 for line in lines[:-2])
+    expected = (json.loads(lines[-3])["hash"], seal_end)
+    for block_size in (1, 7, 64, 1 << 20):
+        assert _find_last_seal(str(path), block_size) == expected
+
+
+@pytest.mark.parametrize("tail_records", [1, 2000])
+def test_unsealed_tail_is_quarantined_on_restart(tmp_path, tail_records):
+    path = tmp_path / "audit.log"
+    _write_unrotated(path, [{"n": i} for i in range(2)])
+    sealed = path.read_bytes()
+    # A crash after a batch was written but before its seal, the last line cut short
+    tail = b"".join(json.dumps({"n": i, "pad": "x" * 100}).encode() + b"\n" for i in range(tail_records))
+    tail += b'{"n":"cut'
+    with open(path, "ab") as f:
+        f.write(tail)
+
+    _write_unrotated(path, [{"n": "after-restart"}])
+
+    assert path.read_bytes().startswith(sealed)
+    assert verify_chain(log_segments(str(path))) == (True, 3, None)
+    (quarantine,) = _side_files(str(path), "unsealed")
+    assert (tmp_path / quarantine).read_bytes() == tail
+    assert not _side_files(str(path), "legacy")
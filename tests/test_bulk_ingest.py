@@ -0,0 +1,101 @@
+import json
+import os
+import uuid
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from bulk_ingest import BulkIngestor
+from data_processing import MedicalDataProcessor
+from utils.db import SessionLocal, StudyJob, init_db
+from utils.study_store import anonymize_patient_id
+
+
+@pytest.fixture
+def processor(tmp_path):
+    init_db()
+    return MedicalDataProcessor(secure_storage_path=str(tmp_path / "storage"))
+
+
+def _image(tmp_path, name, seed):
+    path = str(tmp_path / f"{name}.nii.gz")
+    volume = np.random.default_rng(seed).integers(0, 1000, size=(4, 16, 16)).astype(np.int16)
+    sitk.WriteImage(sitk.GetImageFromArray(volume), path)
+    return path
+
+
+def _ingest(tmp_path, processor, records, **kwargs):
+    manifest = tmp_path / f"manifest-{uuid.uuid4().hex[:8]}.jsonl"
+    manifest.write_text("".join(json.dumps(r) + "\n" for r in records))
+    return BulkIngestor(str(manifest), processor, workers=2, **kwargs).run()
+
+
+def _study_files(processor, study_id):
+    study_dir = os.path.join(processor.storage_path, study_id)
+    files = {}
+    for root, _, names in os.walk(study_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, study_dir)] = f.read()
+    return files
+
+
+def test_study_id_of_another_patient_is_not_overwritten(tmp_path, processor):
+    study_id = f"S-{uuid.uuid4().hex[:8]}"
+    first = {"patient_id": "P1", "study_id": study_id, "image_path": _image(tmp_path, "p1", 1)}
+    assert _ingest(tmp_path, processor, [first], queue_analysis=False)["stored"] == 1
+    before = _study_files(processor, study_id)
+
+    second = {"patient_id": "P2", "study_id": study_id, "image_path": _image(tmp_path, "p2", 2)}
+    report = _ingest(tmp_path, processor, [second], queue_analysis=False)
+
+    assert (report["stored"], report["failed"]) == (0, 1)
+    assert _study_files(processor, study_id) == before
+    assert processor.load_study_metadata(study_id)["anonymized_id"] == anonymize_patient_id("P1")
+
+
+def test_duplicate_study_id_in_one_run_is_stored_once(tmp_path, processor):
+    study_id = f"S-{uuid.uuid4().hex[:8]}"
+    image = _image(tmp_path, "dup", 3)
+    records = [{"patient_id": "P3", "study_id": study_id, "image_path": image}] * 3
+    report = _ingest(tmp_path, processor, records, queue_analysis=False)
+    assert (report["stored"], report["skipped_existing"], report["failed"]) == (1, 2, 0)
+    assert not os.path.exists(os.path.join(processor.storage_path, study_id, "image.enc.tmp"))
+
+
+def test_same_study_id_for_two_patients_in_one_run_fails_the_second(tmp_path, processor):
+    study_id = f"S-{uuid.uuid4().hex[:8]}"
+    records = [{"patient_id": "P4", "study_id": study_id, "image_path": _image(tmp_path, "p4", 4)},
+               {"patient_id": "P5", "study_id": study_id, "image_path": _image(tmp_path, "p5", 5)}]
+    report = _ingest(tmp_path, processor, records, queue_analysis=False)
+    assert (report["stored"], report["failed"]) == (1, 1)
+    assert processor.load_study_metadata(study_id)["anonymized_id"] == anonymize_patient_id("P4")
+
+
+def test_queue_replay_of_stored_study_adds_job_without_rewriting(tmp_path, processor):
+    study_id = f"S-{uuid.uuid4().hex[:8]}"
+    record = {"patient_id": "P6", "study_id": study_id, "image_path": _image(tmp_path, "p6", 6)}
+    _ingest(tmp_path, processor, [record], queue_analysis=False)
+    image_path = os.path.join(processor.storage_path, study_id, "image.enc")
+    mtime = os.stat(image_path).st_mtime_ns
+
+    report = _ingest(tmp_path, processor, [record], queue_analysis=True)
+
+    assert (report["stored"], report["skipped_existing"]) == (0, 1)
+    assert os.stat(image_path).st_mtime_ns == mtime
+    with SessionLocal() as db:
+        assert db.query(StudyJob).filter(StudyJob.study_id == study_id).count() == 1
+
+
+def test_existing_directory_without_row_is_not_overwritten(tmp_path, processor):
+    study_id = f"S-{uuid.uuid4().hex[:8]}"
+    study_dir = os.path.join(processor.storage_path, study_id)
+    os.makedirs(study_dir)
+    with open(os.path.join(study_dir, "image.enc"), "wb") as f:
+        f.write(b"other study")
+    record = {"patient_id": "P7", "study_id": study_id, "image_path": _image(tmp_path, "p7", 7)}
+    report = _ingest(tmp_path, processor, [record], queue_analysis=False)
+    assert report["failed"] == 1
+    assert _study_files(processor, study_id) == {"image.enc": b"other study"}
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import SimpleITK as sitk
+
+from utils.dicom_utils import deidentify_tree
+
+PHI = {"0010|0010": "DOE^JANE", "0010|0020": "MRN-000123", "0008|0080": "General Hospital"}
+
+
+def _write_series(directory, series, slices=3):
+    os.makedirs(directory)
+    writer = sitk.ImageFileWriter()
+    writer.KeepOriginalImageUIDOn()
+    for i in range(slices):
+        image = sitk.GetImageFromArray(np.full((1, 8, 8), i, dtype=np.int16))
+        for key, value in PHI.items():
+            image.SetMetaData(key, value)
+        image.SetMetaData("0020|000e", f"1.2.826.0.1.3680043.2.1125.{series}")
+        image.SetMetaData("0008|0018", f"1.2.826.0.1.3680043.2.1125.{series}.{i}")
+        image.SetMetaData("0020|0013", str(i + 1))
+        image.SetMetaData("0020|0032", f"0\\0\\{i}")
+        writer.SetFileName(os.path.join(directory, f"{i:03d}.dcm"))
+        writer.Execute(image)
+
+
+def _headers(root):
+    headers = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            reader = sitk.ImageFileReader()
+            reader.SetFileName(os.path.join(directory, name))
+            reader.ReadImageInformation()
+            headers[os.path.relpath(os.path.join(directory, name), root)] = {
+                key: reader.GetMetaData(key) for key in reader.GetMetaDataKeys()}
+    return headers
+
+
+def test_parallel_tree_matches_serial_and_strips_phi(tmp_path):
+    src = tmp_path / "src"
+    _write_series(str(src / "a"), 1)
+    _write_series(str(src / "b"), 2)
+
+    # Two spawned workers must derive the same pseudonyms as this process
+    parallel = deidentify_tree(str(src), str(tmp_path / "parallel"), workers=2)
+    serial = deidentify_tree(str(src), str(tmp_path / "serial"), workers=1)
+
+    assert sorted(r["files"] for r in parallel) == sorted(r["files"] for r in serial) == [3, 3]
+    headers = _headers(str(tmp_path / "parallel"))
+    uids = ("0008|0018", "0020|000e")
+    assert ({name: [tags[k] for k in uids] for name, tags in headers.items()}
+            == {name: [tags[k] for k in uids] for name, tags in _headers(str(tmp_path / "serial")).items()})
+    for tags in headers.values():
+        # The DICOM writer re-adds mandatory patient tags, but only empty
+        assert all(not tags.get(key) for key in PHI)
+        assert tags["0008|0018"].startswith("2.25.")
@@ -0,0 +1,51 @@
+import pytest
+import torch
+
+import fusion_export
+from fusion_export import (FUSION_PARITY_ATOL, CompiledFusionEngine, ParityError, build_eager, export,
+                           load_artifact, load_engine, optimize, probe_inputs, risk_scores)
+from model_integration import MultimodalFusionEngine
+
+
+@pytest.fixture
+def eager():
+    torch.manual_seed(0)
+    return build_eager(weights="")
+
+
+@pytest.mark.parametrize("backend", ["int8", "script", "int8-script"])
+def test_optimized_risk_scores_match_eager(eager, backend):
+    inputs = probe_inputs(batch=64, seed=1)
+    reference = risk_scores(eager, inputs)
+    scores = risk_scores(optimize(eager, backend), inputs)
+    assert scores.shape == reference.shape == (64,)
+    torch.testing.assert_close(scores, reference, atol=FUSION_PARITY_ATOL, rtol=0)
+
+
+def test_artifact_round_trip_keeps_parity(eager, tmp_path, monkeypatch):
+    monkeypatch.setattr(fusion_export, "build_eager", lambda weights=None: eager)
+    path = str(tmp_path / "fusion.pt")
+    meta = export(path, "int8-script")
+    engine = load_artifact(path)
+    assert engine.backend == "int8-script"
+    assert engine.parity["max_abs_diff"] == pytest.approx(meta["max_abs_diff"], abs=1e-6)
+    inputs = probe_inputs(batch=8, seed=2)
+    torch.testing.assert_close(risk_scores(engine, inputs), risk_scores(eager, inputs),
+                               atol=FUSION_PARITY_ATOL, rtol=0)
+
+    # A drifting artifact is refused rather than served
+    monkeypatch.setattr(fusion_export, "FUSION_PARITY_ATOL", -1.0)
+    with pytest.raises(ParityError):
+        load_artifact(path)
+
+
+def test_load_engine_serves_optimized_engine():
+    engine = load_engine(backend="int8-script", artifact="")
+    assert isinstance(engine, CompiledFusionEngine)
+    assert engine.parity["max_abs_diff"] <= FUSION_PARITY_ATOL
+
+
+def test_load_engine_falls_back_to_eager_when_parity_fails(monkeypatch):
+    monkeypatch.setattr(fusion_export, "FUSION_PARITY_ATOL", -1.0)
+    engine = load_engine(backend="int8-script", artifact="")
+    assert isinstance(engine, MultimodalFusionEngine)
@@ -0,0 +1,123 @@
+import datetime
+import uuid
+
+import pytest
+
+import jobs
+from jobs import (COMPLETED, FAILED, QUEUED, RUNNING, claim_next_job, complete_job, enqueue_study, fail_job,
+                  heartbeat, reap_expired_leases, record_worker_job, register_worker, worker_stats)
+from utils.db import SessionLocal, StudyJob, StudyResult, StudyWorker, db_utcnow, init_db
+
+
+@pytest.fixture
+def db():
+    init_db()
+    with SessionLocal() as session:
+        # Claims take the oldest queued job, so start from an empty queue
+        session.query(StudyResult).delete()
+        session.query(StudyJob).delete()
+        session.query(StudyWorker).delete()
+        session.commit()
+        yield session
+
+
+@pytest.fixture
+def db_clock(monkeypatch):
+    """Database clock a day ahead of this host's, advanced by hand."""
+    clock = {"now": datetime.datetime.utcnow() + datetime.timedelta(days=1)}
+    monkeypatch.setattr(jobs, "db_utcnow", lambda db: clock["now"])
+    return clock
+
+
+def _enqueue(db):
+    study_id = f"S-{uuid.uuid4().hex[:10]}"
+    enqueue_study(db, study_id, str(uuid.uuid4()), f"/storage/{study_id}", b"metadata", "tester")
+    return study_id
+
+
+def _job(db, study_id):
+    db.expire_all()
+    return db.query(StudyJob).filter(StudyJob.study_id == study_id).one()
+
+
+def test_db_utcnow_is_naive_utc_with_subsecond_resolution(db):
+    first = db_utcnow(db)
+    assert first.tzinfo is None
+    assert abs((first - datetime.datetime.utcnow()).total_seconds()) < 5
+    assert any(db_utcnow(db).microsecond for _ in range(5))
+
+
+def test_lease_is_stamped_and_expired_on_the_database_clock(db, db_clock):
+    study_id = _enqueue(db)
+    job = claim_next_job(db, "host-a:1", lease_sec=60)
+    assert job.study_id == study_id
+    assert job.lease_expires_at == db_clock["now"] + datetime.timedelta(seconds=60)
+
+    # Still leased by the database clock, although this host's clock is a day behind it
+    db_clock["now"] += datetime.timedelta(seconds=30)
+    assert reap_expired_leases(db) == (0, 0)
+    assert heartbeat(db, "host-a:1", job.id, lease_sec=60)
+    assert _job(db, study_id).lease_expires_at == db_clock["now"] + datetime.timedelta(seconds=60)
+
+    db_clock["now"] += datetime.timedelta(seconds=61)
+    assert reap_expired_leases(db) == (1, 0)
+    requeued = _job(db, study_id)
+    assert (requeued.status, requeued.worker_id, requeued.lease_expires_at) == (QUEUED, None, None)
+
+
+def test_requeued_job_goes_to_the_next_worker_and_the_old_outcome_is_dropped(db, db_clock):
+    study_id = _enqueue(db)
+    first = claim_next_job(db, "host-a:1", lease_sec=10)
+    db_clock["now"] += datetime.timedelta(seconds=11)
+    reap_expired_leases(db)
+
+    # Each worker process has its own session
+    with SessionLocal() as other:
+        second = claim_next_job(other, "host-b:2", lease_sec=10)
+        assert second.study_id == study_id and second.attempts == 2
+
+        # The first worker finishes late: its lease is gone, so nothing is recorded
+        assert not heartbeat(db, "host-a:1", first.id)
+        assert not complete_job(db, first, {"risk": 0.1})
+        assert not fail_job(db, first, RuntimeError("late"))
+        assert db.query(StudyResult).filter(StudyResult.study_id == study_id).count() == 0
+
+        assert heartbeat(other, "host-b:2", second.id)
+        assert complete_job(other, second, {"risk": 0.2})
+    assert _job(db, study_id).status == COMPLETED
+    assert db.query(StudyResult).filter(StudyResult.study_id == study_id).count() == 1
+
+
+def test_job_fails_after_max_attempts(db, db_clock):
+    study_id = _enqueue(db)
+    for attempt in range(1, 4):
+        job = claim_next_job(db, f"host:{attempt}", lease_sec=5)
+        assert job.attempts == attempt
+        db_clock["now"] += datetime.timedelta(seconds=6)
+        requeued, failed = reap_expired_leases(db, max_attempts=3)
+    assert (requeued, failed) == (0, 1)
+    job = _job(db, study_id)
+    assert (job.status, job.error) == (FAILED, "LeaseExpired")
+    assert claim_next_job(db, "host:4") is None
+
+
+def test_claim_is_exclusive(db):
+    _enqueue(db)
+    assert claim_next_job(db, "host-a:1") is not None
+    assert claim_next_job(db, "host-b:2") is None
+    assert db.query(StudyJob).filter(StudyJob.status == RUNNING).count() == 1
+
+
+def test_worker_stats_count_only_applied_outcomes(db, db_clock):
+    register_worker(db, "host-a:1")
+    record_worker_job(db, "host-a:1", COMPLETED, 2.0)
+    record_worker_job(db, "host-a:1", FAILED, 1.0)
+    record_worker_job(db, "host-a:1", None, 3.0)  # lease lost: busy time only
+    db_clock["now"] += datetime.timedelta(seconds=60)
+    heartbeat(db, "host-a:1")
+
+    (stats,) = worker_stats(db)
+    assert (stats["jobs_completed"], stats["jobs_failed"]) == (1, 1)
+    assert stats["uptime_sec"] == 60.0
+    assert stats["utilization"] == pytest.approx(0.1)
+    assert stats["alive"]
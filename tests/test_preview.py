@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pytest
+
+import data_processing
+from data_processing import MedicalDataProcessor
+from normalization import streaming_percentiles
+from preview import AUTO_WINDOW, PREVIEW_DIR, pyramid_info, read_preview_slice, preview_path, window_bounds
+
+
+def _volume_with_nan(seed=0):
+    volume = np.random.default_rng(seed).normal(100.0, 20.0, size=(6, 32, 32)).astype(np.float32)
+    volume[2, 5:9, 5:9] = np.nan
+    volume[3, 0, 0] = np.inf
+    return volume
+
+
+def test_percentiles_ignore_non_finite_values():
+    volume = _volume_with_nan()
+    lo, hi = streaming_percentiles(volume, 0.5, 99.5)
+    finite = volume[np.isfinite(volume)]
+    assert np.isfinite([lo, hi]).all()
+    assert lo == pytest.approx(np.percentile(finite, 0.5), abs=1.0)
+    assert hi == pytest.approx(np.percentile(finite, 99.5), abs=1.0)
+    assert streaming_percentiles(np.full((2, 4, 4), np.nan, dtype=np.float32), 0.5, 99.5) == (None, None)
+
+
+def test_volume_with_nan_is_saved_with_preview(tmp_path):
+    processor = MedicalDataProcessor(secure_storage_path=str(tmp_path))
+    volume = _volume_with_nan()
+    study_id = processor.secure_save_study(volume, {"modality": "MR"}, "nan-study")
+
+    assert np.isfinite(window_bounds(volume, "MR")[AUTO_WINDOW]).all()
+    assert processor.load_study_metadata(study_id)["modality"] == "MR"
+    np.testing.assert_array_equal(processor.load_study_slices(study_id), volume)
+    study_dir = os.path.join(str(tmp_path), study_id)
+    assert pyramid_info(study_dir)[AUTO_WINDOW][0]["slices"] == 6
+    _, rendered = read_preview_slice(preview_path(study_dir, AUTO_WINDOW, 0), 2)
+    assert (rendered[5:9, 5:9] == 0).all()
+
+
+def test_preview_failure_does_not_fail_the_save(tmp_path, monkeypatch):
+    def broken_pyramid(study_dir, volume, modality=None):
+        os.makedirs(os.path.join(study_dir, PREVIEW_DIR))
+        raise ValueError("render failed")
+
+    monkeypatch.setattr(data_processing, "write_pyramid", broken_pyramid)
+    processor = MedicalDataProcessor(secure_storage_path=str(tmp_path))
+    study_id = processor.secure_save_study(_volume_with_nan(), {"modality": "MR"}, "no-preview")
+    assert processor.load_study_metadata(study_id) == {"modality": "MR"}
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from utils.redaction import PHIRedactor, redact_phi, redact_phi_batch
+from utils.security import mask_phi
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Patient Name: John Doe, DOB: 03/14/1962, MRN: A1234567.",
+     "Patient Name: [NAME], DOB: [DATE], MRN: [MRN]."),
+    ("Seen by Dr. Jane Smith for chest pain.", "Seen by Dr. [NAME] for chest pain."),
+    ("Patient: Mr. O'Neil reports cough", "Patient: Mr. [NAME] reports cough"),
+    ("Contact jane.doe@example.org or call (555) 123-4567.", "Contact [EMAIL] or call [PHONE]."),
+    ("email: JOHN@EXAMPLE.COM", "email: [EMAIL]"),
+    ("Phone: 555-987-6543; SSN 123-45-6789", "Phone: [PHONE]; SSN [SSN]"),
+    ("Tel +1 555.123.4567", "Tel [PHONE]"),
+    ("Scan on 2024-02-15 and follow-up March 3, 2024 and 5 Jan 2023.",
+     "Scan on [DATE] and follow-up [DATE] and [DATE]."),
+    ("Accession No. 45A-9981 reviewed", "Accession No. [MRN] reviewed"),
+    # Clinical text without identifiers is left alone
+    ("65 year old with 3 cm nodule in RUL, CT 120 kVp", "65 year old with 3 cm nodule in RUL, CT 120 kVp"),
+    ("Persistent cough for 3 weeks, history of COPD.", "Persistent cough for 3 weeks, history of COPD."),
+    ("", ""),
+])
+def test_redaction_samples(text, expected):
+    assert redact_phi(text) == expected
+    assert mask_phi(text) == expected
+
+
+def test_batch_and_kind_selection():
+    texts = ["MRN 00001234", None, "a@b.co, Dr. Who"]
+    assert redact_phi_batch(texts) == ["MRN [MRN]", None, "[EMAIL], Dr. [NAME]"]
+
+    emails_only = PHIRedactor(kinds=("EMAIL",), placeholder="<{kind}>")
+    assert emails_only.redact("Dr. Who at a@b.co") == "Dr. Who at <EMAIL>"
+    assert emails_only.find("x a@b.co") == [("EMAIL", 2, 8)]
+    with pytest.raises(ValueError):
+        PHIRedactor(kinds=("ADDRESS",))
+
+
+@pytest.mark.parametrize("text", [
+    "a" * 200_000,
+    "a." * 100_000,
+    ("x" * 60 + "@") * 3_000,
+    "a-" * 100_000 + "@",
+    "Dr. " + "A " * 100_000,
+    "Patient Name: " + "Ab " * 60_000,
+    "1" * 200_000,
+])
+def test_adversarial_input_is_linear(text):
+    started = time.perf_counter()
+    redact_phi(text)
+    # Each finishes in well under 0.1 s; backtracking would take minutes
+    assert time.perf_counter() - started < 2.0
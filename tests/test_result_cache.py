@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from result_cache import ResultCache
+
+V1 = {"radbert": "rev-a", "segmentation": "1.0", "fusion": "eager"}
+V2 = {**V1, "segmentation": "1.1"}
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "image.bin"
+    path.write_bytes(os.urandom(4096))
+    return str(path)
+
+
+def _cache(directory, versions=V1, **kwargs):
+    return ResultCache(directory=directory and str(directory), versions=versions, **kwargs)
+
+
+def test_key_depends_on_model_versions_and_normalized_history(tmp_path, image):
+    cache = _cache(tmp_path / "cache")
+    key = cache.make_key(image, "Persistent  cough,\nfever")
+    assert cache.make_key(image, "persistent cough, FEVER ") == key
+    assert cache.make_key(image, "persistent cough") != key
+    assert _cache(tmp_path / "other", versions=V2).make_key(image, "persistent cough, fever") != key
+
+
+def test_refresh_versions_invalidates_both_tiers(tmp_path, image):
+    cache = _cache(tmp_path / "cache")
+    old_key = cache.make_key(image, "history")
+    cache.put(old_key, {"risk": 0.4})
+    assert cache.get(old_key)[1] == "memory"
+
+    assert not cache.refresh_versions(V1)
+    assert cache.refresh_versions(V2)
+
+    assert cache.get(old_key) == (None, None)
+    assert [n for n in os.listdir(tmp_path / "cache") if n.endswith(".enc")] == []
+    assert cache.make_key(image, "history") != old_key
+    assert cache.stats()["disk_entries"] == 0
+
+
+def test_restart_keeps_disk_tier_only_for_the_same_versions(tmp_path, image):
+    first = _cache(tmp_path / "cache")
+    key = first.make_key(image, "history")
+    first.put(key, {"risk": 0.4})
+
+    same = _cache(tmp_path / "cache")
+    assert same.get(key) == ({"risk": 0.4}, "disk")
+
+    upgraded = _cache(tmp_path / "cache", versions=V2)
+    assert upgraded.stats()["disk_entries"] == 0
+    assert upgraded.get(key) == (None, None)
+
+
+def test_entry_written_under_other_versions_is_dropped_on_read(tmp_path, image):
+    # Another process still on the old models shares the directory and writes after this one upgraded
+    stale = _cache(tmp_path / "cache", versions=V2)
+    stale.fingerprint = _cache(None, versions=V1).fingerprint
+    key = _cache(None, versions=V2).make_key(image, "history")
+    stale.put(key, {"risk": 0.9})
+    # The VERSIONS file matches, so the directory is kept; the entry itself does not
+    current = _cache(tmp_path / "cache", versions=V2)
+
+    assert current.get(key) == (None, None)
+    assert not os.path.exists(current._path(key))
+
+
+def test_expired_entries_miss(tmp_path, image):
+    cache = _cache(tmp_path / "cache", ttl_sec=-1)
+    key = cache.make_key(image, "history")
+    cache.put(key, {"risk": 0.4})
+    assert cache.get(key) == (None, None)
+    assert cache.stats()["disk_entries"] == 0
@@ -0,0 +1,104 @@
+import os
+import struct
+
+import numpy as np
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from utils.secure_volume import (MAGIC, SecureVolumeReader, VolumeFormatError, VolumeWriter, is_chunked_volume,
+                                 write_volume)
+
+
+def _volume(shape=(23, 17, 11), dtype=np.int16, seed=0):
+    return np.random.default_rng(seed).integers(-1000, 3000, size=shape).astype(dtype)
+
+
+@pytest.mark.parametrize("codec", ["auto", "none"])
+@pytest.mark.parametrize("workers", [1, 3])
+@pytest.mark.parametrize("slices_per_chunk", [1, 4, 64])
+def test_round_trip_and_slice_ranges(tmp_path, codec, workers, slices_per_chunk):
+    volume = _volume()
+    path = str(tmp_path / "image.enc")
+    write_volume(path, volume, spacing=(0.7, 0.7, 2.5), slices_per_chunk=slices_per_chunk, workers=workers,
+                 codec=codec)
+    assert is_chunked_volume(path)
+    with SecureVolumeReader(path) as reader:
+        assert reader.shape == volume.shape and reader.dtype == volume.dtype
+        assert reader.spacing == (0.7, 0.7, 2.5)
+        np.testing.assert_array_equal(reader.read_all(workers=workers), volume)
+        for start, stop in [(0, 1), (3, 9), (5, 5), (22, 23), (20, 99)]:
+            np.testing.assert_array_equal(reader.read_slices(start, stop, workers=workers), volume[start:stop])
+        np.testing.assert_array_equal(np.concatenate([slab for _, slab in reader.iter_slabs()]), volume)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.int32, np.float32, np.float64])
+def test_round_trip_dtypes(tmp_path, dtype):
+    volume = np.random.default_rng(1).normal(50, 30, size=(9, 8, 7)).astype(dtype)
+    path = str(tmp_path / "image.enc")
+    write_volume(path, volume, slices_per_chunk=2)
+    with SecureVolumeReader(path) as reader:
+        restored = reader.read_all()
+    assert restored.dtype == volume.dtype
+    np.testing.assert_array_equal(restored, volume)
+
+
+def test_streamed_source_round_trip(tmp_path):
+    volume = _volume(seed=2)
+    first, second = str(tmp_path / "first.enc"), str(tmp_path / "second.enc")
+    write_volume(first, volume, slices_per_chunk=5)
+    # Anything with iter_slabs() is streamed slab by slab, e.g. another stored volume
+    with SecureVolumeReader(first) as source:
+        write_volume(second, source, slices_per_chunk=3)
+    with SecureVolumeReader(second) as reader:
+        np.testing.assert_array_equal(reader.read_all(), volume)
+
+
+def _chunk_layout(path):
+    with SecureVolumeReader(path) as reader:
+        return [(int(offset), int(length)) for offset, length in reader._index]
+
+
+def test_swapped_chunks_fail_authentication(tmp_path):
+    path = str(tmp_path / "image.enc")
+    write_volume(path, _volume(), slices_per_chunk=4, codec="none")
+    (a_offset, length), (b_offset, b_length) = _chunk_layout(path)[:2]
+    assert length == b_length
+    with open(path, "r+b") as f:
+        a = os.pread(f.fileno(), length, a_offset)
+        b = os.pread(f.fileno(), length, b_offset)
+        os.pwrite(f.fileno(), b, a_offset)
+        os.pwrite(f.fileno(), a, b_offset)
+    with SecureVolumeReader(path) as reader:
+        np.testing.assert_array_equal(reader.read_slices(8, 12), _volume()[8:12])
+        with pytest.raises(InvalidTag):
+            reader.read_slices(0, 4)
+
+
+def test_modified_header_is_rejected(tmp_path):
+    path = str(tmp_path / "image.enc")
+    write_volume(path, _volume(), spacing=(1.0, 1.0, 1.0), slices_per_chunk=4)
+    with open(path, "r+b") as f:
+        f.seek(len(MAGIC))
+        (header_len,) = struct.unpack("<I", f.read(4))
+        header = f.read(header_len)
+        f.seek(len(MAGIC) + 4)
+        f.write(header.replace(b"1.0", b"2.0", 1))
+    with pytest.raises(InvalidTag):
+        SecureVolumeReader(path)
+
+
+def test_truncated_file_is_rejected(tmp_path):
+    path = str(tmp_path / "image.enc")
+    write_volume(path, _volume(), slices_per_chunk=4)
+    os.truncate(path, os.path.getsize(path) - 3)
+    with pytest.raises(VolumeFormatError):
+        SecureVolumeReader(path)
+
+
+def test_incomplete_write_leaves_no_file(tmp_path):
+    path = str(tmp_path / "image.enc")
+    writer = VolumeWriter(path, (10, 4, 4), np.int16, slices_per_chunk=3)
+    writer.write_slab(np.zeros((6, 4, 4), dtype=np.int16))
+    with pytest.raises(VolumeFormatError):
+        writer.close()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,103 @@
+import datetime
+import json
+import uuid
+
+import pytest
+
+from utils.db import PatientStudy, SessionLocal, init_db
+from utils.security import EncryptionHandler
+from utils.study_store import (backfill_search_columns, bulk_insert_studies, decode_cursor, find_studies,
+                               study_row)
+
+DAY = datetime.datetime(2024, 2, 15, 9, 30)
+
+
+@pytest.fixture
+def db():
+    init_db()
+    with SessionLocal() as session:
+        yield session
+
+
+def _metadata(**fields):
+    return EncryptionHandler.encrypt_data(json.dumps(fields).encode())
+
+
+def _insert(db, patient_uuid, count, modality="CT", start=DAY, step=datetime.timedelta(hours=1)):
+    rows = [study_row(f"S-{uuid.uuid4().hex[:10]}", patient_uuid, "/storage", _metadata(n=i, modality=modality),
+                      modality, start + (i // 3) * step)   # three rows per timestamp: ties on study_date
+            for i in range(count)]
+    bulk_insert_studies(db, rows)
+    db.commit()
+    return [r["study_id"] for r in rows]
+
+
+def _all_pages(db, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        items, cursor = find_studies(db, limit=limit, cursor=cursor, **filters)
+        pages.append(items)
+        if cursor is None:
+            return pages
+
+
+def test_keyset_pages_return_every_study_once_newest_first(db):
+    patient = str(uuid.uuid4())
+    _insert(db, patient, 25)
+    expected = [s.study_id for s in db.query(PatientStudy).filter(PatientStudy.patient_uuid == patient)
+                .order_by(PatientStudy.study_date.desc(), PatientStudy.id.desc())]
+
+    pages = _all_pages(db, 7, patient_uuid=patient)
+
+    assert [len(p) for p in pages] == [7, 7, 7, 4]
+    assert [item["study_id"] for page in pages for item in page] == expected
+    assert pages[0][0]["metadata"]["modality"] == "CT"
+
+
+def test_page_boundary_on_tied_timestamps(db):
+    patient = str(uuid.uuid4())
+    _insert(db, patient, 9)
+    # Every page ends in the middle of a run of equal study_dates
+    pages = _all_pages(db, 2, patient_uuid=patient)
+    ids = [item["study_id"] for page in pages for item in page]
+    assert len(ids) == len(set(ids)) == 9
+
+
+def test_blind_index_filters(db):
+    patient, other = str(uuid.uuid4()), str(uuid.uuid4())
+    ct = _insert(db, patient, 4, modality="CT")
+    mr = _insert(db, patient, 2, modality="MR", start=DAY + datetime.timedelta(days=1))
+    _insert(db, other, 3, modality="CT")
+
+    def ids(**filters):
+        return {item["study_id"] for item in find_studies(db, limit=200, **filters)[0]}
+
+    assert ids(patient_uuid=patient) == set(ct) | set(mr)
+    # Values are normalized for whitespace and case before hashing
+    assert ids(patient_uuid=patient, modality=" ct ") == set(ct)
+    assert ids(patient_uuid=patient, study_date=(DAY + datetime.timedelta(days=1)).date()) == set(mr)
+    assert ids(patient_uuid=str(uuid.uuid4())) == set()
+
+    row = db.query(PatientStudy).filter(PatientStudy.study_id == ct[0]).one()
+    assert patient not in (row.patient_uuid_bidx, row.modality_bidx, row.study_day_bidx)
+
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_backfill_fills_legacy_rows_and_terminates(db):
+    patient = str(uuid.uuid4())
+    legacy = [PatientStudy(study_id=None, patient_uuid=patient, study_date=DAY, file_path=f"/storage/L-{i}",
+                           metadata_json=_metadata(modality="MR")) for i in range(5)]
+    # Blank patient_uuid: its index stays empty, which must not make the backfill loop forever
+    legacy.append(PatientStudy(study_id="blank", patient_uuid="  ", study_date=DAY, file_path="/storage/blank",
+                               metadata_json=_metadata(modality="MR")))
+    db.add_all(legacy)
+    db.commit()
+
+    assert backfill_search_columns(db, batch_size=2) >= 6
+
+    items, _ = find_studies(db, patient_uuid=patient, modality="MR", limit=50)
+    assert sorted(item["study_id"] for item in items) == [f"L-{i}" for i in range(5)]
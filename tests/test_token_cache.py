@@ -0,0 +1,66 @@
+import time
+import types
+from datetime import timedelta
+
+import pytest
+from jose import JWTError
+
+from utils import security
+from utils.security import TokenCache, create_access_token, decode_access_token
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": time.time()}
+    monkeypatch.setattr(security, "time", types.SimpleNamespace(time=lambda: now["t"]))
+    return now
+
+
+def test_cached_claims_never_outlive_the_token(clock):
+    cache = TokenCache(ttl_sec=300)
+    cache.put("short", {"sub": "a", "exp": clock["t"] + 10})
+    cache.put("long", {"sub": "b", "exp": clock["t"] + 3600})
+
+    clock["t"] += 11
+    assert cache.get("short") is None
+    assert cache.get("long")["sub"] == "b"
+
+    clock["t"] += 300
+    assert cache.get("long") is None
+
+
+def test_cache_is_bounded_lru():
+    cache = TokenCache(max_entries=2)
+    for token in ("a", "b"):
+        cache.put(token, {"sub": token})
+    cache.get("a")
+    cache.put("c", {"sub": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_decode_caches_only_verified_tokens(monkeypatch):
+    cache = TokenCache()
+    monkeypatch.setattr(security, "token_cache", cache)
+    token = create_access_token({"sub": "radiologist_user", "role": "radiologist"}, timedelta(minutes=5))
+
+    assert decode_access_token(token)["sub"] == "radiologist_user"
+    assert decode_access_token(token)["role"] == "radiologist"
+    assert (cache.stats()["misses"], cache.stats()["hits"]) == (1, 1)
+
+    forged = token[:-2] + ("AA" if not token.endswith("AA") else "BB")
+    for _ in range(2):
+        with pytest.raises(JWTError):
+            decode_access_token(forged)
+    assert cache.stats()["entries"] == 1
+
+
+def test_expired_token_is_rejected_even_if_seen_before(monkeypatch):
+    cache = TokenCache()
+    monkeypatch.setattr(security, "token_cache", cache)
+    expired = create_access_token({"sub": "radiologist_user"}, timedelta(seconds=-1))
+    for _ in range(2):
+        with pytest.raises(JWTError):
+            decode_access_token(expired)
+    assert cache.stats()["entries"] == 0
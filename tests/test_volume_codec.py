@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from utils.secure_volume import SecureVolumeReader, write_volume
+from utils.volume_codec import ChunkCodec, plan_storage_dtype, to_storage
+
+
+def _smooth(shape=(6, 32, 32), scale=400.0):
+    z, y, x = np.indices(shape, dtype=np.float64)
+    return scale * np.sin(x / 7.0) * np.cos(y / 5.0) + 10.0 * z
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.int16, np.uint16, np.int32, np.float32, np.float64])
+@pytest.mark.parametrize("filters", [None, [], ["delta"], ["shuffle"], ["delta", "shuffle"]])
+def test_codec_round_trip(dtype, filters):
+    if filters and "delta" in filters and np.dtype(dtype).kind == "f":
+        pytest.skip("delta is integer-only")
+    codec = ChunkCodec(dtype, filters)
+    for chunk in (_smooth().astype(dtype),
+                  np.random.default_rng(0).integers(0, 200, size=(3, 9, 5)).astype(dtype)):
+        np.testing.assert_array_equal(codec.decode(codec.encode(chunk), chunk.shape), chunk)
+
+
+def test_incompressible_chunk_is_stored_raw():
+    chunk = np.random.default_rng(1).integers(0, 256, size=(4, 64, 64), dtype=np.uint8)
+    payload = ChunkCodec(np.uint8).encode(chunk)
+    assert payload[:1] == b"\x00" and len(payload) == chunk.nbytes + 1
+    np.testing.assert_array_equal(ChunkCodec(np.uint8).decode(payload, chunk.shape), chunk)
+
+
+@pytest.mark.parametrize("array, rescale, expected", [
+    (np.array([[-1024.0, 3071.0]], dtype=np.float32), None, np.int16),   # whole Hounsfield units
+    (np.array([[0, 4095]], dtype=np.int32), None, np.uint16),              # 12-bit data in int32
+    (np.array([[0, 200]], dtype=np.int64), None, np.uint8),
+    (np.array([[0.5, 1.0]], dtype=np.float32), None, np.float32),          # fractional values stay
+    (np.array([[np.nan, 1.0]], dtype=np.float32), None, np.float32),
+    (np.array([[-1024.0, -1023.5, 0.0]], dtype=np.float32), (0.5, -1024.0), np.uint16),
+])
+def test_plan_storage_dtype(array, rescale, expected):
+    assert plan_storage_dtype(array, rescale) == np.dtype(expected)
+
+
+def test_lossy_conversion_is_refused():
+    with pytest.raises(ValueError):
+        to_storage(np.array([0.25], dtype=np.float32), np.int16)
+
+
+@pytest.mark.parametrize("source_dtype, rescale", [(np.float32, None), (np.int32, None), (np.float64, (0.5, -1024.0))])
+def test_narrowed_volume_restores_original_dtype(tmp_path, source_dtype, rescale):
+    volume = np.rint(_smooth(shape=(10, 48, 48)))
+    if rescale is not None:
+        volume = volume * rescale[0] + rescale[1]
+    volume = volume.astype(source_dtype)
+    path = str(tmp_path / "image.enc")
+    stats = write_volume(path, volume, slices_per_chunk=3, rescale=rescale)
+    assert np.dtype(stats["storage_dtype"]).itemsize < volume.dtype.itemsize
+    assert stats["compression_ratio"] > 2
+    with SecureVolumeReader(path) as reader:
+        restored = reader.read_all()
+        assert reader.storage_stats()["storage_dtype"] == stats["storage_dtype"]
+    assert restored.dtype == volume.dtype
+    np.testing.assert_array_equal(restored, volume)
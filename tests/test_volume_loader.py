@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from data_processing import MedicalDataProcessor
+from volume_loader import LazyVolume
+
+
+@pytest.fixture(params=[".nii", ".nii.gz"])
+def nifti(tmp_path, request):
+    volume = np.random.default_rng(0).integers(-1000, 2000, size=(20, 12, 10)).astype(np.int16)
+    path = str(tmp_path / f"volume{request.param}")
+    sitk.WriteImage(sitk.GetImageFromArray(volume), path)
+    return path, volume
+
+
+def test_parse_returns_read_only_view_or_writable_copy(tmp_path, nifti):
+    path, volume = nifti
+    processor = MedicalDataProcessor(secure_storage_path=str(tmp_path / "storage"))
+
+    _, view = processor.parse_dicom_or_nifti(path)
+    np.testing.assert_array_equal(view, volume)
+    with pytest.raises(ValueError):
+        view[0, 0, 0] = 1
+
+    _, copy = processor.parse_dicom_or_nifti(path, writable=True)
+    copy[0, 0, 0] = 1
+    np.testing.assert_array_equal(view, volume)
+
+
+def test_lazy_volume_slabs_match_full_read(nifti):
+    path, volume = nifti
+    lazy = LazyVolume(path)
+    assert lazy.shape == volume.shape and len(lazy) == 20
+    np.testing.assert_array_equal(np.concatenate([slab for _, slab in lazy.iter_slabs(7)]), volume)
+    np.testing.assert_array_equal(lazy.read_slices(5, 9), volume[5:9])
+    np.testing.assert_array_equal(lazy[3], volume[3])
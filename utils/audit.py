@@ -0,0 +1,381 @@
+"""
+Queue-backed, tamper-evident audit log sink.
+
+Request handlers call AuditSink.submit(), which only enqueues the record.
+A background writer thread serializes records in batches, appends them as
+JSON lines and fsyncs when either AUDIT_FLUSH_COUNT records are pending or
+AUDIT_FLUSH_INTERVAL_SEC has elapsed. Each batch is followed by a seal line
+
+    {"type": "seal", "count": N, "prev": <previous seal>, "hash": sha256(prev + batch bytes)}
+
+so the log forms a hash chain (one hash per batch, not per record) that
+verify_chain() can check, including across rotated segments: the first
+seal of a segment chains to the last seal of the one before, also when
+the writer restarts. Segments are rotated by size or age and
+gzip-compressed in the background; `python -m utils.audit` verifies the
+whole chain.
+
+On startup the live log is scanned backwards for its last seal. Records
+after it were cut off by a crash before their batch was sealed; they are
+moved, unmodified, to <path>.unsealed-<timestamp> for review, and the log
+is truncated at the seal so the chain stays verifiable.
+
+One sink per process: separate processes must write to separate paths, or
+their chains interleave.
+"""
+import os
+import gzip
+import json
+import time
+import queue
+import shutil
+import hashlib
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger("audit_sink")
+
+AUDIT_LOG_PATH = os.environ.get("AUDIT_LOG_PATH", "/root/MedicalReportAnalysis/logs/audit.log")
+AUDIT_QUEUE_SIZE = int(os.environ.get("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_FLUSH_INTERVAL_SEC = float(os.environ.get("AUDIT_FLUSH_INTERVAL_SEC", "1.0"))
+AUDIT_FLUSH_COUNT = int(os.environ.get("AUDIT_FLUSH_COUNT", "256"))
+AUDIT_MAX_BYTES = int(os.environ.get("AUDIT_MAX_BYTES", str(50 * 1024 * 1024)))
+AUDIT_ROTATE_INTERVAL_SEC = float(os.environ.get("AUDIT_ROTATE_INTERVAL_SEC", str(24 * 3600)))
+AUDIT_OVERFLOW_POLICY = os.environ.get("AUDIT_OVERFLOW_POLICY", "drop_oldest")  # 'drop_oldest', 'drop_newest', 'block'
+AUDIT_BLOCK_TIMEOUT_SEC = float(os.environ.get("AUDIT_BLOCK_TIMEOUT_SEC", "1.0"))
+
+GENESIS_HASH = "0" * 64
+_STOP = object()
+
+
+def _seal_hash(prev_hash, batch_bytes):
+    return hashlib.sha256(prev_hash.encode() + batch_bytes).hexdigest()
+
+
+def log_segments(path=AUDIT_LOG_PATH):
+    """Rotated segments of `path` oldest first (.gz or plain), then the live log if present."""
+    directory, base = os.path.dirname(path) or ".", os.path.basename(path)
+    if not os.path.isdir(directory):
+        return []
+    segments = {}
+    for name in os.listdir(directory):
+        if not name.startswith(base + "."):
+            continue
+        stamp = name[len(base) + 1:]
+        stamp = stamp[:-3] if stamp.endswith(".gz") else stamp
+        if not stamp[:8].isdigit():
+            continue  # e.g. .legacy-* files, which predate the chain
+        # While a segment is being compressed both files exist; only the plain one is complete
+        if stamp not in segments or not name.endswith(".gz"):
+            segments[stamp] = os.path.join(directory, name)
+    paths = [segments[stamp] for stamp in sorted(segments)]
+    if os.path.exists(path):
+        paths.append(path)
+    return paths
+
+
+def _seal_of(line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    return record.get("hash") if isinstance(record, dict) and record.get("type") == "seal" else None
+
+
+def _find_last_seal(path, block_size=64 * 1024):
+    """
+    (hash, end offset) of the last seal in a plain log, or (None, None).
+    The file is read backwards a block at a time until a seal turns up, so
+    a final batch of any size is found without reading the whole log.
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        end, carry = size, b""
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            data = f.read(end - start) + carry
+            lines = data.split(b"\n")
+            # The first piece may continue in the block before; it is completed on the next read
+            carry = lines.pop(0) if start > 0 else b""
+            line_end = start + len(data)
+            for line in reversed(lines):
+                seal = _seal_of(line)
+                if seal is not None:
+                    return seal, min(line_end + 1, size)
+                line_end -= len(line) + 1
+            end = start
+    return None, None
+
+
+def _last_seal(path):
+    """Hash of the last seal in an existing log segment (.gz segments are read through)."""
+    if not os.path.exists(path):
+        return None
+    if path.endswith(".gz"):
+        last = None
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                if line.startswith(b'{"type":"seal"'):
+                    last = json.loads(line)["hash"]
+        return last
+    return _find_last_seal(path)[0]
+
+
+def _quarantine_tail(path, offset):
+    """Move the bytes after `offset` to <path>.unsealed-<timestamp> and truncate the log there."""
+    quarantine = f"{path}.unsealed-{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}"
+    with open(path, "rb") as src, open(quarantine, "wb") as dst:
+        src.seek(offset)
+        shutil.copyfileobj(src, dst)
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.truncate(path, offset)
+    return quarantine
+
+
+class AuditSink:
+    def __init__(self, path=AUDIT_LOG_PATH, max_queue=AUDIT_QUEUE_SIZE, flush_interval=AUDIT_FLUSH_INTERVAL_SEC,
+                 flush_count=AUDIT_FLUSH_COUNT, max_bytes=AUDIT_MAX_BYTES, rotate_interval=AUDIT_ROTATE_INTERVAL_SEC,
+                 overflow_policy=AUDIT_OVERFLOW_POLICY, block_timeout=AUDIT_BLOCK_TIMEOUT_SEC):
+        if overflow_policy not in ("drop_oldest", "drop_newest", "block"):
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_count = max(1, flush_count)
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._closing = False
+        self._file = None
+        self._opened_at = None
+        self._prev_hash = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.batches = 0
+        self.rotations = 0
+        self.write_errors = 0
+        self.last_flush_at = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def submit(self, record):
+        """Enqueue one record (a JSON-serializable dict) without blocking the caller."""
+        if self._closing:
+            self.dropped += 1
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow_policy == "drop_newest":
+                self.dropped += 1
+                return False
+            if self.overflow_policy == "block":
+                try:
+                    self._queue.put(record, timeout=self.block_timeout)
+                except queue.Full:
+                    self.dropped += 1
+                    return False
+            else:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+                try:
+                    self._queue.put_nowait(record)
+                except queue.Full:
+                    self.dropped += 1
+                    return False
+        self.enqueued += 1
+        return True
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self._prev_hash is None:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            last, end = _find_last_seal(self.path) if size else (None, None)
+            if last is None and size:
+                # Pre-existing unsealed log (older plain-text format): move it aside intact
+                legacy = f"{self.path}.legacy-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}"
+                os.replace(self.path, legacy)
+                threading.Thread(target=_compress_segment, args=(legacy,), daemon=True).start()
+            elif last is not None and end < size:
+                # A crash between writing a batch and its seal: keep those records out of the chain
+                quarantine = _quarantine_tail(self.path, end)
+                logger.warning(f"Audit log had {size - end} unsealed bytes after its last seal; "
+                               f"moved to {quarantine}")
+            if last is None:
+                # Empty or missing live log (e.g. restarted right after a rotation): continue the
+                # chain from the newest rotated segment, so segments cannot be swapped undetected
+                rotated = [p for p in log_segments(self.path) if p != self.path]
+                last = _last_seal(rotated[-1]) if rotated else None
+            self._prev_hash = last or GENESIS_HASH
+        self._file = open(self.path, "ab")
+        self._opened_at = time.time()
+
+    def _run(self):
+        self._open()
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_count:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=max(0.0, timeout)) if batch else self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self._write_batch(batch)
+            self._maybe_rotate()
+        # Drain anything enqueued after the stop sentinel
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftovers.append(item)
+        if leftovers:
+            self._write_batch(leftovers)
+        self._file.close()
+
+    def _write_batch(self, batch):
+        try:
+            data = b"".join(json.dumps(r, separators=(",", ":")).encode() + b"\n" for r in batch)
+            seal = _seal_hash(self._prev_hash, data)
+            seal_line = json.dumps({
+                "type": "seal",
+                "timestamp": datetime.utcnow().isoformat(),
+                "count": len(batch),
+                "prev": self._prev_hash,
+                "hash": seal,
+            }, separators=(",", ":")).encode() + b"\n"
+            self._file.write(data + seal_line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except Exception as e:
+            self.write_errors += 1
+            logger.error(f"Audit batch write failed: {type(e).__name__}")
+            return
+        self._prev_hash = seal
+        self.flushed += len(batch)
+        self.batches += 1
+        self.last_flush_at = time.time()
+
+    def _maybe_rotate(self):
+        too_big = self.max_bytes and self._file.tell() >= self.max_bytes
+        too_old = self.rotate_interval and time.time() - self._opened_at >= self.rotate_interval
+        if not (too_big or too_old) or self._file.tell() == 0:
+            return
+        self._file.close()
+        segment = f"{self.path}.{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}"
+        os.replace(self.path, segment)
+        self.rotations += 1
+        threading.Thread(target=_compress_segment, args=(segment,), daemon=True).start()
+        self._open()
+
+    def close(self, timeout=10.0):
+        """Flush pending records and stop the writer."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._closing = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "rotations": self.rotations,
+            "write_errors": self.write_errors,
+            "last_flush_at": self.last_flush_at,
+        }
+
+
+def _compress_segment(segment):
+    try:
+        with open(segment, "rb") as src, gzip.open(segment + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(segment)
+    except OSError as e:
+        logger.error(f"Compressing audit segment failed: {type(e).__name__}")
+
+
+def verify_chain(paths, prev_hash=GENESIS_HASH):
+    """
+    Check the seal chain over log segments given oldest first (.gz or plain).
+    Returns (ok, records_verified, error message or None).
+    """
+    verified = 0
+    pending = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    return False, verified, f"{path}: unparseable line"
+                if record.get("type") != "seal":
+                    pending.append(line if line.endswith(b"\n") else line + b"\n")
+                    continue
+                if record.get("prev") != prev_hash:
+                    return False, verified, f"{path}: chain broken before seal {record.get('hash')}"
+                if record.get("count") != len(pending) or _seal_hash(prev_hash, b"".join(pending)) != record.get("hash"):
+                    return False, verified, f"{path}: batch sealed by {record.get('hash')} was modified"
+                verified += len(pending)
+                prev_hash = record["hash"]
+                pending = []
+    if pending:
+        return False, verified, f"{len(pending)} trailing records are not sealed"
+    return True, verified, None
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_audit_sink():
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = AuditSink()
+    return _sink
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Verify the audit log hash chain across rotated segments")
+    parser.add_argument("--path", default=AUDIT_LOG_PATH)
+    args = parser.parse_args()
+    segments = log_segments(args.path)
+    ok, verified, error = verify_chain(segments)
+    print(f"{'OK' if ok else 'BROKEN'}: {verified} records in {len(segments)} segments" + (f" ({error})" if error else ""))
+    raise SystemExit(0 if ok else 1)
@@ -1,13 +1,58 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Text, LargeBinary
+from sqlalchemy import create_engine, event, inspect, text, func, select, Column, Integer, String, DateTime, ForeignKey, Text, LargeBinary, Index, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import os
 import datetime
+import logging
+
+logger = logging.getLogger("metadata_db")
 
 # Using SQLite for metadata as a local replacement if PostgreSQL isn't pre-configured
-# but structure is compatible with PostgreSQL
-SQLALCHEMY_DATABASE_URL = "sqlite:///./metadata.db"
+# but structure is compatible with PostgreSQL (set DATABASE_URL=postgresql://...)
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./metadata.db")
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_SEC = float(os.environ.get("DB_POOL_TIMEOUT_SEC", "30"))
+DB_POOL_RECYCLE_SEC = int(os.environ.get("DB_POOL_RECYCLE_SEC", "1800"))
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL is durable across app crashes in WAL mode
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_KB = int(os.environ.get("SQLITE_CACHE_KB", "65536"))
+SQLITE_MMAP_BYTES = int(os.environ.get("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+
+
+def _engine_kwargs(url):
+    kwargs = {"pool_pre_ping": True}
+    if url.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000.0}
+        if ":memory:" in url or url.rstrip("/") == "sqlite:":
+            return kwargs
+    kwargs.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SEC,
+        pool_recycle=DB_POOL_RECYCLE_SEC,
+    )
+    return kwargs
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_kwargs(SQLALCHEMY_DATABASE_URL))
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets the API read while job workers write; the other pragmas are per connection
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -21,10 +66,98 @@ class User(Base):
 class PatientStudy(Base):
     __tablename__ = "studies"
     id = Column(Integer, primary_key=True, index=True)
+    study_id = Column(String, index=True, nullable=True)
     patient_uuid = Column(String, index=True) # Anonymized ID
     study_date = Column(DateTime, default=datetime.datetime.utcnow)
     file_path = Column(String) # Encrypted file storage path
     metadata_json = Column(LargeBinary) # Fernet encrypted metadata
+    # Blind indexes (keyed HMACs, see utils.security.blind_index) for searching without decrypting metadata_json
+    patient_uuid_bidx = Column(String(32), nullable=True)
+    modality_bidx = Column(String(32), nullable=True)
+    study_day_bidx = Column(String(32), nullable=True)
+    __table_args__ = (
+        # Listing is keyset-paginated on (study_date, id) within each filter
+        Index("ix_studies_patient_date", "patient_uuid_bidx", "study_date", "id"),
+        Index("ix_studies_modality_date", "modality_bidx", "study_date", "id"),
+        Index("ix_studies_day", "study_day_bidx", "id"),
+        Index("ix_studies_date", "study_date", "id"),
+    )
+
+class StudyJob(Base):
+    __tablename__ = "study_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    study_id = Column(String, unique=True, index=True)
+    patient_uuid = Column(String, index=True) # Anonymized ID
+    status = Column(String, index=True, default="queued") # 'queued', 'running', 'completed', 'failed'
+    submitted_by = Column(String)
+    worker_id = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)
+    error = Column(Text, nullable=True) # Exception type only, never PHI
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    shard = Column(Integer, nullable=True) # hash(patient_uuid) % JOB_SHARDS, see jobs.shard_for
+    lease_expires_at = Column(DateTime, nullable=True) # Extended by the running worker's heartbeat
+    __table_args__ = (
+        # Workers claim the oldest queued job within their shards
+        Index("ix_study_jobs_claim", "status", "shard", "created_at"),
+    )
+
+class StudyWorker(Base):
+    __tablename__ = "study_workers"
+    id = Column(Integer, primary_key=True, index=True)
+    worker_id = Column(String, unique=True, index=True) # host:pid
+    host = Column(String)
+    shards = Column(String) # Comma-separated shard numbers, empty for all
+    status = Column(String, default="running") # 'running', 'stopped'
+    started_at = Column(DateTime, default=datetime.datetime.utcnow)
+    heartbeat_at = Column(DateTime, default=datetime.datetime.utcnow)
+    jobs_completed = Column(Integer, default=0)
+    jobs_failed = Column(Integer, default=0)
+    busy_seconds = Column(Float, default=0.0)
+
+class StudyResult(Base):
+    __tablename__ = "study_results"
+    id = Column(Integer, primary_key=True, index=True)
+    study_id = Column(String, ForeignKey("study_jobs.study_id"), unique=True, index=True)
+    result_json = Column(LargeBinary) # Fernet encrypted pipeline output
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+def _add_missing_columns():
+    """create_all() never alters existing tables; add columns introduced since a database was created."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in present:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    logger.info(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+def db_utcnow(db):
+    """
+    Current UTC time on the database server (naive, like every DateTime column).
+    Job leases are stamped and compared with it, so hosts never lease against
+    their own, possibly skewed, clocks.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        expr = func.timezone("UTC", func.now())
+    elif dialect == "mysql":
+        expr = func.utc_timestamp()
+    else:
+        expr = func.strftime("%Y-%m-%d %H:%M:%f", "now")  # UTC, millisecond resolution on SQLite
+    value = db.scalar(select(expr))
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return value.replace(tzinfo=None)
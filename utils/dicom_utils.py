@@ -0,0 +1,178 @@
+"""
+Metadata-only DICOM de-identification.
+
+Only tags on a whitelist of acquisition/geometry attributes survive
+(DEIDENTIFY_KEEP_TAGS overrides it); everything else, including private
+tags and any non-DICOM header text, is erased. Instance UIDs are replaced
+by keyed pseudonyms ("2.25." + HMAC) so slices of one series still group
+together after de-identification without exposing the original UIDs. The
+key must be configured (BLIND_INDEX_KEY or FERNET_KEY); a per-process key
+would give each worker and run different pseudonyms, so that is refused.
+
+The pixel buffer is never touched: deidentify_image() edits the image's
+metadata dictionary in place (a copied sitk.Image would duplicate the
+buffer on first modification), and series are processed one file at a
+time, so extra memory stays at one slice per worker whatever the volume
+size.
+"""
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import SimpleITK as sitk
+
+from utils.security import blind_index, BLIND_INDEX_KEY_CONFIGURED
+
+logger = logging.getLogger("dicom_utils")
+
+# Acquisition, geometry and pixel-encoding attributes; no names, dates, IDs, institutions or free text
+DEFAULT_KEEP_TAGS = frozenset({
+    "0008|0008",  # Image Type
+    "0008|0016",  # SOP Class UID
+    "0008|0060",  # Modality
+    "0008|0070",  # Manufacturer
+    "0018|0015",  # Body Part Examined
+    "0018|0050",  # Slice Thickness
+    "0018|0060",  # KVP
+    "0018|0088",  # Spacing Between Slices
+    "0018|1150",  # Exposure Time
+    "0018|1151",  # X-Ray Tube Current
+    "0018|1210",  # Convolution Kernel
+    "0018|5100",  # Patient Position
+    "0020|0011",  # Series Number
+    "0020|0013",  # Instance Number
+    "0020|0032",  # Image Position (Patient)
+    "0020|0037",  # Image Orientation (Patient)
+    "0020|1041",  # Slice Location
+    "0028|0002",  # Samples per Pixel
+    "0028|0004",  # Photometric Interpretation
+    "0028|0010",  # Rows
+    "0028|0011",  # Columns
+    "0028|0030",  # Pixel Spacing
+    "0028|0100",  # Bits Allocated
+    "0028|0101",  # Bits Stored
+    "0028|0102",  # High Bit
+    "0028|0103",  # Pixel Representation
+    "0028|1050",  # Window Center
+    "0028|1051",  # Window Width
+    "0028|1052",  # Rescale Intercept
+    "0028|1053",  # Rescale Slope
+    "0028|1054",  # Rescale Type
+})
+# Identifiers that must stay consistent across a series; replaced, not kept
+PSEUDONYM_UID_TAGS = frozenset({
+    "0008|0018",  # SOP Instance UID
+    "0020|000d",  # Study Instance UID
+    "0020|000e",  # Series Instance UID
+    "0020|0052",  # Frame of Reference UID
+})
+_env_keep = os.environ.get("DEIDENTIFY_KEEP_TAGS")
+KEEP_TAGS = frozenset(t.strip().lower() for t in _env_keep.split(",") if t.strip()) if _env_keep else DEFAULT_KEEP_TAGS
+DEIDENTIFY_WORKERS = int(os.environ.get("DEIDENTIFY_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+DEIDENTIFIED_MARKERS = {
+    "0012|0062": "YES",                # Patient Identity Removed
+    "0012|0063": "Tag whitelist",      # De-identification Method
+}
+
+
+def require_pseudonym_key():
+    """
+    UID pseudonyms are only stable if the blind-index key is: with a key
+    generated per process, every pool worker and every run would map the
+    same UID differently and break study/series linkage.
+    """
+    if not BLIND_INDEX_KEY_CONFIGURED:
+        raise RuntimeError("Set BLIND_INDEX_KEY (or FERNET_KEY) before de-identifying DICOM; "
+                           "UID pseudonyms must be stable across processes and runs")
+
+
+def pseudonymize_uid(uid):
+    """Deterministic, keyed replacement UID under the UUID-derived 2.25 root."""
+    require_pseudonym_key()
+    digest = blind_index("dicom_uid", uid.strip().rstrip("\x00"))
+    return f"2.25.{int(digest, 16)}"
+
+
+def deidentify_image(image, keep_tags=None):
+    """
+    Erase every metadata key not on the whitelist from `image`, in place.
+
+    Returns the same image (pixel buffer, spacing, origin and direction are
+    untouched) and the number of keys removed.
+    """
+    keep_tags = KEEP_TAGS if keep_tags is None else frozenset(t.lower() for t in keep_tags)
+    removed = 0
+    for key in image.GetMetaDataKeys():
+        normalized = key.lower()
+        if normalized in PSEUDONYM_UID_TAGS:
+            image.SetMetaData(key, pseudonymize_uid(image.GetMetaData(key)))
+        elif normalized not in keep_tags:
+            image.EraseMetaData(key)
+            removed += 1
+    for key, value in DEIDENTIFIED_MARKERS.items():
+        image.SetMetaData(key, value)
+    return image, removed
+
+
+def _deidentify_file(src, dst, keep_tags):
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(src)
+    reader.LoadPrivateTagsOn()
+    image = reader.Execute()
+    image, removed = deidentify_image(image, keep_tags)
+    writer = sitk.ImageFileWriter()
+    # UIDs come from the (pseudonymized) metadata instead of being regenerated per file
+    writer.KeepOriginalImageUIDOn()
+    writer.SetFileName(dst)
+    writer.Execute(image)
+    return removed
+
+
+def deidentify_series(src_dir, dst_dir, keep_tags=None):
+    """De-identify every file of the DICOM series in `src_dir` into `dst_dir`, one slice at a time."""
+    file_names = sitk.ImageSeriesReader.GetGDCMSeriesFileNames(src_dir)
+    if not file_names:
+        raise ValueError(f"No DICOM series found in {src_dir}")
+    os.makedirs(dst_dir, exist_ok=True)
+    removed = 0
+    for src in file_names:
+        removed += _deidentify_file(src, os.path.join(dst_dir, os.path.basename(src)), keep_tags)
+    return {"src": src_dir, "dst": dst_dir, "files": len(file_names), "tags_removed": removed}
+
+
+def find_series_dirs(root):
+    """Directories under `root` that hold a DICOM series."""
+    return [d for d, _, files in os.walk(root) if files and sitk.ImageSeriesReader.GetGDCMSeriesIDs(d)]
+
+
+def deidentify_tree(src_root, dst_root, keep_tags=None, workers=DEIDENTIFY_WORKERS):
+    """
+    De-identify every series directory under `src_root` into the same
+    relative layout under `dst_root`; series run in parallel on `workers`
+    processes. Returns one summary dict per series.
+    """
+    require_pseudonym_key()
+    jobs = [(d, os.path.join(dst_root, os.path.relpath(d, src_root))) for d in find_series_dirs(src_root)]
+    if workers > 1 and len(jobs) > 1:
+        # spawn, like the other pools: this also runs inside the API/worker process, where forking
+        # with torch/OpenMP threads loaded is unsafe. Children read the pseudonym key from the environment
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(deidentify_series, *zip(*jobs), [keep_tags] * len(jobs)))
+    else:
+        results = [deidentify_series(src, dst, keep_tags) for src, dst in jobs]
+    logger.info(f"De-identified {sum(r['files'] for r in results)} files in {len(results)} series")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Whitelist-based DICOM de-identification")
+    parser.add_argument("src_root")
+    parser.add_argument("dst_root")
+    parser.add_argument("--workers", type=int, default=DEIDENTIFY_WORKERS)
+    args = parser.parse_args()
+    print(json.dumps(deidentify_tree(args.src_root, args.dst_root, workers=args.workers), indent=2))
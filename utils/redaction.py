@@ -0,0 +1,99 @@
+"""
+Span-level PHI redaction for clinical free text and log messages.
+
+All detectors are alternatives of one compiled regular expression, so a
+text is scanned once from left to right regardless of how many PHI types
+are enabled. Every alternative is anchored on a literal cue (a label such
+as "MRN:", an honorific, digit groups) or, for e-mail addresses, bounded
+to a local part of at most 64 characters before its '@'; none contains
+nested or overlapping unbounded quantifiers, so matching stays linear in
+the input length.
+
+Labelled values keep their label: "Patient Name: John Doe" becomes
+"Patient Name: [NAME]".
+"""
+import re
+
+_MONTHS = (r"(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|Jun(?:e)?|Jul(?:y)?|Aug(?:ust)?"
+           r"|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)")
+# A capitalized word or an initial; never a following "Label:" (e.g. "MRN:")
+_NAME_TOKEN = r"[A-Z](?:[a-zA-Z'\-]+|\.)?(?![a-zA-Z'\-]|\s*[:#])"
+_PERSON = _NAME_TOKEN + r"(?:[ ^]" + _NAME_TOKEN + r"){0,3}"
+
+# (kind, pattern); a group named <kind>_label, when present, is kept verbatim
+_DETECTORS = [
+    # Local part and domain labels are bounded (RFC 5321 limits), so a failed attempt
+    # from one word start costs at most ~64 steps instead of rescanning the rest of the text
+    ("EMAIL", r"\b[A-Za-z0-9._%+\-]{1,64}@(?:[A-Za-z0-9\-]{1,63}\.){1,8}[A-Za-z]{2,63}\b"),
+    ("SSN", r"(?P<SSN_label>\b(?:SSN|Social Security(?: Number| No\.?)?)\s*[:#]?\s*)?\b\d{3}-\d{2}-\d{4}\b"),
+    ("MRN", r"(?P<MRN_label>\b(?:MRN|Medical Record(?: Number| No\.?| #)?|Patient ID|Accession(?: Number| No\.?)?)\s*[:#]?\s*)"
+            r"[A-Z0-9][A-Z0-9\-]{3,}\b"),
+    ("NAME", r"(?P<NAME_label>\b(?:Patient Name|Patient|Name|Pt|Referring Physician|Physician)\s*:\s*"
+             r"(?:(?:Dr|Mr|Mrs|Ms|Miss)\.?\s)?)" + _PERSON
+             + r"|(?P<NAME_title>\b(?:Dr|Mr|Mrs|Ms|Miss)\.?\s)" + _PERSON),
+    ("DATE", r"(?P<DATE_label>\b(?:DOB|D\.O\.B\.|Date of Birth|Birth ?Date)\s*[:#]?\s*)?"
+             r"(?:\b\d{4}[-/.]\d{1,2}[-/.]\d{1,2}\b|\b\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}\b"
+             r"|\b" + _MONTHS + r"\.? \d{1,2},? \d{4}\b|\b\d{1,2} " + _MONTHS + r"\.? \d{4}\b)"),
+    ("PHONE", r"(?P<PHONE_label>\b(?:Phone|Tel|Telephone|Mobile|Cell|Fax)\s*[:#]?\s*)?"
+              r"(?:\+?1[\s.\-]?)?(?:\(\d{3}\)\s?|\b\d{3}[\s.\-])\d{3}[\s.\-]\d{4}\b"),
+]
+
+PHI_KINDS = tuple(kind for kind, _ in _DETECTORS)
+
+# Every detector except EMAIL starts on an uppercase letter, a digit, '(' or '+'.
+# Matches may only begin at a word start, and the other detectors are only tried
+# when that first character fits, so most positions fail after one or two checks.
+_ANY_CASE_KINDS = ("EMAIL",)
+_CUE = r"(?=[A-Z0-9(+])"
+
+
+class PHIRedactor:
+    """Compiled single-pass redactor; `kinds` restricts which detectors are active."""
+    def __init__(self, kinds=PHI_KINDS, placeholder="[{kind}]"):
+        unknown = set(kinds) - set(PHI_KINDS)
+        if unknown:
+            raise ValueError(f"Unknown PHI kinds: {sorted(unknown)}")
+        self.kinds = tuple(kinds)
+        self.placeholder = placeholder
+        cued = [f"(?P<{kind}>{pattern})" for kind, pattern in _DETECTORS if kind in kinds and kind not in _ANY_CASE_KINDS]
+        uncued = [f"(?P<{kind}>{pattern})" for kind, pattern in _DETECTORS if kind in kinds and kind in _ANY_CASE_KINDS]
+        branches = ([f"{_CUE}(?:{'|'.join(cued)})"] if cued else []) + uncued
+        self._pattern = re.compile(r"(?<!\w)(?:" + "|".join(branches) + ")")
+        self._labels = {kind: [g for g in self._pattern.groupindex if g.startswith(kind + "_")] for kind in self.kinds}
+        self._replacements = {kind: placeholder.format(kind=kind) for kind in self.kinds}
+
+    def _replace(self, match):
+        kind = match.lastgroup
+        for label_group in self._labels[kind]:
+            label = match.group(label_group)
+            if label:
+                return label + self._replacements[kind]
+        return self._replacements[kind]
+
+    def redact(self, text):
+        if not text:
+            return text
+        return self._pattern.sub(self._replace, text)
+
+    def redact_batch(self, texts):
+        sub = self._pattern.sub
+        replace = self._replace
+        return [sub(replace, t) if t else t for t in texts]
+
+    def find(self, text):
+        """(kind, start, end) spans of detected PHI, for auditing detector coverage."""
+        return [(m.lastgroup, m.start(), m.end()) for m in self._pattern.finditer(text or "")]
+
+    def contains_phi(self, text):
+        return bool(text) and self._pattern.search(text) is not None
+
+
+default_redactor = PHIRedactor()
+
+
+def redact_phi(text):
+    return default_redactor.redact(text)
+
+
+def redact_phi_batch(texts):
+    return default_redactor.redact_batch(texts)
@@ -0,0 +1,382 @@
+"""
+Chunked, seekable encrypted volume format used for `image.enc`.
+
+Layout (all integers little-endian):
+
+    MAGIC (8 bytes)
+    header length (uint32) + header JSON (shape, dtype, spacing, chunking, storage dtype, codec)
+    chunk 0 .. chunk N-1        each: nonce (12) + AES-GCM ciphertext + tag (16)
+    index chunk                 encrypted array of (offset, length) uint64 pairs
+    index offset (uint64) + END_MAGIC (8 bytes)
+
+Every chunk is authenticated with SHA-256(header) and its own position as
+associated data, so a modified header, a reordered chunk or a chunk copied
+from another volume all fail decryption. Chunks hold whole slices along
+axis 0, which lets the reader decrypt only the slices it is asked for.
+
+Since version 2 a chunk's plaintext is the storage codec's output (see
+utils/volume_codec.py): slices in a lossless narrow storage dtype, delta/
+shuffle filtered and zlib-compressed. Version 1 files hold raw slice bytes
+and stay readable.
+"""
+import os
+import json
+import time
+import struct
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.security import EncryptionHandler
+from utils.volume_codec import VOLUME_CODEC, ChunkCodec, to_storage, from_storage, plan_storage_dtype
+
+MAGIC = b"MRAVOL1\x00"
+END_MAGIC = b"MRAVEND\x00"
+FORMAT_VERSION = 2
+TARGET_CHUNK_BYTES = 4 * 1024 * 1024
+INDEX_CHUNK_ID = 0xFFFFFFFF
+ENCRYPT_WORKERS = int(os.environ.get("VOLUME_ENCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_TRAILER = struct.Struct("<Q8s")
+_INDEX_ENTRY = np.dtype([("offset", "<u8"), ("length", "<u8")])
+
+
+class VolumeFormatError(Exception):
+    """Raised for files that are not (valid) chunked volumes."""
+
+
+def is_chunked_volume(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _chunk_aad(header_digest, chunk_id):
+    return header_digest + struct.pack("<I", chunk_id)
+
+
+def _slices_per_chunk(shape, itemsize, target_bytes=TARGET_CHUNK_BYTES):
+    slice_bytes = int(np.prod(shape[1:], dtype=np.int64)) * itemsize if len(shape) > 1 else itemsize
+    return max(1, target_bytes // max(1, slice_bytes))
+
+
+class VolumeWriter:
+    """
+    Streaming writer: slabs are appended along axis 0 and encrypted on a
+    small thread pool (AES-GCM releases the GIL) while earlier chunks are
+    written out in order. At most 2 x workers chunks are held in memory.
+    """
+    def __init__(self, path, shape, dtype, spacing=None, slices_per_chunk=None, workers=ENCRYPT_WORKERS,
+                 storage_dtype=None, rescale=None, codec=VOLUME_CODEC):
+        dtype = np.dtype(dtype)
+        self.path = path
+        self.shape = tuple(int(d) for d in shape)
+        self.dtype = dtype
+        self.storage_dtype = np.dtype(storage_dtype or dtype)
+        self.rescale = [float(v) for v in rescale] if rescale is not None else None
+        self.codec = ChunkCodec(self.storage_dtype) if codec != "none" else None
+        self.slices_per_chunk = slices_per_chunk or _slices_per_chunk(self.shape, self.storage_dtype.itemsize)
+        total = self.shape[0] if self.shape else 1
+        self.num_chunks = max(1, -(-total // self.slices_per_chunk))
+        header = {
+            "version": FORMAT_VERSION,
+            "shape": list(self.shape),
+            "dtype": dtype.str,
+            "storage_dtype": self.storage_dtype.str,
+            "rescale": self.rescale,
+            "codec": self.codec.describe() if self.codec else {"compression": "none"},
+            "spacing": list(spacing) if spacing is not None else None,
+            "slices_per_chunk": self.slices_per_chunk,
+            "num_chunks": self.num_chunks,
+        }
+        self._header_bytes = json.dumps(header, sort_keys=True).encode()
+        self._digest = hashlib.sha256(self._header_bytes).digest()
+        self._tmp_path = path + ".tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(MAGIC)
+        self._file.write(struct.pack("<I", len(self._header_bytes)))
+        self._file.write(self._header_bytes)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers)) if workers > 1 else None
+        self._max_pending = max(1, workers) * 2
+        self._pending = deque()
+        self._buffer = []
+        self._buffered = 0
+        self._next_chunk = 0
+        self._slices_written = 0
+        self._index = []
+        self._stats_lock = threading.Lock()
+        self._encode_sec = 0.0
+        self._started = time.perf_counter()
+        self.stats = None
+
+    def _encrypt(self, data, chunk_id):
+        return EncryptionHandler.encrypt_chunk(data, _chunk_aad(self._digest, chunk_id))
+
+    def _encode_and_encrypt(self, chunk, chunk_id):
+        started = time.perf_counter()
+        payload = self.codec.encode(chunk) if self.codec else chunk.tobytes()
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self._encode_sec += elapsed
+        return self._encrypt(payload, chunk_id)
+
+    def _emit(self, data):
+        chunk_id = self._next_chunk
+        self._next_chunk += 1
+        if self._executor is None:
+            self._write_blob(self._encode_and_encrypt(data, chunk_id))
+            return
+        self._pending.append(self._executor.submit(self._encode_and_encrypt, data, chunk_id))
+        while len(self._pending) >= self._max_pending:
+            self._write_blob(self._pending.popleft().result())
+
+    def _write_blob(self, blob):
+        self._index.append((self._file.tell(), len(blob)))
+        self._file.write(blob)
+
+    def write_slab(self, slab):
+        """Append slices (an array whose trailing dims match the volume's)."""
+        slab = np.asarray(slab, dtype=self.dtype)
+        if len(self.shape) > 1 and slab.shape[1:] != self.shape[1:]:
+            raise ValueError(f"Slab shape {slab.shape} does not match volume {self.shape}")
+        slab = to_storage(slab, self.storage_dtype, self.rescale)
+        start = 0
+        n = slab.shape[0] if slab.ndim else 1
+        while start < n:
+            take = min(self.slices_per_chunk - self._buffered, n - start)
+            part = slab[start:start + take]
+            # A partial chunk outlives this call, so it must not alias the caller's buffer
+            self._buffer.append(part if self._buffered + take == self.slices_per_chunk else part.copy())
+            self._buffered += take
+            start += take
+            if self._buffered == self.slices_per_chunk:
+                self._flush_buffer()
+        self._slices_written += n
+
+    def _flush_buffer(self):
+        if not self._buffer:
+            return
+        # Encoding runs on the pool, so the chunk is copied off the caller's buffer here
+        data = self._buffer[0].copy() if len(self._buffer) == 1 else np.concatenate(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self._emit(data)
+
+    def close(self):
+        """Finish the file, atomically move it into place and return its codec stats."""
+        try:
+            self._flush_buffer()
+            while self._pending:
+                self._write_blob(self._pending.popleft().result())
+            expected = self.shape[0] if self.shape else 1
+            if self._slices_written != expected or len(self._index) != self.num_chunks:
+                raise VolumeFormatError(f"Wrote {self._slices_written} of {expected} slices")
+            index = np.array(self._index, dtype=_INDEX_ENTRY).tobytes()
+            index_offset = self._file.tell()
+            self._file.write(self._encrypt(index, INDEX_CHUNK_ID))
+            self._file.write(_TRAILER.pack(index_offset, END_MAGIC))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except BaseException:
+            self.abort()
+            raise
+        stored_bytes = self._file.tell()
+        self._file.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        os.replace(self._tmp_path, self.path)
+        raw_bytes = int(np.prod(self.shape, dtype=np.int64)) * self.dtype.itemsize
+        self.stats = {
+            "codec": self.codec.describe()["compression"] if self.codec else "none",
+            "dtype": self.dtype.name,
+            "storage_dtype": self.storage_dtype.name,
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "compression_ratio": raw_bytes / stored_bytes if stored_bytes else 0.0,
+            "encode_mb_per_sec": raw_bytes / 1e6 / self._encode_sec if self._encode_sec else 0.0,
+            "write_mb_per_sec": raw_bytes / 1e6 / (time.perf_counter() - self._started),
+        }
+        return self.stats
+
+    def abort(self):
+        self._file.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_volume(path, array, spacing=None, slices_per_chunk=None, workers=ENCRYPT_WORKERS,
+                 rescale=None, codec=VOLUME_CODEC):
+    """
+    Encrypt an array, or any volume exposing iter_slabs() (e.g. LazyVolume),
+    into the chunked format; returns the writer's codec stats.
+
+    In-memory arrays are stored in the narrowest lossless integer dtype
+    (optionally after `rescale` = (slope, intercept)); streamed volumes keep
+    their native dtype, since finding a narrower one would take an extra
+    full read.
+    """
+    if hasattr(array, "iter_slabs"):
+        writer = VolumeWriter(path, array.shape, array.dtype, spacing or getattr(array, "spacing", None),
+                              slices_per_chunk, workers, codec=codec)
+        with writer:
+            for _, slab in array.iter_slabs():
+                writer.write_slab(slab)
+        return writer.stats
+    array = np.asarray(array)
+    shape = array.shape if array.ndim else (1,)
+    storage_dtype = plan_storage_dtype(array.reshape(shape), rescale)
+    if storage_dtype == array.dtype:
+        rescale = None
+    writer = VolumeWriter(path, shape, array.dtype, spacing, slices_per_chunk, workers,
+                          storage_dtype=storage_dtype, rescale=rescale, codec=codec)
+    volume = array.reshape(shape)
+    with writer:
+        # One chunk at a time, so narrowing and its lossless check never hold a full-volume temporary
+        for start in range(0, shape[0], writer.slices_per_chunk):
+            writer.write_slab(volume[start:start + writer.slices_per_chunk])
+    return writer.stats
+
+
+class SecureVolumeReader:
+    """Random-access reader that decrypts only the chunks covering a slice range."""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._read_layout()
+        except Exception:
+            self._file.close()
+            raise
+
+    def _read_layout(self):
+        f = self._file
+        if f.read(len(MAGIC)) != MAGIC:
+            raise VolumeFormatError(f"{self.path} is not a chunked volume")
+        (header_len,) = struct.unpack("<I", f.read(4))
+        header_bytes = f.read(header_len)
+        self.header = json.loads(header_bytes)
+        self._digest = hashlib.sha256(header_bytes).digest()
+        self.shape = tuple(self.header["shape"])
+        self.dtype = np.dtype(self.header["dtype"])
+        # Version 1 headers have neither: raw slices in the volume's own dtype
+        self.storage_dtype = np.dtype(self.header.get("storage_dtype", self.header["dtype"]))
+        self.rescale = self.header.get("rescale")
+        self.codec = ChunkCodec.from_header(self.header.get("codec"), self.storage_dtype)
+        self._stats_lock = threading.Lock()
+        self._decode_sec = 0.0
+        self._decoded_bytes = 0
+        self.spacing = tuple(self.header["spacing"]) if self.header.get("spacing") else None
+        self.slices_per_chunk = self.header["slices_per_chunk"]
+        self.num_chunks = self.header["num_chunks"]
+
+        f.seek(-_TRAILER.size, os.SEEK_END)
+        trailer_offset = f.tell()
+        index_offset, end_magic = _TRAILER.unpack(f.read(_TRAILER.size))
+        if end_magic != END_MAGIC:
+            raise VolumeFormatError(f"{self.path} is truncated")
+        f.seek(index_offset)
+        index_blob = f.read(trailer_offset - index_offset)
+        index = np.frombuffer(
+            EncryptionHandler.decrypt_chunk(index_blob, _chunk_aad(self._digest, INDEX_CHUNK_ID)),
+            dtype=_INDEX_ENTRY,
+        )
+        if len(index) != self.num_chunks:
+            raise VolumeFormatError(f"{self.path} index does not match header")
+        self._index = index
+
+    @property
+    def num_slices(self):
+        return self.shape[0] if self.shape else 1
+
+    def _read_chunk(self, chunk_id):
+        offset, length = self._index[chunk_id]
+        # os.pread keeps concurrent chunk reads independent of the shared file position
+        blob = os.pread(self._file.fileno(), int(length), int(offset))
+        return EncryptionHandler.decrypt_chunk(blob, _chunk_aad(self._digest, chunk_id))
+
+    def _chunk_array(self, chunk_id):
+        slices = min(self.slices_per_chunk, self.num_slices - chunk_id * self.slices_per_chunk)
+        shape = (slices,) + tuple(self.shape[1:])
+        payload = self._read_chunk(chunk_id)
+        started = time.perf_counter()
+        if self.codec is None:
+            chunk = np.frombuffer(payload, dtype=self.storage_dtype).reshape(shape)
+        else:
+            chunk = self.codec.decode(payload, shape)
+        chunk = from_storage(chunk, self.dtype, self.rescale)
+        with self._stats_lock:
+            self._decode_sec += time.perf_counter() - started
+            self._decoded_bytes += chunk.nbytes
+        return chunk
+
+    def storage_stats(self):
+        """Compression ratio of the stored file and decode throughput of the reads so far."""
+        raw_bytes = int(np.prod(self.shape, dtype=np.int64)) * self.dtype.itemsize
+        stored_bytes = os.fstat(self._file.fileno()).st_size
+        with self._stats_lock:
+            decode_sec, decoded = self._decode_sec, self._decoded_bytes
+        return {
+            "version": self.header.get("version", 1),
+            "codec": self.codec.describe()["compression"] if self.codec else "none",
+            "dtype": self.dtype.name,
+            "storage_dtype": self.storage_dtype.name,
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "compression_ratio": raw_bytes / stored_bytes if stored_bytes else 0.0,
+            "decode_mb_per_sec": decoded / 1e6 / decode_sec if decode_sec else None,
+        }
+
+    def read_slices(self, start=0, stop=None, workers=1):
+        """Decrypt slices [start, stop) along axis 0."""
+        stop = self.num_slices if stop is None else min(stop, self.num_slices)
+        start = max(0, start)
+        if stop <= start:
+            return np.empty((0,) + tuple(self.shape[1:]), dtype=self.dtype)
+        first = start // self.slices_per_chunk
+        last = (stop - 1) // self.slices_per_chunk
+        out = np.empty((stop - start,) + tuple(self.shape[1:]), dtype=self.dtype)
+        chunk_ids = range(first, last + 1)
+        if workers > 1 and len(chunk_ids) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as ex:
+                chunks = ex.map(self._chunk_array, chunk_ids)
+                self._copy_chunks(out, start, stop, chunk_ids, chunks)
+        else:
+            self._copy_chunks(out, start, stop, chunk_ids, map(self._chunk_array, chunk_ids))
+        return out
+
+    def _copy_chunks(self, out, start, stop, chunk_ids, chunks):
+        for chunk_id, chunk in zip(chunk_ids, chunks):
+            chunk_start = chunk_id * self.slices_per_chunk
+            lo = max(start, chunk_start)
+            hi = min(stop, chunk_start + chunk.shape[0])
+            out[lo - start:hi - start] = chunk[lo - chunk_start:hi - chunk_start]
+
+    def read_all(self, workers=ENCRYPT_WORKERS):
+        return self.read_slices(0, None, workers=workers).reshape(self.shape)
+
+    def iter_slabs(self, slab_size=None):
+        """Yield (start_slice, array) per chunk, holding one chunk in memory at a time (slab_size is ignored)."""
+        for chunk_id in range(self.num_chunks):
+            yield chunk_id * self.slices_per_chunk, self._chunk_array(chunk_id)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,11 +1,22 @@
 import os
+import hmac
+import time
+import hashlib
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import logging
-import json
+from utils.audit import get_audit_sink
+from utils.redaction import redact_phi
 
 # Monkeypatch passlib for bcrypt 4.0+ compatibility in Python 3.12
 import bcrypt
@@ -16,6 +27,9 @@ if not hasattr(bcrypt, "__about__"):
 SECRET_KEY = os.environ.get("HIPAA_SECRET_KEY", "7b6f634f6d3957545366436e59325453")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "4096"))
+TOKEN_CACHE_TTL_SEC = float(os.environ.get("TOKEN_CACHE_TTL_SEC", "300"))
+AUTH_HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
 FERNET_KEY = os.environ.get("FERNET_KEY", Fernet.generate_key().decode())
 
 # Security Contexts
@@ -23,31 +37,46 @@ FERNET_KEY = os.environ.get("FERNET_KEY", Fernet.generate_key().decode())
 pwd_context = CryptContext(schemes=["pbkdf2_sha256", "bcrypt"], deprecated="auto")
 cipher_suite = Fernet(FERNET_KEY.encode())
 
+# Volume chunks use AES-256-GCM (raw binary, no base64) under a key derived from FERNET_KEY
+VOLUME_NONCE_SIZE = 12
+volume_cipher = AESGCM(HKDF(
+    algorithm=hashes.SHA256(), length=32, salt=None, info=b"secure-volume-chunk-v1",
+).derive(FERNET_KEY.encode()))
+
+# Blind indexes: keyed hashes of searchable metadata fields, stored next to the
+# encrypted metadata so equality lookups hit a database index without decrypting rows
+BLIND_INDEX_KEY = os.environ.get("BLIND_INDEX_KEY") or FERNET_KEY
+# False when both keys were generated for this process only; blind indexes then differ per process and run
+BLIND_INDEX_KEY_CONFIGURED = bool(os.environ.get("BLIND_INDEX_KEY") or os.environ.get("FERNET_KEY"))
+_blind_index_key = HKDF(
+    algorithm=hashes.SHA256(), length=32, salt=None, info=b"blind-index-v1",
+).derive(BLIND_INDEX_KEY.encode())
+
 # Structured Audit Logging (PHI Masking)
+# Records go through a queue-backed, hash-chained sink (utils/audit.py) so the
+# request path never serializes or touches the log file
 logger = logging.getLogger("hipaa_audit")
-logger.setLevel(logging.INFO)
-handler = logging.FileHandler("/root/MedicalReportAnalysis/logs/audit.log")
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
 
 def mask_phi(data: str) -> str:
-    """Mask potential PHI in strings for audit logs."""
-    # Basic masking for sensitive fields if they appear in logs
-    phi_keywords = ['name', 'dob', 'ssn', 'phone', 'address', 'email']
-    if any(key in data.lower() for key in phi_keywords):
-        return "***REDACTED_PHI***"
-    return data
+    """Mask PHI spans (names, dates, MRNs, phones, emails, SSNs) in strings for audit logs."""
+    return redact_phi(data)
 
 def log_audit_event(user_id: str, action: str, resource_id: str, status: str):
     log_entry = {
         "timestamp": datetime.utcnow().isoformat(),
         "user_id": user_id,
         "action": action,
-        "resource_id": resource_id,
+        "resource_id": mask_phi(resource_id),
         "status": status
     }
-    logger.info(json.dumps(log_entry))
+    get_audit_sink().submit(log_entry)
+
+def blind_index(field: str, value) -> Optional[str]:
+    """Keyed HMAC-SHA256 (128-bit hex) of a whitespace/case-normalized field value; None for empty values."""
+    if value is None or str(value).strip() == "":
+        return None
+    normalized = " ".join(str(value).split()).lower()
+    return hmac.new(_blind_index_key, f"{field}:{normalized}".encode(), hashlib.sha256).hexdigest()[:32]
 
 class EncryptionHandler:
     @staticmethod
@@ -58,6 +87,17 @@ class EncryptionHandler:
     def decrypt_data(token: bytes) -> bytes:
         return cipher_suite.decrypt(token)
 
+    @staticmethod
+    def encrypt_chunk(data, associated_data: bytes) -> bytes:
+        """AES-GCM encrypt one volume chunk; returns nonce + ciphertext + tag."""
+        nonce = os.urandom(VOLUME_NONCE_SIZE)
+        return nonce + volume_cipher.encrypt(nonce, data, associated_data)
+
+    @staticmethod
+    def decrypt_chunk(blob, associated_data: bytes) -> bytes:
+        blob = memoryview(blob)
+        return volume_cipher.decrypt(blob[:VOLUME_NONCE_SIZE], blob[VOLUME_NONCE_SIZE:], associated_data)
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
@@ -72,4 +112,114 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+
+# Password hashing is CPU-bound (pbkdf2 releases the GIL inside hashlib), so the
+# async wrappers run it on a small dedicated pool: a login storm then queues
+# behind AUTH_HASH_WORKERS threads instead of stalling the event loop or
+# starving the shared threadpool other endpoints use.
+_hash_executor = None
+_hash_executor_lock = threading.Lock()
+_dummy_hash = None
+
+
+def _get_hash_executor():
+    global _hash_executor
+    if _hash_executor is None:
+        with _hash_executor_lock:
+            if _hash_executor is None:
+                _hash_executor = ThreadPoolExecutor(max_workers=max(1, AUTH_HASH_WORKERS), thread_name_prefix="auth-hash")
+    return _hash_executor
+
+
+async def get_password_hash_async(password):
+    return await asyncio.get_running_loop().run_in_executor(_get_hash_executor(), get_password_hash, password)
+
+
+async def verify_password_async(plain_password, hashed_password):
+    return await asyncio.get_running_loop().run_in_executor(
+        _get_hash_executor(), verify_password, plain_password, hashed_password)
+
+
+async def verify_password_or_dummy_async(plain_password, hashed_password):
+    """Like verify_password_async, but an unknown user (hashed_password None) costs the same time."""
+    global _dummy_hash
+    if hashed_password is not None:
+        return await verify_password_async(plain_password, hashed_password)
+    if _dummy_hash is None:
+        _dummy_hash = await get_password_hash_async("dummy-password-for-timing")
+    await verify_password_async(plain_password, _dummy_hash)
+    return False
+
+
+class TokenCache:
+    """
+    Bounded LRU of verified JWT claims, keyed by the raw token.
+
+    An entry lives until the token's own "exp" or `ttl_sec` after it was
+    verified, whichever comes first, so a cached token is never accepted
+    after it expires. Only successfully verified tokens are cached.
+    """
+    def __init__(self, max_entries=TOKEN_CACHE_SIZE, ttl_sec=TOKEN_CACHE_TTL_SEC):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._entries = OrderedDict()  # token -> (expires_at, claims)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(token)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[token]
+            self.misses += 1
+        return None
+
+    def put(self, token, claims):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl_sec
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        with self._lock:
+            self._entries[token] = (expires_at, claims)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+token_cache = TokenCache()
+
+
+def decode_access_token(token: str) -> dict:
+    """Verified claims of `token`, from token_cache when possible; raises JWTError."""
+    claims = token_cache.get(token)
+    if claims is None:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        token_cache.put(token, claims)
+    return claims
@@ -0,0 +1,191 @@
+"""
+Study metadata store: blind-indexed inserts, bulk ingestion and paginated lookups.
+
+Study metadata stays Fernet-encrypted in PatientStudy.metadata_json. The
+fields we search on (patient_uuid, modality, study day) are additionally
+stored as blind indexes, so a lookup is an equality match on an indexed
+column and only the rows on the requested page are ever decrypted.
+Listing uses keyset pagination on (study_date, id), newest first; the
+cursor is opaque to clients.
+"""
+import re
+import json
+import uuid
+import base64
+import datetime
+
+from cryptography.fernet import InvalidToken
+from sqlalchemy import insert, or_, and_
+
+from utils.db import SessionLocal, PatientStudy, StudyJob, init_db
+from utils.security import EncryptionHandler, blind_index
+
+MAX_PAGE_SIZE = 200
+STUDY_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+def anonymize_patient_id(patient_id):
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, str(patient_id)))
+
+
+def study_day(value):
+    return value.date().isoformat() if isinstance(value, datetime.datetime) else str(value)
+
+
+def search_columns(patient_uuid, modality=None, study_date=None):
+    """Blind-index column values for one study row."""
+    return {
+        "patient_uuid_bidx": blind_index("patient_uuid", patient_uuid),
+        "modality_bidx": blind_index("modality", modality),
+        "study_day_bidx": blind_index("study_day", study_day(study_date)) if study_date else None,
+    }
+
+
+def study_row(study_id, patient_uuid, file_path, encrypted_metadata, modality=None, study_date=None):
+    """Column values for a PatientStudy insert, including its blind indexes."""
+    study_date = study_date or datetime.datetime.utcnow()
+    row = {
+        "study_id": study_id,
+        "patient_uuid": patient_uuid,
+        "study_date": study_date,
+        "file_path": file_path,
+        "metadata_json": encrypted_metadata,
+    }
+    row.update(search_columns(patient_uuid, modality, study_date))
+    return row
+
+
+def bulk_insert_studies(db, rows):
+    """Insert many study_row() dicts with one executemany; the caller commits."""
+    if rows:
+        db.execute(insert(PatientStudy), rows)
+    return len(rows)
+
+
+def existing_studies(db, study_ids):
+    """
+    {study_id: (patient_uuid, has_job)} for the ids that already have a
+    PatientStudy or StudyJob row. Studies stored without analysis (bulk
+    ingestion with --no-queue) have a PatientStudy row but no job.
+    """
+    ids = list(set(study_ids))
+    found = {}
+    if not ids:
+        return found
+    for study_id, patient_uuid in db.query(PatientStudy.study_id, PatientStudy.patient_uuid).filter(
+            PatientStudy.study_id.in_(ids)):
+        found[study_id] = (patient_uuid, False)
+    for study_id, patient_uuid in db.query(StudyJob.study_id, StudyJob.patient_uuid).filter(
+            StudyJob.study_id.in_(ids)):
+        found[study_id] = (patient_uuid, True)
+    return found
+
+
+def encode_cursor(study_date, row_id):
+    raw = json.dumps([study_date.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        study_date, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.datetime.fromisoformat(study_date), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def _read_metadata(study):
+    """Decrypted metadata, or None for rows written under another key."""
+    if not study.metadata_json:
+        return None
+    try:
+        return json.loads(EncryptionHandler.decrypt_data(study.metadata_json))
+    except (InvalidToken, ValueError):
+        return None
+
+
+def find_studies(db, patient_uuid=None, modality=None, study_date=None, limit=50, cursor=None, decrypt=True):
+    """
+    One page of studies matching every given filter, newest first.
+
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    With decrypt=True each item carries its decrypted metadata.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    query = (
+        db.query(PatientStudy, StudyJob.status)
+        .outerjoin(StudyJob, StudyJob.study_id == PatientStudy.study_id)
+    )
+    if patient_uuid is not None:
+        query = query.filter(PatientStudy.patient_uuid_bidx == blind_index("patient_uuid", patient_uuid))
+    if modality is not None:
+        query = query.filter(PatientStudy.modality_bidx == blind_index("modality", modality))
+    if study_date is not None:
+        query = query.filter(PatientStudy.study_day_bidx == blind_index("study_day", study_day(study_date)))
+    if cursor:
+        after_date, after_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            PatientStudy.study_date < after_date,
+            and_(PatientStudy.study_date == after_date, PatientStudy.id < after_id),
+        ))
+    rows = query.order_by(PatientStudy.study_date.desc(), PatientStudy.id.desc()).limit(limit + 1).all()
+
+    items = []
+    for study, job_status in rows[:limit]:
+        item = {
+            "study_id": study.study_id,
+            "status": job_status,
+            "study_date": study.study_date.isoformat() if study.study_date else None,
+        }
+        if decrypt:
+            item["metadata"] = _read_metadata(study)
+        items.append(item)
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1][0]
+        next_cursor = encode_cursor(last.study_date, last.id)
+    return items, next_cursor
+
+
+def backfill_search_columns(db, batch_size=500):
+    """
+    Fill blind indexes for rows written before they existed; decrypts each
+    such row once. Walks the table by primary key, so a row whose index is
+    still empty afterwards (e.g. an empty patient_uuid) is not selected again.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        batch = (
+            db.query(PatientStudy)
+            .filter(PatientStudy.id > last_id,
+                    PatientStudy.patient_uuid_bidx.is_(None), PatientStudy.patient_uuid.isnot(None))
+            .order_by(PatientStudy.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            return updated
+        last_id = batch[-1].id
+        for study in batch:
+            modality = (_read_metadata(study) or {}).get("modality")
+            for column, value in search_columns(study.patient_uuid, modality, study.study_date).items():
+                setattr(study, column, value)
+            if study.study_id is None and study.file_path:
+                study.study_id = study.file_path.rstrip("/").rsplit("/", 1)[-1]
+        db.commit()
+        updated += len(batch)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Study metadata store maintenance")
+    parser.add_argument("--backfill", action="store_true", help="Compute blind indexes for older rows")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    init_db()
+    if args.backfill:
+        with SessionLocal() as db:
+            print(f"Backfilled {backfill_search_columns(db, args.batch_size)} studies")
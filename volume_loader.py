@@ -0,0 +1,190 @@
+import os
+import logging
+
+import numpy as np
+import SimpleITK as sitk
+
+logger = logging.getLogger("volume_loader")
+
+_PIXEL_DTYPES = {
+    sitk.sitkUInt8: np.uint8,
+    sitk.sitkInt8: np.int8,
+    sitk.sitkUInt16: np.uint16,
+    sitk.sitkInt16: np.int16,
+    sitk.sitkUInt32: np.uint32,
+    sitk.sitkInt32: np.int32,
+    sitk.sitkUInt64: np.uint64,
+    sitk.sitkInt64: np.int64,
+    sitk.sitkFloat32: np.float32,
+    sitk.sitkFloat64: np.float64,
+}
+
+
+class _ImageBuffer:
+    """
+    Exposes a SimpleITK image's pixel buffer through __array_interface__.
+
+    np.asarray(_ImageBuffer(image)) is a zero-copy, read-only ndarray whose
+    .base keeps the image alive, unlike a bare GetArrayViewFromImage view.
+    """
+    def __init__(self, image):
+        self._image = image
+        self.__array_interface__ = sitk.GetArrayViewFromImage(image).__array_interface__
+
+
+def array_view(image):
+    """Zero-copy, read-only numpy view that owns a reference to `image`."""
+    return np.asarray(_ImageBuffer(image))
+
+
+def read_image(path):
+    """Read a single file or a DICOM series directory into a SimpleITK image."""
+    if os.path.isdir(path):
+        file_names = sitk.ImageSeriesReader.GetGDCMSeriesFileNames(path)
+        if not file_names:
+            raise ValueError(f"No DICOM series found in {path}")
+        reader = sitk.ImageSeriesReader()
+        reader.SetFileNames(file_names)
+        return reader.Execute()
+    return sitk.ReadImage(path)
+
+
+def _nifti_memmap(path, shape, dtype, reader):
+    """Memory-map an uncompressed, unscaled NIfTI file; None when that is not possible."""
+    if not path.lower().endswith(".nii"):
+        return None
+    try:
+        slope = float(reader.GetMetaData("scl_slope"))
+        inter = float(reader.GetMetaData("scl_inter"))
+        vox_offset = int(float(reader.GetMetaData("vox_offset")))
+    except (RuntimeError, ValueError):
+        return None
+    if slope not in (0.0, 1.0) or inter != 0.0:
+        return None
+    with open(path, "rb") as f:
+        sizeof_hdr = f.read(4)
+    byteorder = "<" if int.from_bytes(sizeof_hdr, "little") in (348, 540) else ">"
+    return np.memmap(path, dtype=np.dtype(dtype).newbyteorder(byteorder), mode="r",
+                     offset=vox_offset, shape=shape)
+
+
+class LazyVolume:
+    """
+    Header-first handle on a DICOM series directory or a single volume file.
+
+    Opening reads only headers (size, spacing, origin, pixel type). Pixel
+    data is read per slice range on demand: uncompressed NIfTI is memory-
+    mapped, series directories read just the files covering the range, and
+    other formats use ImageFileReader's streaming extraction. Slabs come back
+    as zero-copy views, so iter_slabs() keeps memory bounded by the slab
+    size rather than the volume size.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._series_files = None
+        self._memmap = None
+        if os.path.isdir(path):
+            self._series_files = sitk.ImageSeriesReader.GetGDCMSeriesFileNames(path)
+            if not self._series_files:
+                raise ValueError(f"No DICOM series found in {path}")
+            info_path = self._series_files[0]
+        else:
+            info_path = path
+
+        reader = sitk.ImageFileReader()
+        reader.SetFileName(info_path)
+        reader.ReadImageInformation()
+        size = reader.GetSize()
+        self.origin = reader.GetOrigin()
+        self.direction = reader.GetDirection()
+        spacing = reader.GetSpacing()
+        self.components = reader.GetNumberOfComponents()
+        self.dtype = np.dtype(_PIXEL_DTYPES.get(reader.GetPixelID(), np.float32))
+
+        if self._series_files is not None:
+            # Each file is one slice; slice spacing comes from consecutive positions
+            self.shape = (len(self._series_files), size[1], size[0])
+            self.spacing = (spacing[0], spacing[1], self._series_slice_spacing(reader, spacing))
+        else:
+            self.shape = tuple(reversed(size))
+            self.spacing = spacing
+            self._memmap = _nifti_memmap(path, self.shape, self.dtype, reader)
+        if self.components > 1:
+            self.shape = self.shape + (self.components,)
+
+    def _series_slice_spacing(self, first_reader, spacing):
+        if len(self._series_files) < 2:
+            return spacing[2] if len(spacing) > 2 else 1.0
+        second = sitk.ImageFileReader()
+        second.SetFileName(self._series_files[1])
+        second.ReadImageInformation()
+        delta = np.subtract(second.GetOrigin(), first_reader.GetOrigin())
+        return float(np.linalg.norm(delta)) or (spacing[2] if len(spacing) > 2 else 1.0)
+
+    @property
+    def num_slices(self):
+        return self.shape[0]
+
+    @property
+    def is_memory_mapped(self):
+        return self._memmap is not None
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape, dtype=np.int64)) * self.dtype.itemsize
+
+    def __len__(self):
+        return self.num_slices
+
+    def read_slices(self, start, stop):
+        """Slices [start, stop) along axis 0, without materializing the rest of the volume."""
+        start = max(0, start)
+        stop = min(self.num_slices, stop)
+        if stop <= start:
+            return np.empty((0,) + self.shape[1:], dtype=self.dtype)
+        if self._memmap is not None:
+            return self._memmap[start:stop]
+        if self._series_files is not None:
+            reader = sitk.ImageSeriesReader()
+            reader.SetFileNames(self._series_files[start:stop])
+            return array_view(reader.Execute())
+        reader = sitk.ImageFileReader()
+        reader.SetFileName(self.path)
+        ndim = len(self.shape) - (1 if self.components > 1 else 0)
+        if ndim < 3:
+            return array_view(reader.Execute())[start:stop]
+        size = [self.shape[2], self.shape[1], stop - start]
+        reader.SetExtractIndex([0, 0, start])
+        reader.SetExtractSize(size)
+        return array_view(reader.Execute())
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            index = key + self.num_slices if key < 0 else key
+            if not 0 <= index < self.num_slices:
+                raise IndexError(key)
+            return self.read_slices(index, index + 1)[0]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.num_slices)
+            slab = self.read_slices(start, stop) if step > 0 else self.read_slices(stop + 1, start + 1)
+            return slab[::step] if step > 0 else slab[::-1][::-step]
+        raise TypeError("LazyVolume supports integer and slice indexing along axis 0")
+
+    def iter_slabs(self, slab_size=16):
+        """Yield (start, slab) pairs of at most `slab_size` slices."""
+        for start in range(0, self.num_slices, slab_size):
+            yield start, self.read_slices(start, start + slab_size)
+
+    def read(self):
+        """Whole volume; a memory map for uncompressed NIfTI, otherwise one read."""
+        if self._memmap is not None:
+            return self._memmap
+        return array_view(read_image(self.path))
+
+    def to_image(self):
+        """Whole volume as a SimpleITK image (for stages that need geometry)."""
+        return read_image(self.path)
+
+
+def open_volume(path):
+    return LazyVolume(path)
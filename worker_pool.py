@@ -0,0 +1,102 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger("worker_pool")
+
+PIPELINE_EXECUTOR = os.environ.get("PIPELINE_EXECUTOR", "thread")  # 'thread' or 'process'
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", str(os.cpu_count() or 2)))
+PIPELINE_MAX_QUEUE = int(os.environ.get("PIPELINE_MAX_QUEUE", str(PIPELINE_WORKERS * 2)))
+PIPELINE_QUEUE_TIMEOUT_SEC = float(os.environ.get("PIPELINE_QUEUE_TIMEOUT_SEC", "0"))
+
+
+class PoolSaturated(Exception):
+    """Raised when no execution slot frees up within the queue timeout."""
+
+
+def run_pipeline(image_path, patient_history):
+    """Picklable entry point that defers importing the (torch-heavy) solver until first use."""
+    from solver import run_diagnostic_pipeline
+    return run_diagnostic_pipeline(image_path, patient_history)
+
+
+def _warm_worker():
+    # Runs once in each spawned worker process so the first study does not pay model load time
+    from model_registry import registry
+    registry.warm_up()
+
+
+class PipelinePool:
+    """
+    Bounded executor for CPU-bound pipeline runs.
+
+    At most `workers` jobs execute concurrently and at most `max_queue` more
+    wait for a worker. Callers beyond that wait up to `queue_timeout` seconds
+    for a slot and then get PoolSaturated, which the API maps to HTTP 429.
+    """
+    def __init__(self, kind=PIPELINE_EXECUTOR, workers=PIPELINE_WORKERS,
+                 max_queue=PIPELINE_MAX_QUEUE, queue_timeout=PIPELINE_QUEUE_TIMEOUT_SEC):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._executor = None
+        self._slots = None
+        self.in_flight = 0
+        self.rejected = 0
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.kind == "process":
+            # spawn avoids forking a parent that already holds torch/OpenMP threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+            )
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pipeline")
+        self._slots = asyncio.Semaphore(self.capacity)
+        logger.info(f"Started {self.kind} pipeline pool: {self.workers} workers, capacity {self.capacity}")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool, applying admission control first."""
+        self.start()
+        try:
+            if self.queue_timeout > 0:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            elif self._slots.locked():
+                raise asyncio.TimeoutError
+            else:
+                await self._slots.acquire()
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise PoolSaturated(f"Pipeline pool saturated ({self.capacity} studies in flight)")
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.workers),
+            "rejected": self.rejected,
+        }